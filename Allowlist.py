@@ -0,0 +1,119 @@
+def normalize(value):
+    """
+    Reduces a source or type name to the form used for matching.
+
+    Matching ignores case, whitespace, hyphens and underscores, so
+    "Internal Research", "internal-research" and "InternalResearch" are the
+    same name.
+
+    Args:
+        value (str): The name to normalize.
+
+    Returns:
+        str: The normalized name.
+    """
+    return "".join(ch for ch in str(value).casefold() if not ch.isspace() and ch not in "-_")
+
+
+class Allowlist:
+    """
+    A hashed index over a list of allowed names (e.g. valid_sources).
+
+    The index maps every normalized name and alias to its canonical spelling,
+    so a lookup costs the same no matter how long the list is.  The list
+    itself stays a plain list in the configuration; the index is built once
+    and then kept up to date by add(), remove() and add_alias().
+    """
+    def __init__(self, values, aliases=None):
+        """
+        Builds the index.
+
+        Args:
+            values (list): The allowed names, in their canonical spelling.  The
+                list is shared, not copied, so add() and remove() update it.
+            aliases (dict, optional): Maps alternative names to canonical ones,
+                e.g. {"FireEye": "Mandiant"}.  Also shared.
+        """
+        self.values = values
+        self.aliases = aliases if aliases is not None else {}
+        self._exact = set(values)  # Fast path for names spelled canonically
+        self._index = {}
+        for value in values:
+            self._index[normalize(value)] = value
+        for alias, canonical in self.aliases.items():
+            if canonical in self._exact:
+                self._index[normalize(alias)] = canonical
+        self._size = len(values)
+
+    def tracks(self, values, aliases):
+        """
+        Tells whether this index is still current for the given lists.
+
+        The owner's lists may be replaced wholesale (e.g. by load_config or a
+        journal record from another process); in that case the index has to be
+        rebuilt.
+
+        Returns:
+            bool: True if the index reflects values and aliases.
+        """
+        return self.values is values and self.aliases is aliases and self._size == len(values)
+
+    def resolve(self, value):
+        """
+        Looks up a name.
+
+        Args:
+            value (str): The name to check.
+
+        Returns:
+            str: The canonical spelling, or None if the name is not allowed.
+        """
+        if value in self._exact:
+            return value
+        return self._index.get(normalize(value))
+
+    def add(self, value):
+        """Adds a canonical name to the list and the index."""
+        if value not in self._exact:
+            self.values.append(value)
+            self._exact.add(value)
+            self._index[normalize(value)] = value
+            self._size += 1
+
+    def remove(self, value):
+        """Removes a canonical name, and the aliases pointing at it, from the list and the index."""
+        if value in self._exact:
+            self.values.remove(value)
+            self._exact.discard(value)
+            self._size -= 1
+            for key in [key for key, canonical in self._index.items() if canonical == value]:
+                del self._index[key]
+            for alias in [alias for alias, canonical in self.aliases.items() if canonical == value]:
+                del self.aliases[alias]
+
+    def add_alias(self, alias, canonical):
+        """Makes alias resolve to canonical, which must already be allowed."""
+        if canonical in self._exact:
+            self.aliases[alias] = canonical
+            self._index[normalize(alias)] = canonical
+
+    def describe(self, limit=10):
+        """
+        Summarizes the allowed names for prompts and error messages.
+
+        Returns:
+            str: Up to limit names, followed by the total if there are more.
+        """
+        if len(self.values) <= limit:
+            return ", ".join(self.values)
+        return f"{', '.join(self.values[:limit])}, ... ({len(self.values)} in total)"
+
+    def __bool__(self):
+        # An empty allowlist means every name is accepted.
+        return bool(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, value):
+        return self.resolve(value) is not None
@@ -0,0 +1,244 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Coalescer:
+    """
+    Gathers allocation requests made within a short window into one batch call.
+
+    The first request of a window starts a timer; when it fires (or max_batch
+    requests are waiting) everything pending is handed to allocate_batch in an
+    executor, so the event loop never waits on disk and the whole window is
+    persisted with a single journal record.  If the batch call fails, its
+    requests are retried one at a time, so only the request that cannot be
+    allocated gets the error.
+    """
+    def __init__(self, allocate_batch, executor, window=0.002, max_batch=1000):
+        """
+        Args:
+            allocate_batch (callable): Takes a list of requests and returns a
+                list of results in the same order (e.g. generate_report_ids_batch).
+            executor (concurrent.futures.Executor): Runs allocate_batch.
+            window (float, optional): Seconds to wait for more requests after the first.
+            max_batch (int, optional): Flush at once when this many requests are waiting.
+        """
+        self.allocate_batch = allocate_batch
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self.flushes = 0  # Batch calls started so far
+        self._pending = []  # (request, asyncio.Future)
+        self._timer = None
+        self._inflight = set()
+
+    async def submit(self, request):
+        """
+        Queues one request and waits for its result.
+
+        Args:
+            request: A request in the form allocate_batch takes.
+
+        Returns:
+            The result allocate_batch gave for the request.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush, loop)
+        return await future
+
+    def _flush(self, loop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self.flushes += 1
+        task = loop.run_in_executor(self.executor, self._allocate, [request for request, _ in batch])
+        self._inflight.add(task)
+        task.add_done_callback(functools.partial(self._resolve, batch))
+
+    def _allocate(self, requests):
+        """
+        Runs in the executor: allocates a batch, falling back to one call per request if it fails.
+
+        Returns:
+            list: (result, exception) pairs in request order.
+        """
+        try:
+            return [(result, None) for result in self.allocate_batch(requests)]
+        except Exception:
+            if len(requests) == 1:
+                raise
+        # The batch is validated before anything is reserved, so nothing was allocated.
+        outcomes = []
+        for request in requests:
+            try:
+                outcomes.append((self.allocate_batch([request])[0], None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
+
+    def _resolve(self, batch, task):
+        self._inflight.discard(task)
+        error = asyncio.CancelledError() if task.cancelled() else task.exception()
+        outcomes = [(None, error)] * len(batch) if error else task.result()
+        for (_, future), (result, request_error) in zip(batch, outcomes):
+            if future.done():  # The caller was cancelled
+                continue
+            if request_error:
+                future.set_exception(request_error)
+            else:
+                future.set_result(result)
+
+    async def drain(self):
+        """Flushes pending requests now and waits until every batch has been persisted."""
+        self._flush(asyncio.get_running_loop())
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+
+class _AsyncNaming:
+    """Shared plumbing: the executor, blocking calls and shutdown."""
+    def __init__(self, namer, window, max_batch, executor):
+        self.namer = namer
+        self.window = window
+        self.max_batch = max_batch
+        # One worker keeps batches in submission order; the store lock would
+        # serialize them anyway.
+        self._own_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix="naming-io")
+        self._coalescers = {}
+
+    def _coalescer(self, allocate_batch):
+        return Coalescer(allocate_batch, self.executor, self.window, self.max_batch)
+
+    async def _call(self, func, *args, **kwargs):
+        """Runs a blocking method of the wrapped object in the executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def flush(self):
+        """Persists every allocation requested so far."""
+        for coalescer in self._coalescers.values():
+            await coalescer.drain()
+
+    async def aclose(self):
+        """Flushes, then shuts down the executor if it was created here."""
+        await self.flush()
+        if self._own_executor:
+            self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+class AsyncCTINaming(_AsyncNaming):
+    """
+    An asyncio facade for CTINaming.
+
+    Report IDs requested by concurrent tasks within `window` seconds are
+    allocated together with generate_report_ids_batch in a worker thread, so
+    hundreds of tasks can await IDs without blocking the event loop or
+    writing to disk once per ID.
+
+        async with AsyncCTINaming(CTINaming()) as naming:
+            report_id = await naming.generate_report_id("Vendor1", "Threat")
+    """
+    def __init__(self, namer, window=0.002, max_batch=1000, executor=None):
+        """
+        Args:
+            namer (CTINaming): The object to wrap.
+            window (float, optional): Seconds to collect requests before a flush.
+            max_batch (int, optional): Most requests allocated in one flush.
+            executor (concurrent.futures.Executor, optional): Runs the blocking
+                calls.  Defaults to a private single-thread executor.
+        """
+        super().__init__(namer, window, max_batch, executor)
+        self._coalescers["reports"] = self._coalescer(namer.generate_report_ids_batch)
+
+    async def generate_report_id(self, source, report_type, report_date=None, description=None):
+        """
+        Generates a report ID (see CTINaming.generate_report_id).
+
+        Returns:
+            str: The generated report ID, or None on error.
+        """
+        return await self._coalescers["reports"].submit((source, report_type, report_date, description))
+
+    async def generate_report_ids_batch(self, requests):
+        """
+        Generates report IDs for many reports (see CTINaming.generate_report_ids_batch).
+
+        Returns:
+            list: The generated report IDs in request order, with None for rejected requests.
+        """
+        submit = self._coalescers["reports"].submit
+        return list(await asyncio.gather(*(submit(tuple(request)) for request in requests)))
+
+    async def get_report_description(self, report_id):
+        """Retrieves the description for a report ID (see CTINaming.get_report_description)."""
+        return await self._call(self.namer.get_report_description, report_id)
+
+    async def find_reports(self, **filters):
+        """Finds issued report IDs (see CTINaming.find_reports)."""
+        return await self._call(self.namer.find_reports, **filters)
+
+
+class AsyncVTNaming(_AsyncNaming):
+    """
+    An asyncio facade for VTNaming.
+
+    Collection and graph IDs are coalesced per kind in the same way as
+    AsyncCTINaming coalesces report IDs.
+    """
+    def __init__(self, namer, window=0.002, max_batch=1000, executor=None):
+        """
+        Args:
+            namer (VTNaming): The object to wrap.
+            window (float, optional): Seconds to collect requests before a flush.
+            max_batch (int, optional): Most requests allocated in one flush.
+            executor (concurrent.futures.Executor, optional): Runs the blocking
+                calls.  Defaults to a private single-thread executor.
+        """
+        super().__init__(namer, window, max_batch, executor)
+        self._coalescers["collections"] = self._coalescer(namer.generate_collection_ids_batch)
+        self._coalescers["graphs"] = self._coalescer(namer.generate_graph_ids_batch)
+
+    async def generate_collection_id(self, source, collection_date=None, description=None):
+        """
+        Generates a collection ID (see VTNaming.generate_collection_id).
+
+        Returns:
+            str: The generated collection ID, or None on error.
+        """
+        return await self._coalescers["collections"].submit((source, collection_date, description))
+
+    async def generate_graph_id(self, source, graph_date=None):
+        """
+        Generates a graph ID (see VTNaming.generate_graph_id).
+
+        Returns:
+            str: The generated graph ID, or None on error.
+        """
+        return await self._coalescers["graphs"].submit((source, graph_date))
+
+    async def get_collection_description(self, collection_id):
+        """Retrieves the description for a collection ID (see VTNaming.get_collection_description)."""
+        return await self._call(self.namer.get_collection_description, collection_id)
+
+    async def find_collections(self, **filters):
+        """Finds issued collection IDs (see VTNaming.find_collections)."""
+        return await self._call(self.namer.find_collections, **filters)
+
+    async def find_graphs(self, **filters):
+        """Finds issued graph IDs (see VTNaming.find_graphs)."""
+        return await self._call(self.namer.find_graphs, **filters)
@@ -0,0 +1,80 @@
+import csv
+import datetime
+import json
+
+
+def parse_date(value):
+    """
+    Converts a YYYYMMDD string from batch input into a date.
+
+    Args:
+        value (str): The date string.  Empty values mean "today".
+
+    Returns:
+        datetime.date: The parsed date, None for an empty value, or the
+            original value if it cannot be parsed (so that the naming class
+            rejects the request with its usual error).
+    """
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(str(value), "%Y%m%d").date()
+    except ValueError:
+        return value
+
+
+def read_requests(stream, fields, fmt="csv", chunk_size=1000):
+    """
+    Reads ID requests from a CSV or JSONL stream in chunks.
+
+    CSV rows are read positionally in the order of fields; a first row that
+    repeats the field names is treated as a header and skipped.  JSONL lines
+    are objects keyed by the field names.  Lines that cannot be parsed are
+    passed through as empty requests so they are rejected in order.
+
+    Args:
+        stream (file): The input stream.
+        fields (list): The request field names, e.g. ["source", "date"].
+        fmt (str, optional): "csv" or "jsonl".
+        chunk_size (int, optional): Number of requests per chunk.
+
+    Yields:
+        list: Up to chunk_size request dicts.
+    """
+    if fmt == "jsonl":
+        rows = (_parse_json_line(line) for line in stream if line.strip())
+    else:
+        rows = (dict(zip(fields, row)) for row in csv.reader(stream) if row and row != fields)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parse_json_line(line):
+    try:
+        row = json.loads(line)
+    except ValueError:
+        return {}
+    return row if isinstance(row, dict) else {}
+
+
+def write_results(stream, rows, fields, fmt="csv"):
+    """
+    Writes answered requests to a CSV or JSONL stream.
+
+    Args:
+        stream (file): The output stream.
+        rows (list): Request dicts with the assigned "id" filled in.
+        fields (list): The request field names; "id" is written after them.
+        fmt (str, optional): "csv" or "jsonl".
+    """
+    if fmt == "jsonl":
+        stream.writelines(json.dumps(row) + "\n" for row in rows)
+    else:
+        writer = csv.writer(stream, lineterminator="\n")
+        writer.writerows([row.get(field) or "" for field in fields] + [row.get("id") or ""] for row in rows)
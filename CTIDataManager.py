@@ -1,69 +1,187 @@
+import argparse
+import contextlib
 import datetime
-import os
-import json  # Import the json module
+import sys
+from collections import ChainMap
+import BatchIO
+import CounterRetention
+import Exporter
+import Importer
+import Metrics
+import NamingScheme
+import Paging
+from Allowlist import Allowlist
+from IDIndex import IDIndex, date_key
+from IDMembership import IDMembership
+from SQLiteStore import migrate_from_json
+from StorageBackend import CorruptStateError, open_store
+from TextIndex import TextIndex
+from WriteBehind import DebouncedFlusher, SettingsTracker
 
 class CTINaming:
     """
     A class to generate CTI report names and numbers according to a defined scheme.
     """
-    def __init__(self):
+    METRICS_TOOL = "cti"  # "tool" label of the metrics (see Metrics)
+    # Allowlist fields and the alias maps that go with them
+    ALLOWLIST_ALIASES = {"valid_sources": "source_aliases", "valid_report_types": "report_type_aliases"}
+    # Shape of the state kept by the storage backend (see StorageBackend)
+    STATE_FIELDS = {
+        "report_counts": "counter",
+        "generated_report_ids": "list",
+        "report_descriptions": "map",
+        "archived_report_counts": "map",
+        "artifact_counts": "counter",  # IDs of the custom kinds in id_schemes, e.g. YARA rules
+        "generated_artifact_ids": "list",
+        "artifact_descriptions": "map",
+        "archived_artifact_counts": "map",
+    }
+    # Settings written by save_config(), as opposed to state journaled on every allocation
+    SETTINGS_FIELDS = ("base_filename", "valid_sources", "valid_report_types", "source_aliases", "report_type_aliases",
+                       "counter_retention_days", "counter_archive", "bloom_filter_threshold", "id_schemes")
+
+    def __init__(self, config_file="cti_naming_config.json"):
         """
         Initializes the CTINaming class.
+
+        Args:
+            config_file (str, optional): Path of the configuration file.  Several
+                processes may share the same file.  A path ending in .db or
+                .sqlite selects the SQLite backend.
         """
+        self._settings = SettingsTracker(self, self.SETTINGS_FIELDS)
         self.report_counts = {}
         self.generated_report_ids = []
         self.report_descriptions = {}
-        self.config_file = "cti_naming_config.json"  # Configuration file name
+        self.archived_report_counts = {}  # Counters of closed days (see retire_counters)
+        self.artifact_counts = {}
+        self.generated_artifact_ids = []
+        self.artifact_descriptions = {}
+        self.archived_artifact_counts = {}
+        self.export_watermarks = {}  # Export name and filters -> number of IDs already exported
+        self._allowlists = {}  # Lookup indexes built from the valid_* lists
+        self._schemes = None  # Compiled from id_schemes on first use
+        self._report_index = None  # Opened on the first search
+        self._report_membership = None  # Opened on the first allocation
+        self._text_index = None  # Opened on the first description search
+        self._artifact_index = None
+        self._artifact_membership = None
+        self.config_file = config_file  # Configuration file name
+        self.store = open_store(self, self.config_file)
+        Metrics.REGISTRY.track(self)
         self.load_config()  # Load configuration at initialization
+        self.retire_counters()
 
+    @Metrics.timed("load")
     def load_config(self):
-        """Loads configuration from a JSON file."""
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, "r") as f:
-                    config = json.load(f)
-                    # Load settings, providing defaults if they are not in the config file
-                    self.report_counts = config.get("report_counts", {})
-                    self.generated_report_ids = config.get("generated_report_ids", [])
-                    self.report_descriptions = config.get("report_descriptions", {})
-                    self.base_filename = config.get("base_filename", "report_ids.txt")  # Default filename
-                    self.valid_sources = config.get("valid_sources", [])  # Load valid sources
-                    self.valid_report_types = config.get("valid_report_types", [])  # Load valid types
-                    print("Configuration loaded from", self.config_file)
-            except json.JSONDecodeError:
-                print("Error: Invalid JSON in configuration file.  Using default settings.")
-                self.report_counts = {}
-                self.generated_report_ids = []
-                self.report_descriptions = {}
-                self.base_filename = "report_ids.txt"
-                self.valid_sources = []
-                self.valid_report_types = []
+        """Loads configuration from the storage backend (see StorageBackend.open_store)."""
+        with self._settings.reloading():  # Settings changed here but not yet saved are kept
+            self._load_config()
+
+    def _load_config(self):
+        try:
+            config = self.store.load()
+        except CorruptStateError as e:
+            # Falling back to empty counters here would re-issue IDs that are already in use.
+            print(f"Error: Cannot load {self.config_file}: {e}")
+            raise
+        if config is not None:
+            # Load settings, providing defaults if they are not in the config file
+            self.report_counts = config.get("report_counts", {})
+            self.generated_report_ids = config.get("generated_report_ids", [])
+            self.report_descriptions = config.get("report_descriptions", {})
+            self.archived_report_counts = config.get("archived_report_counts", {})
+            self.artifact_counts = config.get("artifact_counts", {})
+            self.generated_artifact_ids = config.get("generated_artifact_ids", [])
+            self.artifact_descriptions = config.get("artifact_descriptions", {})
+            self.archived_artifact_counts = config.get("archived_artifact_counts", {})
+            self.base_filename = config.get("base_filename", "report_ids.txt")  # Default filename
+            self.valid_sources = config.get("valid_sources", [])  # Load valid sources
+            self.valid_report_types = config.get("valid_report_types", [])  # Load valid types
+            self.source_aliases = config.get("source_aliases", {})  # Alternative spellings of sources
+            self.report_type_aliases = config.get("report_type_aliases", {})
+            self.export_watermarks = config.get("export_watermarks", {})
+            self.counter_retention_days = config.get("counter_retention_days")  # None keeps every counter hot
+            self.counter_archive = config.get("counter_archive", True)
+            self.bloom_filter_threshold = config.get("bloom_filter_threshold", 100000)
+            self.id_schemes = config.get("id_schemes", {})  # Kind -> ID template (see NamingScheme)
+            self.store.compact_threshold = config.get("journal_compact_threshold", self.store.compact_threshold)
+            print("Configuration loaded from", self.config_file)
         else:
             print("Configuration file not found. Using default settings.")
             self.base_filename = "report_ids.txt"  # Default filename
             self.valid_sources = []  # Default to empty list if not in config
             self.valid_report_types = []
+            self.source_aliases = {}
+            self.report_type_aliases = {}
+            self.export_watermarks = {}
+            self.counter_retention_days = None
+            self.counter_archive = True
+            self.bloom_filter_threshold = 100000
+            self.id_schemes = {}
 
-    def save_config(self):
-        """Saves configuration to a JSON file."""
-        config = {
-            "report_counts": self.report_counts,
-            "generated_report_ids": self.generated_report_ids,
-            "report_descriptions": self.report_descriptions,
+    def _config_snapshot(self):
+        """Returns a copy of the full configuration for the store to write as a snapshot."""
+        return {
+            "report_counts": dict(self.report_counts),
+            "generated_report_ids": self.generated_report_ids.copy(),
+            "report_descriptions": self.report_descriptions.copy(),
+            "archived_report_counts": self.archived_report_counts.copy(),
+            "artifact_counts": dict(self.artifact_counts),
+            "generated_artifact_ids": self.generated_artifact_ids.copy(),
+            "artifact_descriptions": self.artifact_descriptions.copy(),
+            "archived_artifact_counts": self.archived_artifact_counts.copy(),
             "base_filename": self.base_filename,
-            "valid_sources": self.valid_sources,  # Save valid sources
-            "valid_report_types": self.valid_report_types,  # Save valid report types
+            "valid_sources": list(self.valid_sources),  # Save valid sources
+            "valid_report_types": list(self.valid_report_types),  # Save valid report types
+            "source_aliases": dict(self.source_aliases),
+            "report_type_aliases": dict(self.report_type_aliases),
+            "export_watermarks": dict(self.export_watermarks),
+            "counter_retention_days": self.counter_retention_days,
+            "counter_archive": self.counter_archive,
+            "bloom_filter_threshold": self.bloom_filter_threshold,
+            "id_schemes": dict(self.id_schemes),
+            "journal_compact_threshold": self.store.compact_threshold,
         }
+
+    @Metrics.timed("save")
+    def save_config(self, quiet=False):
+        """
+        Saves the settings that changed since they were last loaded or saved.
+
+        Allocations are journaled as they happen, so only changed settings are
+        written here, and nothing at all if none changed.
+
+        Args:
+            quiet (bool, optional): Do not print a message after saving.
+
+        Returns:
+            bool: True if anything was written.
+        """
+        dirty = self._settings.dirty()
+        if not dirty:
+            return False
         try:
-            with open(self.config_file, "w") as f:
-                json.dump(config, f, indent=4)
-            print("Configuration saved to", self.config_file)
+            self.store.commit([["set", field, getattr(self, field)] for field in dirty])
         except Exception as e:
             print(f"Error saving configuration: {e}")
+            return False
+        self._settings.mark_clean(*dirty)
+        if not quiet:
+            print("Configuration saved to", self.config_file)
+        return True
 
+    def dirty_settings(self):
+        """
+        Returns:
+            list: Names of the settings changed since they were last loaded or saved.
+        """
+        return self._settings.dirty()
+
+    @Metrics.timed("allocate", "reports")
     def generate_report_id(self, source, report_type, report_date=None, description=None):
         """
-        Generates a unique report ID based on the naming convention.
+        Generates a unique report ID based on the naming scheme (see scheme()).
 
         Args:
             source (str): The source of the CTI data.
@@ -74,45 +192,209 @@ class CTINaming:
         Returns:
             str: The generated report ID, or None on error.
         """
+        request = self._validate_report_request(source, report_type, report_date)
+        if request is None:
+            return None
+        # Reserve the number and journal it atomically, as one durable record
+        return NamingScheme.allocate(self, "reports", [(request, description)])[0]
+
+    @Metrics.timed("allocate", "reports")
+    def generate_report_ids_batch(self, requests):
+        """
+        Generates report IDs for many reports at once.
+
+        All requests are validated first, a contiguous block of numbers is then
+        reserved for each source/type/date key, and the whole batch is written
+        to the journal as a single record.
+
+        Args:
+            requests (iterable): (source, report_type, report_date, description)
+                tuples, with the same meaning as the arguments of generate_report_id.
+
+        Returns:
+            list: The generated report IDs in request order, with None in place of
+                requests that failed validation.
+        """
+        return NamingScheme.allocate(self, "reports", [
+            (self._validate_report_request(source, report_type, report_date), description)
+            for source, report_type, report_date, description in requests
+        ])
+
+    @Metrics.timed("validate", "reports")
+    def _validate_report_request(self, source, report_type, report_date):
+        """
+        Validates the arguments of a report ID request.
+
+        Args:
+            source (str): The source of the CTI data.
+            report_type (str): The type of report.
+            report_date (datetime.date): The date of the report, or None for today.
+
+        Returns:
+            dict: The canonical source and report type, and the report date in
+                %Y%m%d format, or None if the request is invalid.
+        """
         if report_date is None:
             report_date = datetime.date.today()
         if not isinstance(report_date, datetime.date):
             print("Error: report_date must be a datetime.date object.")
             return None
 
-        if self.valid_sources and source not in self.valid_sources:
-            print(f"Error: Invalid report source '{source}'.  Valid sources are: {self.valid_sources}")
+        if not source or not report_type:
+            print("Error: report source and report type are required.")
             return None
+        for name, value in (("source", source), ("type", report_type)):
+            if not isinstance(value, str):
+                print(f"Error: Invalid report {name} '{value}': values must be strings.")
+                return None
 
-        if self.valid_report_types and report_type not in self.valid_report_types:
-            print(f"Error: Invalid report type '{report_type}'.  Valid report types are: {self.valid_report_types}")
-            return None
-        date_str = report_date.strftime("%Y%m%d")
-        report_number = self._get_next_report_number(source, report_type, date_str)
-        report_id = f"{source}-{report_type}-{date_str}-{report_number:02d}"
-        self.generated_report_ids.append(report_id)
-        if description:
-            self.report_descriptions[report_id] = description
-        return report_id
+        sources = self.get_allowlist("valid_sources")
+        if sources:
+            canonical = sources.resolve(source)
+            if canonical is None:
+                print(f"Error: Invalid report source '{source}'.  Valid sources are: {sources.describe()}")
+                return None
+            source = canonical
+
+        report_types = self.get_allowlist("valid_report_types")
+        if report_types:
+            canonical = report_types.resolve(report_type)
+            if canonical is None:
+                print(f"Error: Invalid report type '{report_type}'.  Valid report types are: {report_types.describe()}")
+                return None
+            report_type = canonical
+        for name, value in (("source", source), ("type", report_type)):
+            reason = NamingScheme.invalid_value(value)
+            if reason:
+                print(f"Error: Invalid report {name} '{value}': {reason}.")
+                return None
+        return {"source": source, "report_type": report_type, "date": report_date.strftime("%Y%m%d")}
 
-    def _get_next_report_number(self, source, report_type, date_str):
+    def get_allowlist(self, field):
         """
-        Determines the next sequential report number for a given source, type, and date.
+        Returns the lookup index for an allowlist, rebuilding it if the list was replaced.
 
         Args:
-            source (str): The source of the CTI data.
-            report_type (str): The type of report.
-            date_str (str): The date of the report in %Y%m%d format.
+            field (str): "valid_sources" or "valid_report_types".
 
         Returns:
-            int: The next report number.
+            Allowlist: The index.
         """
-        key = f"{source}|{report_type}|{date_str}"  # Changed to string
-        if key not in self.report_counts:
-            self.report_counts[key] = 1
-        else:
-            self.report_counts[key] += 1
-        return self.report_counts[key]
+        values = getattr(self, field)
+        aliases = getattr(self, self.ALLOWLIST_ALIASES[field])
+        allowlist = self._allowlists.get(field)
+        if allowlist is None or not allowlist.tracks(values, aliases):
+            allowlist = self._allowlists[field] = Allowlist(values, aliases)
+        return allowlist
+
+    def update_allowlist(self, field, add=(), remove=(), aliases=None):
+        """
+        Changes an allowlist in place, e.g. after syncing sources from MISP.
+
+        Only the affected index entries are touched, and the new list is
+        journaled so other processes pick it up.
+
+        Args:
+            field (str): "valid_sources" or "valid_report_types".
+            add (iterable, optional): Names to allow.
+            remove (iterable, optional): Names to disallow.
+            aliases (dict, optional): Alternative spellings to add, mapped to
+                their canonical names.
+        """
+        aliases_field = self.ALLOWLIST_ALIASES[field]
+        with self.store.transaction():
+            allowlist = self.get_allowlist(field)
+            for value in add:
+                allowlist.add(value)
+            for value in remove:
+                allowlist.remove(value)
+            for alias, canonical in (aliases or {}).items():
+                allowlist.add_alias(alias, canonical)
+            self.store.commit([["set", field, allowlist.values], ["set", aliases_field, allowlist.aliases]])
+            self._settings.mark_clean(field, aliases_field)
+
+    def retire_counters(self, today=None):
+        """
+        Moves the counters of closed days out of report_counts and artifact_counts.
+
+        Only days within counter_retention_days of today keep a counter in
+        the hot dict; older ones are moved to archived_report_counts and
+        archived_artifact_counts (or, with
+        counter_archive set to false, dropped, since the issued IDs still
+        record them).  Allocating a back-dated ID for a retired day continues
+        after its last number, so IDs stay unique.  Does nothing unless
+        counter_retention_days is set.
+
+        Args:
+            today (datetime.date, optional): Defaults to the current date.
+
+        Returns:
+            int: The number of counters retired.
+        """
+        if self.counter_retention_days is None:
+            return 0
+        cutoff = CounterRetention.retention_cutoff(self.counter_retention_days, today)
+        with self.store.transaction():
+            ops = []
+            for field in ("report_counts", "artifact_counts"):
+                archive = getattr(self, "archived_" + field) if self.counter_archive else None
+                ops += CounterRetention.retirement_ops(getattr(self, field), field, archive, "archived_" + field,
+                                                       cutoff)
+            if ops:
+                self.store.commit(ops)
+        return sum(op[0] == "delete" for op in ops)
+
+    def known_report_keys(self):
+        """Returns the "source|type|date" keys of the hot and archived counters, for telling apart ID fields."""
+        return ChainMap(self.report_counts, self.archived_report_counts)
+
+    def known_artifact_keys(self):
+        """Returns the "kind|...|date" keys of the hot and archived artifact counters."""
+        return ChainMap(self.artifact_counts, self.archived_artifact_counts)
+
+    def schemes(self):
+        """
+        Returns the compiled ID schemes, recompiling them if id_schemes changed.
+
+        The "reports" entry of id_schemes overrides the report template (e.g.
+        "{source}-{report_type}-{date}-{number:04}" for four-digit numbers);
+        every other entry defines a custom kind such as
+        "yara": "YARA-{author}-{date}-{number:03}" (see NamingScheme.SchemeSet).
+
+        Returns:
+            NamingScheme.SchemeSet: The schemes.
+        """
+        if self._schemes is None or not self._schemes.tracks(self.id_schemes):
+            self._schemes = NamingScheme.SchemeSet(self.id_schemes, ("reports",), custom=True)
+        return self._schemes
+
+    def scheme(self, kind="reports"):
+        """
+        Returns the compiled ID scheme of a kind.
+
+        Args:
+            kind (str, optional): "reports" or a custom kind from id_schemes.
+
+        Returns:
+            NamingScheme.Scheme: The scheme.
+        """
+        return self.schemes()[kind]
+
+    def target(self, kind="reports"):
+        """
+        Returns where the IDs of a kind are kept, for NamingScheme.allocate and Importer.import_ids.
+
+        Args:
+            kind (str, optional): "reports" or a custom kind; all custom kinds share the artifact fields.
+
+        Returns:
+            NamingScheme.Target: The state fields, membership check and search of the kind.
+        """
+        if kind == "reports":
+            return NamingScheme.Target("report_counts", "generated_report_ids", "report_descriptions",
+                                       "archived_report_counts", self.report_membership, self.find_reports)
+        return NamingScheme.Target("artifact_counts", "generated_artifact_ids", "artifact_descriptions",
+                                   "archived_artifact_counts", self.artifact_membership, self.find_artifacts)
 
     def save_report_ids(self, filename=None):
         """
@@ -129,17 +411,123 @@ class CTINaming:
             print("No report IDs to save.")
             return False
 
+        if self.export_reports(filename) is None:
+            return False
+        print(f"Report IDs and descriptions saved to {filename}")
+        return True
+
+    @Metrics.timed("export")
+    def export_reports(self, filename=None, fmt="txt", source=None, report_type=None, date_from=None, date_to=None,
+                       since=None, chunk_size=1000):
+        """
+        Streams issued report IDs and their descriptions to a file.
+
+        IDs are read and written chunk_size at a time, so neither the full
+        list nor the output is held in memory.
+
+        Args:
+            filename (str, optional): The file to write, "-" for stdout, or an
+                open text stream.
+                Defaults to the configured base filename.
+            fmt (str, optional): "txt", "csv", "jsonl" or "stix" (a STIX 2.1
+                bundle of report objects).
+            source, report_type, date_from, date_to: Optional filters, as for
+                find_reports().
+            since (str, optional): Name of an export watermark, e.g. "tip".
+                Only IDs issued after the last successful export with the same
+                name and filters are written, and the watermark is advanced
+                afterwards (see Exporter.watermark_key).
+            chunk_size (int, optional): Number of IDs formatted per write.
+
+        Returns:
+            int: The number of IDs exported, or None on error.
+        """
+        if filename is None:
+            filename = self.base_filename
+        filters = {}
+        if source:
+            filters["source"] = self.get_allowlist("valid_sources").resolve(source) or source
+        if report_type:
+            filters["report_type"] = self.get_allowlist("valid_report_types").resolve(report_type) or report_type
+        mark = Exporter.watermark_key(since, filters, date_key(date_from), date_key(date_to)) if since else None
+        with self.store.transaction():  # Catch up with other processes
+            start = self.export_watermarks.get(mark, 0) if since else 0
+            stop = len(self.generated_report_ids)
+        scheme = self.scheme()
+        records = Exporter.select(
+            self.generated_report_ids,
+            lambda report_id: scheme.parse(report_id, self.known_report_keys()),
+            scheme.key_fields,
+            filters, date_key(date_from), date_key(date_to), start, stop,
+        )
         try:
-            with open(filename, "w") as f:
-                for report_id in self.generated_report_ids:
-                    description = self.report_descriptions.get(report_id, "")
-                    f.write(f"{report_id}: {description}\n")
-            print(f"Report IDs and descriptions saved to {filename}")
-            self.save_config()
-            return True
-        except Exception as e:
+            with Exporter.open_output(filename) as f:
+                exporter = Exporter.Exporter(f, fmt, scheme.key_fields, chunk_size)
+                exporter.write(dict(record, description=self.report_descriptions.get(record["id"], ""))
+                               for record in records)
+                exporter.close()
+        except (OSError, ValueError) as e:
             print(f"Error saving report IDs: {e}")
-            return False
+            return None
+        if since:
+            self.store.commit([["put", "export_watermarks", mark, stop]])
+        return exporter.count
+
+    @Metrics.timed("import")
+    def import_reports(self, filename, fmt=None, id_column="id", description_column="description", workers=None,
+                       chunk_size=10000, rejects_file=None):
+        """
+        Imports report IDs issued elsewhere and raises report_counts to match.
+
+        Reads the "ID: description" files written by save_report_ids, or CSV
+        and JSONL exports, validates every ID against the report scheme
+        (source-type-YYYYMMDD-NN by default) and the custom schemes, and adds
+        the ones not issued yet (see Importer.import_ids).
+
+        Args:
+            filename (str): The file to import, or "-" for stdin.
+            fmt (str, optional): "txt", "csv" or "jsonl".  Guessed from the
+                file name by default.
+            id_column (str, optional): CSV column or JSON key holding the ID.
+            description_column (str, optional): CSV column or JSON key holding
+                the description.
+            workers (int, optional): Parser processes; by default a process
+                pool is used for large files only.
+            chunk_size (int, optional): IDs committed per journal record.
+            rejects_file (str, optional): File to list every rejected line in.
+
+        Returns:
+            dict: Import statistics, or None on error.
+        """
+        schemes = self.schemes()
+        kinds = schemes.custom + ["reports"]  # Custom schemes start with literal text; try them first
+        targets = {kind: self.target(kind) for kind in kinds}
+        return Importer.import_ids(self, filename, schemes.grammar(kinds), targets, fmt, id_column,
+                                   description_column, workers, chunk_size, rejects_file, self._import_key)
+
+    def _import_key(self, kind, issued_id):
+        """
+        Finds the counter key of an imported ID whose fields contain hyphens.
+
+        A split matching an existing counter wins; otherwise, for reports, the
+        split with the longest configured source.
+
+        Returns:
+            str: The counter key, or None to split at the first hyphen.
+        """
+        scheme = self.scheme(kind)
+        known = self.known_report_keys() if kind == "reports" else self.known_artifact_keys()
+        splits = scheme.splits(issued_id)
+        for parsed in splits:
+            if scheme.key_of(parsed) in known:
+                return scheme.key_of(parsed)
+        if kind == "reports":
+            source = scheme.key_fields.index("source")
+            sources = set(self.valid_sources)
+            splits = [parsed for parsed in splits if parsed[source] in sources]
+            if splits:
+                return scheme.key_of(max(splits, key=lambda parsed: len(parsed[source])))
+        return None
 
     def get_report_description(self, report_id):
         """
@@ -153,22 +541,459 @@ class CTINaming:
         """
         return self.report_descriptions.get(report_id)
 
-    def display_all_reports(self):
-        """Displays all generated report IDs and their descriptions."""
+    def report_index(self):
+        """
+        Returns the search index over generated_report_ids, opening it on first use.
+
+        The index is persisted next to the configuration file and catches up
+        with newly issued IDs on every query.
+
+        Returns:
+            IDIndex: The report index.
+        """
+        if self._report_index is None or not self._report_index.tracks(self.generated_report_ids):
+            scheme = self.scheme()
+            self._report_index = IDIndex.open(
+                self.generated_report_ids,
+                scheme.key_fields,
+                lambda report_id: scheme.parse(report_id, self.known_report_keys()),
+                self.config_file + ".index",
+            )
+        return self._report_index
+
+    def text_index(self):
+        """
+        Returns the full-text index over report_descriptions, opening it on first use.
+
+        Like report_index, it is persisted next to the configuration file and
+        catches up with newly issued reports on every search.
+
+        Returns:
+            TextIndex: The description index.
+        """
+        if self._text_index is None or not self._text_index.tracks(self.generated_report_ids, self.report_descriptions):
+            self._text_index = TextIndex.open(self.generated_report_ids, self.report_descriptions,
+                                              self.config_file + ".text")
+        return self._text_index
+
+    def report_membership(self):
+        """
+        Returns the membership check over generated_report_ids, opening it on first use.
+
+        Histories of at least bloom_filter_threshold IDs are checked through a
+        Bloom filter persisted next to the configuration file.
+
+        Returns:
+            IDMembership: The report membership.
+        """
+        if self._report_membership is None or not self._report_membership.tracks(self.generated_report_ids):
+            self._report_membership = IDMembership.open(
+                self.generated_report_ids, self.config_file + ".bloom", self.bloom_filter_threshold
+            )
+        return self._report_membership
+
+    def artifact_index(self):
+        """
+        Returns the search index over generated_artifact_ids, by kind and date, opening it on first use.
+
+        Returns:
+            IDIndex: The artifact index.
+        """
+        if self._artifact_index is None or not self._artifact_index.tracks(self.generated_artifact_ids):
+            schemes = [self.scheme(kind) for kind in self.schemes().custom]
+
+            def parse(artifact_id):
+                for scheme in schemes:
+                    parsed = scheme.parse(artifact_id)
+                    if parsed is not None:
+                        return scheme.kind, parsed[-2]
+                return None
+
+            self._artifact_index = IDIndex.open(self.generated_artifact_ids, ("kind", "date"), parse,
+                                                self.config_file + ".artifacts.index")
+        return self._artifact_index
+
+    def artifact_membership(self):
+        """
+        Returns the membership check over generated_artifact_ids, opening it on first use.
+
+        Returns:
+            IDMembership: The artifact membership.
+        """
+        if self._artifact_membership is None or not self._artifact_membership.tracks(self.generated_artifact_ids):
+            self._artifact_membership = IDMembership.open(
+                self.generated_artifact_ids, self.config_file + ".artifacts.bloom", self.bloom_filter_threshold
+            )
+        return self._artifact_membership
+
+    @Metrics.timed("allocate", "artifacts")
+    def generate_artifact_id(self, kind, fields, artifact_date=None, description=None):
+        """
+        Generates an ID of a custom kind, e.g. a YARA rule, from its scheme in id_schemes.
+
+        Args:
+            kind (str): The custom kind, e.g. "yara".
+            fields (dict): Values of the scheme's fields other than date and
+                number, e.g. {"author": "jdoe"}.
+            artifact_date (datetime.date, optional): Defaults to today.
+            description (str, optional): A description of the artifact.
+
+        Returns:
+            str: The generated ID, or None on error.
+        """
+        request = self._validate_artifact_request(kind, fields, artifact_date)
+        if request is None:
+            return None
+        return NamingScheme.allocate(self, kind, [(request, description)])[0]
+
+    @Metrics.timed("allocate", "artifacts")
+    def generate_artifact_ids_batch(self, kind, requests):
+        """
+        Generates IDs of one custom kind for many artifacts at once, like generate_report_ids_batch.
+
+        Args:
+            kind (str): The custom kind.
+            requests (iterable): (fields, artifact_date, description) tuples,
+                with the same meaning as the arguments of generate_artifact_id.
+
+        Returns:
+            list: The generated IDs in request order, with None in place of
+                requests that failed validation.
+        """
+        return NamingScheme.allocate(self, kind, [
+            (self._validate_artifact_request(kind, fields, artifact_date), description)
+            for fields, artifact_date, description in requests
+        ])
+
+    @Metrics.timed("validate", "artifacts")
+    def _validate_artifact_request(self, kind, fields, artifact_date):
+        """
+        Validates the arguments of a custom ID request.
+
+        Returns:
+            dict: The field values with the date in %Y%m%d format, or None if
+                the request is invalid.
+        """
+        if kind not in self.schemes().custom:
+            print(f"Error: Unknown ID kind '{kind}'.  Kinds configured in id_schemes: "
+                  f"{', '.join(self.schemes().custom) or 'none'}")
+            return None
+        if artifact_date is None:
+            artifact_date = datetime.date.today()
+        if not isinstance(artifact_date, datetime.date):
+            print("Error: artifact_date must be a datetime.date object.")
+            return None
+        request = {}
+        for name in self.scheme(kind).fields:
+            value = str((fields or {}).get(name) or "").strip()
+            if not value:
+                print(f"Error: {kind} IDs need a value for {name}.")
+                return None
+            reason = NamingScheme.invalid_value(value)
+            if reason:
+                print(f"Error: Invalid {name} '{value}': {reason}.")
+                return None
+            request[name] = value
+        request["date"] = artifact_date.strftime("%Y%m%d")
+        return request
+
+    def find_artifacts(self, kind=None, date_from=None, date_to=None, prefix=None, limit=None):
+        """
+        Finds issued IDs of the custom kinds by kind, date range and/or ID prefix.
+
+        Args:
+            kind (str, optional): Only IDs of this kind.
+            date_from, date_to, prefix, limit: As for find_reports().
+
+        Returns:
+            list: The matching IDs, in the order they were issued.
+        """
+        filters = {"kind": kind} if kind else {}
+        with self.store.transaction():
+            return self.artifact_index().query(filters, date_key(date_from), date_key(date_to), prefix, limit)
+
+    def metrics_gauges(self):
+        """
+        Returns the current size of the state, for Metrics.Registry.render.
+
+        Returns:
+            list: (metric name, labels, value) tuples.
+        """
+        labels = {"tool": self.METRICS_TOOL, "config": self.config_file}
+        gauges = []
+        for kind, ids, counts, archived in (
+            ("reports", self.generated_report_ids, self.report_counts, self.archived_report_counts),
+            ("artifacts", self.generated_artifact_ids, self.artifact_counts, self.archived_artifact_counts),
+        ):
+            gauges.append(("naming_issued_ids", dict(labels, kind=kind), len(ids)))
+            gauges.append(("naming_counter_keys", dict(labels, kind=kind), len(counts)))
+            gauges.append(("naming_archived_counter_keys", dict(labels, kind=kind), len(archived)))
+        gauges.append(("naming_config_bytes", labels, Metrics.file_bytes(self.config_file)))
+        return gauges
+
+    def find_reports(self, source=None, report_type=None, date_from=None, date_to=None, prefix=None, limit=None):
+        """
+        Finds issued report IDs by source, type, date range and/or ID prefix.
+
+        Args:
+            source (str, optional): Only reports from this source.
+            report_type (str, optional): Only reports of this type.
+            date_from (datetime.date or str, optional): First report date to
+                include.  Strings may be shortened, e.g. "202503" for 1 March 2025.
+            date_to (datetime.date or str, optional): Last report date to include.
+                Strings may be shortened, e.g. "202503" for 31 March 2025.
+            prefix (str, optional): Only IDs starting with this string, e.g.
+                "VendorA-Activity-2025".
+            limit (int, optional): Return at most this many IDs.
+
+        Returns:
+            list: The matching report IDs, in the order they were issued.
+        """
+        with self.store.transaction():
+            return self.report_index().query(self._report_filters(source, report_type), date_key(date_from),
+                                             date_key(date_to), prefix, limit)
+
+    def iter_reports(self, source=None, report_type=None, date_from=None, date_to=None, prefix=None,
+                     newest_first=True):
+        """
+        Finds issued report IDs like find_reports, but yields them one at a time.
+
+        Only the IDs actually consumed are read, so the first page of a large
+        history is shown without going through the rest.
+
+        Args:
+            source, report_type, date_from, date_to, prefix: See find_reports.
+            newest_first (bool, optional): Yield the most recently issued reports first.
+
+        Returns:
+            iterator: The matching report IDs.
+        """
+        with self.store.transaction():
+            return self.report_index().iter_query(self._report_filters(source, report_type), date_key(date_from),
+                                                  date_key(date_to), prefix, newest_first)
+
+    def _report_filters(self, source, report_type):
+        filters = {}
+        if source:
+            filters["source"] = self.get_allowlist("valid_sources").resolve(source) or source
+        if report_type:
+            filters["report_type"] = self.get_allowlist("valid_report_types").resolve(report_type) or report_type
+        return filters
+
+    def report_summary(self, source=None, report_type=None, date_from=None, date_to=None):
+        """
+        Counts issued reports per source, type and day from the counters.
+
+        The hot and archived counters are added up (see Paging.summarize)
+        instead of reading every issued ID.  Days retired with counter_archive
+        set to false have no counter left and are not counted.
+
+        Args:
+            source, report_type, date_from, date_to: See find_reports.
+
+        Returns:
+            dict: See Paging.summarize.
+        """
+        with self.store.transaction():
+            return Paging.summarize((self.report_counts, self.archived_report_counts), self.scheme().key_fields,
+                                    self._report_filters(source, report_type), date_key(date_from), date_key(date_to))
+
+    def search_reports(self, query, limit=20):
+        """
+        Finds reports by the words and phrases of their descriptions.
+
+        Args:
+            query (str): Words, and phrases in double quotes, e.g.
+                'lazarus "npm packages"'.  Every word and phrase must match.
+            limit (int, optional): Return at most this many reports.  None
+                returns all matches.
+
+        Returns:
+            list: (report ID, score) tuples, best match first.
+        """
+        with self.store.transaction():
+            return self.text_index().search(query, limit)
+
+    def display_all_reports(self, source=None, report_type=None, date_from=None, date_to=None, newest_first=True,
+                            page_size=Paging.PAGE_SIZE, prompt=input):
+        """
+        Displays generated report IDs and their descriptions, a page at a time.
+
+        Descriptions are looked up only for the reports shown.
+
+        Args:
+            source, report_type, date_from, date_to: Only show matching reports
+                (see find_reports).
+            newest_first (bool, optional): Show the most recently issued reports first.
+            page_size (int, optional): Reports per page.  None shows all at once.
+            prompt (callable, optional): Asks whether to show the next page
+                (see Paging.show_pages).
+        """
         if not self.generated_report_ids:
             print("No reports generated yet.")
             return
 
         print("\nGenerated Reports:")
-        for report_id in self.generated_report_ids:
-            description = self.report_descriptions.get(report_id, "No description")
-            print(f"- {report_id}: {description}")
+        report_ids = self.iter_reports(source, report_type, date_from, date_to, newest_first=newest_first)
+        lines = (f"- {report_id}: {self.report_descriptions.get(report_id, 'No description')}"
+                 for report_id in report_ids)
+        if not Paging.show_pages(lines, page_size, prompt):
+            print("  No matching reports.")
+
+    def display_report_summary(self, source=None, report_type=None, date_from=None, date_to=None,
+                               page_size=Paging.PAGE_SIZE, prompt=input):
+        """
+        Displays the number of issued reports per source, type and day.
+
+        Args:
+            source, report_type, date_from, date_to: See report_summary.
+            page_size, prompt: See display_all_reports.
+        """
+        summary = self.report_summary(source, report_type, date_from, date_to)
+        Paging.show_pages(Paging.summary_lines(summary, self.scheme().key_fields, "Reports"), page_size, prompt)
+
+def run_batch(namer, fmt="csv", chunk_size=1000, stdin=None, stdout=None):
+    """
+    Assigns report IDs to requests read from stdin and streams them to stdout.
+
+    Requests have the fields source, report_type, date (YYYYMMDD, empty for
+    today) and description.  Each chunk is allocated with a single call to
+    generate_report_ids_batch and written out as soon as it is done, with the
+    assigned ID appended (empty for rejected requests).  Errors and the final
+    summary go to stderr so they never mix with the ID stream.
 
-def main():
+    Args:
+        namer (CTINaming): The naming object to allocate from.
+        fmt (str, optional): "csv" or "jsonl", used for input and output.
+        chunk_size (int, optional): Number of requests allocated per batch.
+        stdin (file, optional): Input stream.  Defaults to sys.stdin.
+        stdout (file, optional): Output stream.  Defaults to sys.stdout.
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    fields = ["source", "report_type", "date", "description"]
+    issued = rejected = 0
+    for chunk in BatchIO.read_requests(stdin, fields, fmt, chunk_size):
+        with contextlib.redirect_stdout(sys.stderr):
+            report_ids = namer.generate_report_ids_batch(
+                (row.get("source"), row.get("report_type"), BatchIO.parse_date(row.get("date")), row.get("description"))
+                for row in chunk
+            )
+        for row, report_id in zip(chunk, report_ids):
+            row["id"] = report_id
+            if report_id:
+                issued += 1
+            else:
+                rejected += 1
+        BatchIO.write_results(stdout, chunk, fields, fmt)
+        stdout.flush()
+    print(f"Issued {issued} report IDs, rejected {rejected} requests.", file=sys.stderr)
+
+def main(argv=None):
     """
     Main function to run the CTI Naming program.
+
+    Args:
+        argv (list, optional): Command-line arguments.  Defaults to sys.argv[1:].
     """
-    namer = CTINaming()
+    parser = argparse.ArgumentParser(description="CTI Report Naming Utility")
+    parser.add_argument("--config", default="cti_naming_config.json", help="Configuration file to use")
+    parser.add_argument("--batch", action="store_true",
+                        help="Read requests (source,report_type,date,description) from stdin and write IDs to stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv", help="Batch input/output format")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Requests allocated per batch, or IDs written per chunk when exporting")
+    parser.add_argument("--export", metavar="FILE", help="Export issued report IDs to FILE (\"-\" for stdout) and exit")
+    parser.add_argument("--export-format", choices=Exporter.FORMATS, default="txt", help="Export format")
+    parser.add_argument("--summary", action="store_true",
+                        help="Print the number of issued reports per source, type and day and exit")
+    parser.add_argument("--source", help="Export or summarize only reports from this source")
+    parser.add_argument("--report-type", help="Export or summarize only reports of this type")
+    parser.add_argument("--date-from",
+                        help="Export or summarize only reports dated on or after this date (YYYYMMDD or YYYYMM)")
+    parser.add_argument("--date-to",
+                        help="Export or summarize only reports dated on or before this date (YYYYMMDD or YYYYMM)")
+    parser.add_argument("--since-last", metavar="NAME",
+                        help="Export only IDs issued since the last export with this name, then remember the position")
+    parser.add_argument("--migrate-to-sqlite", metavar="DB_FILE",
+                        help="Copy the JSON configuration into a new SQLite database and exit")
+    parser.add_argument("--import", metavar="FILE", dest="import_files", action="append",
+                        help="Import report IDs from FILE (txt, csv or jsonl; may be repeated) and exit")
+    parser.add_argument("--import-format", choices=Importer.FORMATS, help="Import format (default: from the file name)")
+    parser.add_argument("--id-column", default="id", help="CSV column or JSON key holding the ID when importing")
+    parser.add_argument("--description-column", default="description",
+                        help="CSV column or JSON key holding the description when importing")
+    parser.add_argument("--workers", type=int, help="Parser processes when importing (default: one per CPU for large files)")
+    parser.add_argument("--rejects", metavar="FILE", help="List lines rejected by the import in FILE")
+    parser.add_argument("--artifact", metavar="KIND",
+                        help="Print a new ID of a custom kind from id_schemes (e.g. yara) and exit")
+    parser.add_argument("--field", metavar="NAME=VALUE", action="append", default=[],
+                        help="A field of the --artifact scheme, e.g. author=jdoe (may be repeated)")
+    parser.add_argument("--date", help="Date of the --artifact ID (YYYYMMDD, default today)")
+    parser.add_argument("--description", help="Description of the --artifact ID")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help="Keep Prometheus metrics in FILE (e.g. for the node_exporter textfile collector)")
+    parser.add_argument("--log-json", metavar="FILE",
+                        help="Log every allocation, save, load and export as a JSON line to FILE (\"-\" for stderr)")
+    args = parser.parse_args(argv)
+    Metrics.configure(args.metrics_file, args.log_json)
+
+    if args.migrate_to_sqlite:
+        if not migrate_from_json(args.config, args.migrate_to_sqlite, CTINaming.STATE_FIELDS):
+            sys.exit(1)
+        return
+
+    if args.export:
+        with contextlib.redirect_stdout(sys.stderr):
+            namer = CTINaming(args.config)
+            count = namer.export_reports(args.export, args.export_format, args.source, args.report_type,
+                                         args.date_from, args.date_to, args.since_last, args.chunk_size)
+            namer.store.close()
+            if count is None:
+                sys.exit(1)
+            print(f"Exported {count} report IDs.")
+        return
+
+    if args.summary:
+        with contextlib.redirect_stdout(sys.stderr):
+            namer = CTINaming(args.config)
+        namer.display_report_summary(args.source, args.report_type, args.date_from, args.date_to, prompt=None)
+        namer.store.close()
+        return
+
+    if args.import_files:
+        namer = CTINaming(args.config)
+        failed = False
+        for filename in args.import_files:
+            stats = namer.import_reports(filename, args.import_format, args.id_column, args.description_column,
+                                         args.workers, rejects_file=args.rejects)
+            failed = failed or stats is None
+        namer.store.close()
+        if failed:
+            sys.exit(1)
+        return
+
+    if args.artifact:
+        with contextlib.redirect_stdout(sys.stderr):
+            namer = CTINaming(args.config)
+            fields = dict(field.partition("=")[::2] for field in args.field)
+            artifact_id = namer.generate_artifact_id(args.artifact, fields, BatchIO.parse_date(args.date),
+                                                     args.description)
+            namer.store.close()
+        if artifact_id is None:
+            sys.exit(1)
+        print(artifact_id)
+        return
+
+    if args.batch:
+        with contextlib.redirect_stdout(sys.stderr):
+            namer = CTINaming(args.config)
+        run_batch(namer, args.format, args.chunk_size)
+        namer.store.close()
+        return
+
+    namer = CTINaming(args.config)
+    flusher = DebouncedFlusher(lambda: namer.save_config(quiet=True))
+    flusher.install()  # Final save on exit, Ctrl+C or SIGTERM
 
     # Add ASCII art here
     print(r"""
@@ -189,13 +1014,15 @@ def main():
         print("3. Get Report Description")
         print("4. Set Output Filename")
         print("5. Display All Reports")  # Added option to display all reports
-        print("6. Exit")
+        print("6. Search Reports")
+        print("7. Search Descriptions")
+        print("8. Exit")
 
         choice = input("Enter your choice: ")
 
         if choice == "1":
-            source = input(f"Enter report source ({namer.valid_sources}): ")
-            report_type = input(f"Enter report type ({namer.valid_report_types}): ")
+            source = input(f"Enter report source ({namer.get_allowlist('valid_sources').describe()}): ")
+            report_type = input(f"Enter report type ({namer.get_allowlist('valid_report_types').describe()}): ")
             date_str = input("Enter report date (YYYYMMDD, press Enter for today): ")
             description = input("Enter report description (optional): ")
             if date_str:
@@ -216,7 +1043,13 @@ def main():
             filename = input(f"Enter filename to save report IDs (default: {namer.base_filename}): ")
             if not filename:
                 filename = namer.base_filename
-            saved = namer.save_report_ids(filename)
+            fmt = input(f"Format ({', '.join(Exporter.FORMATS)}; press Enter for txt): ") or "txt"
+            if fmt == "txt":
+                saved = namer.save_report_ids(filename)
+            else:
+                saved = namer.generated_report_ids and namer.export_reports(filename, fmt) is not None
+                if saved:
+                    print(f"Report IDs exported to {filename}")
             if not saved:
                 print("Saving failed or no IDs to save")
         elif choice == "3":
@@ -229,16 +1062,42 @@ def main():
         elif choice == "4":
             new_filename = input("Enter new filename for saving report IDs: ")
             namer.base_filename = new_filename
-            namer.save_config()
             print(f"Output filename set to {new_filename}")
         elif choice == "5":
-            namer.display_all_reports()
+            mode = input("Show (l)ist or (s)ummary? (press Enter for list): ").strip().lower()
+            source = input("Source (optional): ")
+            report_type = input("Report type (optional): ")
+            date_from = input("From date (YYYYMMDD or YYYYMM, optional): ")
+            date_to = input("To date (YYYYMMDD or YYYYMM, optional): ")
+            if mode.startswith("s"):
+                namer.display_report_summary(source, report_type, date_from, date_to)
+            else:
+                namer.display_all_reports(source, report_type, date_from, date_to)
         elif choice == "6":
+            source = input("Source (optional): ")
+            report_type = input("Report type (optional): ")
+            date_from = input("From date (YYYYMMDD or YYYYMM, optional): ")
+            date_to = input("To date (YYYYMMDD or YYYYMM, optional): ")
+            prefix = input("ID prefix (optional): ")
+            matches = namer.find_reports(source, report_type, date_from, date_to, prefix)
+            print(f"\nFound {len(matches)} matching report(s):")
+            for report_id in matches:
+                print(f"- {report_id}: {namer.report_descriptions.get(report_id, 'No description')}")
+        elif choice == "7":
+            query = input('Words to search for (use "double quotes" for phrases): ')
+            matches = namer.search_reports(query)
+            print(f"\nFound {len(matches)} matching report(s), best first:")
+            for report_id, score in matches:
+                print(f"- {report_id} ({score:.2f}): {namer.report_descriptions.get(report_id, 'No description')}")
+        elif choice == "8":
             print("Exiting...")
             break
         else:
             print("Invalid choice. Please try again.")
-        namer.save_config() #save after every operation to persist
+        if namer.dirty_settings():
+            flusher.changed()  # Saved once changes settle; read-only actions write nothing
+    flusher.close()
+    namer.store.close()
     input("Press Enter to continue...")  # Add this line to pause
 if __name__ == "__main__":
     main()
@@ -0,0 +1,266 @@
+import datetime
+from array import array
+from collections.abc import MutableMapping, MutableSequence
+
+EPOCH = datetime.date(1970, 1, 1).toordinal()  # Dates are stored as days since 1970-01-01
+RAW = 0xFFFF  # Prefix code of IDs kept verbatim because they do not fit the scheme
+MAX_CODE = RAW - 1
+
+
+class IDCodec:
+    """
+    Packs IDs of the form PREFIX-YYYYMMDD-NN into three small integers.
+
+    PREFIX is everything before the date (e.g. "Vendor1-Threat" or
+    "COL-TeamX") and is interned together with the number of digits of NN
+    (the padding of the scheme) into an integer code; the date becomes a
+    day number and NN an integer.
+    """
+    def __init__(self):
+        self.prefixes = []  # Code -> prefix
+        self._formats = []  # Code -> formatter taking the date string and the number
+        self._codes = {}  # (Prefix, digits) -> code
+        self._days = {}  # "YYYYMMDD" -> day number
+        self._dates = {}  # Day number -> "YYYYMMDD"
+
+    def encode(self, issued_id, add=True):
+        """
+        Packs an ID.
+
+        Args:
+            issued_id (str): The ID.
+            add (bool, optional): Intern a prefix seen for the first time.  Lookups
+                pass False, since an unknown prefix cannot be in any column.
+
+        Returns:
+            tuple: (prefix code, day number, number), or None if the ID cannot be
+                packed (or its prefix is unknown and add is False).
+        """
+        parts = issued_id.rsplit("-", 2) if isinstance(issued_id, str) else ()
+        if len(parts) != 3:
+            return None
+        prefix, date_str, number = parts
+        day = self._days.get(date_str)
+        if day is None:
+            if len(date_str) != 8 or not date_str.isdigit():
+                return None
+            try:
+                day = datetime.date(int(date_str[:4]), int(date_str[4:6]), int(date_str[6:])).toordinal() - EPOCH
+            except ValueError:
+                return None
+            if not 0 <= day <= 0xFFFF:
+                return None
+            self._days[date_str] = day
+            self._dates[day] = date_str
+        if not 0 < len(number) <= 9 or not (number.isascii() and number.isdigit()):
+            return None
+        value = int(number)
+        if value > 0xFFFF:
+            return None
+        code = self._codes.get((prefix, len(number)))
+        if code is None:
+            if not add or len(self.prefixes) > MAX_CODE:
+                return None
+            code = self._codes[prefix, len(number)] = len(self.prefixes)
+            self.prefixes.append(prefix)
+            escaped = prefix.replace("{", "{{").replace("}", "}}")
+            self._formats.append(f"{escaped}-{{}}-{{:0{len(number)}d}}".format)
+        return code, day, value
+
+    def decode(self, code, day, number):
+        """Formats a packed ID back into its string form."""
+        try:
+            date_str = self._dates[day]
+        except KeyError:
+            date_str = self._dates[day] = datetime.date.fromordinal(day + EPOCH).strftime("%Y%m%d")
+        return self._formats[code](date_str, number)
+
+
+class CompactIDList(MutableSequence):
+    """
+    An issued-ID history stored as three array columns.
+
+    Each ID takes six bytes (prefix code, day number and sequence number as
+    unsigned shorts) instead of a separate string object; strings are
+    formatted when an item is read.  IDs that cannot be packed are kept
+    verbatim on the side.  Behaves like the plain list it replaces.
+    """
+    __slots__ = ("codec", "_prefixes", "_days", "_numbers", "_raw")
+
+    def __init__(self, ids=(), codec=None):
+        self.codec = codec or IDCodec()
+        self._prefixes = array("H")
+        self._days = array("H")
+        self._numbers = array("H")
+        self._raw = {}  # Row -> ID, for IDs that cannot be packed
+        self.extend(ids)
+
+    def append(self, issued_id):
+        packed = self.codec.encode(issued_id)
+        if packed is None:
+            self._raw[len(self._prefixes)] = issued_id
+            packed = (RAW, 0, 0)
+        self._prefixes.append(packed[0])
+        self._days.append(packed[1])
+        self._numbers.append(packed[2])
+
+    def extend(self, ids):
+        encode = self.codec.encode
+        prefixes, days, numbers, raw = self._prefixes, self._days, self._numbers, self._raw
+        for issued_id in ids:
+            packed = encode(issued_id)
+            if packed is None:
+                raw[len(prefixes)] = issued_id
+                packed = (RAW, 0, 0)
+            prefixes.append(packed[0])
+            days.append(packed[1])
+            numbers.append(packed[2])
+
+    def __len__(self):
+        return len(self._prefixes)
+
+    def _format(self, row):
+        code = self._prefixes[row]
+        if code == RAW:
+            return self._raw[row]
+        return self.codec.decode(code, self._days[row], self._numbers[row])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._format(row) for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("list index out of range")
+        return self._format(index)
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, start):
+        """Iterates from position start."""
+        decode, raw = self.codec.decode, self._raw
+        for row, code, day, number in zip(range(start, len(self)), self._prefixes[start:], self._days[start:],
+                                          self._numbers[start:]):
+            yield raw[row] if code == RAW else decode(code, day, number)
+
+    def __contains__(self, issued_id):
+        packed = self.codec.encode(issued_id, add=False)
+        if packed is None:
+            return issued_id in self._raw.values()
+        code, day, number = packed
+        prefixes, days, numbers = self._prefixes, self._days, self._numbers
+        row = -1
+        while True:
+            try:
+                row = numbers.index(number, row + 1)
+            except ValueError:
+                return False
+            if prefixes[row] == code and days[row] == day:
+                return True
+
+    def _rebuild(self, ids):
+        self._prefixes, self._days, self._numbers, self._raw = array("H"), array("H"), array("H"), {}
+        self.extend(ids)
+
+    # Editing in the middle is rare (the history is append-only), so it simply
+    # goes through a plain list.
+    def __setitem__(self, index, value):
+        ids = list(self)
+        ids[index] = value
+        self._rebuild(ids)
+
+    def __delitem__(self, index):
+        ids = list(self)
+        del ids[index]
+        self._rebuild(ids)
+
+    def insert(self, index, value):
+        ids = list(self)
+        ids.insert(index, value)
+        self._rebuild(ids)
+
+    def copy(self):
+        """Returns a copy sharing the codec."""
+        other = CompactIDList(codec=self.codec)
+        other._prefixes = array("H", self._prefixes)
+        other._days = array("H", self._days)
+        other._numbers = array("H", self._numbers)
+        other._raw = dict(self._raw)
+        return other
+
+    def __eq__(self, other):
+        return isinstance(other, (list, CompactIDList)) and len(self) == len(other) and list(self) == list(other)
+
+    def __repr__(self):
+        return f"<CompactIDList of {len(self)} IDs>"
+
+
+class CompactIDMap(MutableMapping):
+    """
+    A dict keyed by issued IDs (e.g. descriptions), with packed keys.
+
+    Keys are stored as a single integer built from the packed ID rather than
+    as the ID string; keys that cannot be packed are kept verbatim.
+    """
+    __slots__ = ("codec", "_packed", "_raw")
+
+    def __init__(self, items=(), codec=None):
+        self.codec = codec or IDCodec()
+        self._packed = {}  # Packed ID -> value
+        self._raw = {}  # ID -> value, for IDs that cannot be packed
+        self.update(items)
+
+    @staticmethod
+    def _key(packed):
+        code, day, number = packed
+        return (code << 32) | (day << 16) | number
+
+    def __getitem__(self, issued_id):
+        packed = self.codec.encode(issued_id, add=False)
+        if packed is None:
+            return self._raw[issued_id]
+        return self._packed[self._key(packed)]
+
+    def __setitem__(self, issued_id, value):
+        packed = self.codec.encode(issued_id)
+        if packed is None:
+            self._raw[issued_id] = value
+        else:
+            self._packed[self._key(packed)] = value
+
+    def __delitem__(self, issued_id):
+        packed = self.codec.encode(issued_id, add=False)
+        if packed is None:
+            del self._raw[issued_id]
+        else:
+            del self._packed[self._key(packed)]
+
+    def __contains__(self, issued_id):
+        packed = self.codec.encode(issued_id, add=False)
+        if packed is None:
+            return issued_id in self._raw
+        return self._key(packed) in self._packed
+
+    def __len__(self):
+        return len(self._packed) + len(self._raw)
+
+    def __iter__(self):
+        for key, _ in self.items():
+            yield key
+
+    def items(self):
+        decode = self.codec.decode
+        for key, value in self._packed.items():
+            yield decode(key >> 32, (key >> 16) & 0xFFFF, key & 0xFFFF), value
+        yield from self._raw.items()
+
+    def copy(self):
+        """Returns a copy sharing the codec."""
+        other = CompactIDMap(codec=self.codec)
+        other._packed = dict(self._packed)
+        other._raw = dict(self._raw)
+        return other
+
+    def __repr__(self):
+        return f"<CompactIDMap of {len(self)} entries>"
@@ -0,0 +1,61 @@
+import datetime
+
+
+def counter_date(key):
+    """Returns the YYYYMMDD date a counter key ("source|type|YYYYMMDD" or "source|YYYYMMDD") belongs to."""
+    return key.rsplit("|", 1)[-1]
+
+
+def retention_cutoff(days, today=None):
+    """
+    Returns the first day whose counters are still kept in the hot dict.
+
+    Args:
+        days (int): How many days before today stay open for back-dated IDs.
+        today (datetime.date, optional): Defaults to the current date.
+
+    Returns:
+        str: The cutoff date in %Y%m%d format.
+    """
+    return ((today or datetime.date.today()) - datetime.timedelta(days=days)).strftime("%Y%m%d")
+
+
+def retirement_ops(counts, field, archive, archive_field, cutoff):
+    """
+    Builds the operations that move the counters of closed days out of the hot dict.
+
+    Args:
+        counts (dict): The hot counters, e.g. report_counts.
+        field (str): Their field name.
+        archive (dict): The archived counters, or None to drop closed counters
+            without archiving them (they are then rebuilt from the issued IDs
+            if ever needed again).
+        archive_field (str): The archive's field name.
+        cutoff (str): Counters dated before this YYYYMMDD day are retired.
+
+    Returns:
+        list: The operations (see JournalStore.apply_ops).
+    """
+    ops = []
+    for key, value in list(counts.items()):
+        if counter_date(key) >= cutoff:
+            continue
+        if archive is not None:
+            ops.append(["put", archive_field, key, max(value, archive.get(key, 0))])
+        ops.append(["delete", field, key])
+    return ops
+
+
+def highest_number(ids, prefix):
+    """
+    Returns the highest sequence number among issued IDs of the form PREFIXNN.
+
+    Args:
+        ids (iterable): Issued IDs starting with prefix (e.g. from a prefix search).
+        prefix (str): Everything before the number, e.g. "Vendor1-Threat-20250301-".
+
+    Returns:
+        int: The highest number, or 0 if there is none.
+    """
+    numbers = [int(issued_id[len(prefix):]) for issued_id in ids if issued_id[len(prefix):].isdigit()]
+    return max(numbers, default=0)
@@ -0,0 +1,256 @@
+import contextlib
+import csv
+import datetime
+import io
+import itertools
+import json
+import sys
+import uuid
+
+FORMATS = ("txt", "csv", "jsonl", "stix")
+STIX_NAMESPACE = uuid.UUID("6f0c0b4e-5d4a-4c55-9a0e-2a5f4d1c7b3e")  # Makes STIX IDs stable across exports
+STIX_EPOCH = "1970-01-01T00:00:00.000Z"
+
+
+def iter_from(ids, start=0, stop=None):
+    """
+    Iterates over an ID list from a position without copying it.
+
+    Lists loaded lazily (LazyList, SQLiteIDList) skip ahead without parsing
+    the earlier part; plain lists are sliced by an iterator.
+
+    Args:
+        ids (list): The issued IDs.
+        start (int, optional): First position to yield.
+        stop (int, optional): Position to stop before.  Defaults to the end.
+
+    Yields:
+        str: The IDs.
+    """
+    if hasattr(ids, "iter_from"):
+        iterator = ids.iter_from(start)
+        return iterator if stop is None else itertools.islice(iterator, stop - start)
+    return itertools.islice(ids, start, stop)
+
+
+def open_output(filename):
+    """
+    Opens an export file for writing.
+
+    "-" means stdout and an already open text stream (e.g. an HTTP response)
+    is written to as is; neither is closed afterwards.
+    """
+    if filename == "-":
+        return contextlib.nullcontext(sys.stdout)
+    if hasattr(filename, "write"):
+        return contextlib.nullcontext(filename)
+    return open(filename, "w")
+
+
+def select(ids, parse, fields, filters=None, date_from=None, date_to=None, start=0, stop=None):
+    """
+    Streams the IDs that match field filters and a date range.
+
+    Args:
+        ids (list): The issued IDs.
+        parse (callable): Splits an ID into a tuple of field values, or
+            returns None (see IDIndex).
+        fields (tuple): Names of the values parse() returns, in order.
+        filters (dict, optional): Exact field values to match.
+        date_from (str, optional): First date to include, as a (possibly
+            shortened) YYYYMMDD string.
+        date_to (str, optional): Last date to include, likewise.
+        start (int, optional): First position in ids to consider.
+        stop (int, optional): Position to stop before.
+
+    Yields:
+        dict: "id" plus the parsed fields of each matching ID.
+    """
+    checks = [(fields.index(name), value) for name, value in (filters or {}).items()]
+    date_field = fields.index("date") if "date" in fields else None
+    low = (date_from or "").ljust(8, "0") if date_from else None
+    high = (date_to or "").ljust(8, "9") if date_to else None
+    for issued_id in iter_from(ids, start, stop):
+        parsed = parse(issued_id)
+        if parsed is None:
+            if checks or low or high:
+                continue
+            parsed = ("",) * len(fields)
+        if any(parsed[field] != value for field, value in checks):
+            continue
+        if date_field is not None and ((low and parsed[date_field] < low) or (high and parsed[date_field] > high)):
+            continue
+        record = {"id": issued_id}
+        record.update(zip(fields, parsed))
+        yield record
+
+
+def watermark_key(name, filters=None, date_from=None, date_to=None):
+    """
+    Returns the export_watermarks key of a named export and its filters.
+
+    A watermark records how far the history has been scanned, so the IDs the
+    filters dropped are behind it too; each set of filters therefore keeps
+    its own watermark.  Exports without filters use the bare name.
+
+    Args:
+        name (str): The export name given with since / --since-last.
+        filters (dict, optional): Field values the export is restricted to.
+        date_from, date_to (str, optional): The date range, as YYYYMMDD.
+
+    Returns:
+        str: The key, e.g. "tip" or "tip?date_from=20250301&source=Vendor1".
+    """
+    criteria = dict(filters or {}, date_from=date_from, date_to=date_to)
+    query = "&".join(f"{field}={value}" for field, value in sorted(criteria.items()) if value)
+    return f"{name}?{query}" if query else name
+
+
+class Exporter:
+    """
+    Writes ID records to a stream in buffered chunks.
+
+    Supported formats are "txt" (the "ID: description" lines the tools have
+    always written), "csv", "jsonl" and "stix" (a STIX 2.1 bundle with one
+    report object per ID, created by an identity for its source).  Records are dicts with "id", the parsed fields
+    and "description"; they are formatted chunk_size at a time and written
+    with one call per chunk, so memory use does not depend on how many IDs
+    are exported.
+    """
+    def __init__(self, stream, fmt="txt", fields=(), chunk_size=1000, producer="CTI Naming"):
+        """
+        Starts an export.
+
+        Args:
+            stream (file): The text stream to write to.
+            fmt (str, optional): One of FORMATS.
+            fields (tuple, optional): The parsed fields written to CSV, after
+                the ID and before the description.
+            chunk_size (int, optional): Records formatted per write.
+            producer (str, optional): Name of the STIX identity that creates
+                the exported objects when a record has no source.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}'.  Use one of: {', '.join(FORMATS)}")
+        self.stream = stream
+        self.fmt = fmt
+        self.fields = tuple(fields)
+        self.chunk_size = chunk_size
+        self.producer = producer
+        self.count = 0  # Records written so far
+        self._identities = set()  # STIX identities already written
+        self._stix_objects = 0
+        self._sections = 0
+        self._opened = False
+        self._csv_buffer = io.StringIO()
+        self._csv = csv.writer(self._csv_buffer, lineterminator="\n")
+
+    def _open(self):
+        if self._opened:
+            return
+        self._opened = True
+        if self.fmt == "csv":
+            self._csv.writerow(("id",) + self.fields + ("description",))
+            self._flush_csv()
+        elif self.fmt == "stix":
+            self.stream.write('{"type": "bundle", "id": "bundle--%s", "objects": [\n' % uuid.uuid4())
+
+    def section(self, title):
+        """Starts a titled section (text format only, e.g. "VirusTotal Graphs:")."""
+        self._open()
+        if self.fmt == "txt":
+            self.stream.write(f"\n{title}\n" if self._sections else f"{title}\n")
+        self._sections += 1
+
+    def write(self, records):
+        """
+        Writes records, chunk_size at a time.
+
+        Args:
+            records (iterable): Record dicts (see the class docstring).
+        """
+        self._open()
+        records = iter(records)
+        while True:
+            chunk = list(itertools.islice(records, self.chunk_size))
+            if not chunk:
+                return
+            if self.fmt == "csv":
+                self._csv.writerows([record["id"]] + [record.get(field, "") for field in self.fields]
+                                    + [record.get("description") or ""] for record in chunk)
+                self._flush_csv()
+            else:
+                format_record = getattr(self, f"_format_{self.fmt}")
+                self.stream.write("".join(format_record(record) for record in chunk))
+            self.count += len(chunk)
+
+    def _flush_csv(self):
+        self.stream.write(self._csv_buffer.getvalue())
+        self._csv_buffer.seek(0)
+        self._csv_buffer.truncate()
+
+    def _format_txt(self, record):
+        description = record.get("description")
+        return f"{record['id']}: {description}\n" if description is not None else f"{record['id']}\n"
+
+    def _format_jsonl(self, record):
+        return json.dumps(record) + "\n"
+
+    def _format_stix(self, record):
+        objects = []
+        creator = record.get("source") or self.producer
+        identity_id = f"identity--{uuid.uuid5(STIX_NAMESPACE, 'identity:' + creator)}"
+        if identity_id not in self._identities:
+            self._identities.add(identity_id)
+            objects.append({
+                "type": "identity",
+                "spec_version": "2.1",
+                "id": identity_id,
+                "created": STIX_EPOCH,
+                "modified": STIX_EPOCH,
+                "name": creator,
+            })
+        # The date in the ID is the only timestamp we have; using it for
+        # created/modified keeps re-exports of the same ID identical.
+        published = _stix_timestamp(record.get("date"))
+        report = {
+            "type": "report",
+            "spec_version": "2.1",
+            "id": f"report--{uuid.uuid5(STIX_NAMESPACE, record['id'])}",
+            "created_by_ref": identity_id,
+            "created": published,
+            "modified": published,
+            "name": record["id"],
+            "report_types": [_stix_vocab(record.get("report_type") or record.get("kind") or "unknown")],
+            "published": published,
+            "object_refs": [identity_id],
+            "external_references": [{"source_name": self.producer, "external_id": record["id"]}],
+        }
+        if record.get("description"):
+            report["description"] = record["description"]
+        objects.append(report)
+        text = ",\n".join(json.dumps(obj) for obj in objects)
+        if self._stix_objects:
+            text = ",\n" + text
+        self._stix_objects += len(objects)
+        return text
+
+    def close(self):
+        """Finishes the export (e.g. closes the STIX bundle).  Does not close the stream."""
+        self._open()
+        if self.fmt == "stix":
+            self.stream.write("\n]}\n")
+
+
+def _stix_timestamp(date_str):
+    """Converts a YYYYMMDD string into a STIX timestamp (midnight UTC)."""
+    try:
+        date = datetime.datetime.strptime(date_str or "", "%Y%m%d")
+    except ValueError:
+        return STIX_EPOCH
+    return date.strftime("%Y-%m-%dT00:00:00.000Z")
+
+
+def _stix_vocab(value):
+    """Turns a name such as "Threat Activity" into open-vocabulary form ("threat-activity")."""
+    return "-".join(str(value).lower().replace("_", " ").split()) or "unknown"
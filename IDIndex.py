@@ -0,0 +1,307 @@
+import itertools
+import marshal
+import os
+from array import array
+
+INDEX_VERSION = 1
+NO_VALUE = ""  # Field value recorded for IDs that cannot be parsed
+
+
+def date_key(value):
+    """
+    Converts a query date into the YYYYMMDD string form used by the index.
+
+    Args:
+        value (datetime.date or str): A date, or a (possibly shortened)
+            YYYYMMDD string such as "202503".
+
+    Returns:
+        str: The date as a string, or None if value is empty.
+    """
+    if not value:
+        return None
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y%m%d")
+    return str(value)
+
+
+class IDIndex:
+    """
+    Secondary index over an append-only list of issued IDs.
+
+    Each ID is parsed once into its fields (e.g. source, report type, date).
+    Field values are interned into small integer codes, and a posting list of
+    row numbers is kept for every value and for every full combination of
+    values (e.g. source/type/date, the same key the counters use), so that
+    queries only touch the rows that can match.  Row numbers are also kept sorted by ID for prefix
+    queries.  The index catches up with new IDs on each query and is
+    persisted next to the configuration so it does not have to be rebuilt on
+    every start.
+    """
+    def __init__(self, ids, fields, parse, path=None, save_threshold=100000):
+        """
+        Initializes an empty index.
+
+        Args:
+            ids (list): The append-only list of issued IDs to index.  The list
+                is referenced, not copied.
+            fields (tuple): Names of the fields parse() returns, in order.  The
+                field named "date" is used for date range queries.
+            parse (callable): Splits an ID into a tuple of field values
+                (extra trailing items are ignored), or returns None.
+            path (str, optional): Where to persist the index.
+            save_threshold (int, optional): Persist the index whenever a single
+                update indexes at least this many new IDs.
+        """
+        self.ids = ids
+        self.fields = tuple(fields)
+        self.parse = parse
+        self.path = path
+        self.save_threshold = save_threshold
+        self.count = 0  # Number of IDs indexed so far
+        self.last_id = None
+        self.values = [[] for _ in self.fields]  # Code -> field value
+        self.columns = [array("I") for _ in self.fields]  # Row -> code
+        self.postings = [{} for _ in self.fields]  # Code -> rows
+        self.key_postings = {}  # Tuple of codes for all fields -> rows
+        self.sorted_rows = array("I")  # Rows ordered by ID
+        self._codes = [{} for _ in self.fields]  # Field value -> code
+        self._unsorted = []  # Rows not merged into sorted_rows yet
+        self._date_field = self.fields.index("date") if "date" in self.fields else None
+
+    @classmethod
+    def open(cls, ids, fields, parse, path=None, save_threshold=100000):
+        """
+        Loads a persisted index if it matches ids, else starts an empty one.
+
+        Args:
+            ids, fields, parse, path, save_threshold: See __init__.
+
+        Returns:
+            IDIndex: The index, brought up to date with ids.
+        """
+        index = cls(ids, fields, parse, path, save_threshold)
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    data = marshal.load(f)
+                if (data["version"] == INDEX_VERSION and tuple(data["fields"]) == index.fields
+                        and 0 < data["count"] <= len(ids) and ids[data["count"] - 1] == data["last_id"]):
+                    index._restore(data)
+            except (OSError, EOFError, ValueError, TypeError, KeyError):
+                pass  # Unreadable or stale; rebuild from scratch
+        index.update()
+        return index
+
+    def tracks(self, ids):
+        """
+        Tells whether this index is for the given list.
+
+        The owner's list is replaced wholesale by load_config; the index then
+        has to be reopened.
+        """
+        return self.ids is ids and self.count <= len(ids)
+
+    def _restore(self, data):
+        self.count = data["count"]
+        self.last_id = data["last_id"]
+        self.values = data["values"]
+        self._codes = [{value: code for code, value in enumerate(values)} for values in self.values]
+        self.columns = [array("I", column) for column in data["columns"]]
+        self.postings = [{code: array("I", rows) for code, rows in postings.items()} for postings in data["postings"]]
+        self.key_postings = {key: array("I", rows) for key, rows in data["key_postings"].items()}
+        self.sorted_rows = array("I", data["sorted_rows"])
+
+    def save(self):
+        """Writes the index to its path, replacing any previous copy atomically."""
+        if not self.path:
+            return
+        self._merge_unsorted()
+        data = {
+            "version": INDEX_VERSION,
+            "fields": list(self.fields),
+            "count": self.count,
+            "last_id": self.last_id,
+            "values": self.values,
+            "columns": [column.tobytes() for column in self.columns],
+            "postings": [{code: rows.tobytes() for code, rows in postings.items()} for postings in self.postings],
+            "key_postings": {key: rows.tobytes() for key, rows in self.key_postings.items()},
+            "sorted_rows": self.sorted_rows.tobytes(),
+        }
+        tmp_file = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                marshal.dump(data, f)
+            os.replace(tmp_file, self.path)
+        except OSError as e:
+            print(f"Error saving index: {e}")
+
+    def update(self):
+        """Indexes the IDs appended to the list since the last update."""
+        ids = self.ids
+        start = self.count
+        empty = (NO_VALUE,) * len(self.fields)
+        for row, issued_id in enumerate(ids[start:], start):
+            parsed = self.parse(issued_id) or empty
+            key = []
+            for field, value in enumerate(parsed[:len(self.fields)]):
+                code = self._codes[field].get(value)
+                if code is None:
+                    code = self._codes[field][value] = len(self.values[field])
+                    self.values[field].append(value)
+                key.append(code)
+                self.columns[field].append(code)
+                rows = self.postings[field].get(code)
+                if rows is None:
+                    rows = self.postings[field][code] = array("I")
+                rows.append(row)
+            key = tuple(key)
+            rows = self.key_postings.get(key)
+            if rows is None:
+                rows = self.key_postings[key] = array("I")
+            rows.append(row)
+            self._unsorted.append(row)
+        self.count = len(ids)
+        if self.count:
+            self.last_id = ids[-1]
+        if self.count - start >= self.save_threshold:
+            self.save()
+
+    def _merge_unsorted(self):
+        """Merges rows added since the last merge into sorted_rows."""
+        if not self._unsorted:
+            return
+        ids = self.ids
+        self._unsorted.sort(key=ids.__getitem__)
+        merged = array("I")
+        old = self.sorted_rows
+        i = j = 0
+        while i < len(old) and j < len(self._unsorted):
+            if ids[old[i]] <= ids[self._unsorted[j]]:
+                merged.append(old[i])
+                i += 1
+            else:
+                merged.append(self._unsorted[j])
+                j += 1
+        merged.extend(old[i:])
+        merged.extend(self._unsorted[j:])
+        self.sorted_rows = merged
+        self._unsorted = []
+
+    def query(self, filters=None, date_from=None, date_to=None, prefix=None, limit=None):
+        """
+        Finds issued IDs by field values, date range and/or ID prefix.
+
+        Args:
+            filters (dict, optional): Exact field values to match, e.g.
+                {"source": "Vendor1", "report_type": "Threat"}.
+            date_from (str, optional): First date to include, as YYYYMMDD.  A
+                shorter value such as "202503" means the start of that period.
+            date_to (str, optional): Last date to include, as YYYYMMDD.  A
+                shorter value such as "202503" means the end of that period.
+            prefix (str, optional): Only IDs starting with this string.
+            limit (int, optional): Return at most this many IDs.
+
+        Returns:
+            list: The matching IDs, in the order they were issued.
+        """
+        matches = self.iter_query(filters, date_from, date_to, prefix)
+        return list(matches if limit is None else itertools.islice(matches, limit))
+
+    def iter_query(self, filters=None, date_from=None, date_to=None, prefix=None, newest_first=False):
+        """
+        Finds issued IDs like query, but yields them one at a time.
+
+        The candidate rows are picked when this is called; the IDs themselves
+        are only read as the iterator is consumed, so showing the first page
+        of a large history costs no more than the page.
+
+        Args:
+            filters, date_from, date_to, prefix: See query.
+            newest_first (bool, optional): Yield the most recently issued IDs first.
+
+        Returns:
+            iterator: The matching IDs.
+        """
+        self.update()
+        columns = self.columns
+        codes = {}  # Field -> code every result must have
+        candidates = []  # Row lists that are each a superset of the result
+        for name, value in (filters or {}).items():
+            field = self.fields.index(name)
+            code = self._codes[field].get(value)
+            if code is None:
+                return iter(())
+            codes[field] = code
+            candidates.append(self.postings[field][code])
+
+        date_codes = None
+        if (date_from or date_to) and self._date_field is not None:
+            low = (date_from or "").ljust(8, "0")
+            high = (date_to or "").ljust(8, "9")
+            date_codes = set(code for code, value in enumerate(self.values[self._date_field])
+                             if low <= value <= high and value != NO_VALUE)
+            if len(codes) == len(self.fields) - 1 and self._date_field not in codes:
+                # Every other field is fixed, so the full-key postings give the
+                # exact answer for each date in range.
+                rows = []
+                key = [codes.get(field) for field in range(len(self.fields))]
+                for code in date_codes:
+                    key[self._date_field] = code
+                    rows.extend(self.key_postings.get(tuple(key), ()))
+                rows.sort()
+                codes = {}
+                date_codes = None
+                candidates = [rows]
+            else:
+                postings = self.postings[self._date_field]
+                rows = []
+                for code in date_codes:
+                    rows.extend(postings[code])
+                rows.sort()
+                candidates.append(rows)
+
+        if prefix:
+            candidates.append(sorted(self._prefix_rows(prefix)))
+
+        if not candidates:
+            rows = range(self.count)
+        else:
+            rows = min(candidates, key=len)
+
+        checks = list(codes.items())
+        date_column = columns[self._date_field] if date_codes is not None else None
+        return self._matching(reversed(rows) if newest_first else rows, checks, date_column, date_codes, prefix)
+
+    def _matching(self, rows, checks, date_column, date_codes, prefix):
+        ids = self.ids
+        columns = self.columns
+        for row in rows:
+            if checks and any(columns[field][row] != code for field, code in checks):
+                continue
+            if date_column is not None and date_column[row] not in date_codes:
+                continue
+            issued_id = ids[row]
+            if prefix and not issued_id.startswith(prefix):
+                continue
+            yield issued_id
+
+    def _prefix_rows(self, prefix):
+        """Returns the rows whose ID starts with prefix, using binary search."""
+        ids = self.ids
+        if len(self._unsorted) > 1024:
+            self._merge_unsorted()
+        sorted_rows = self.sorted_rows
+        lo, hi = 0, len(sorted_rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ids[sorted_rows[mid]] < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        rows = []
+        while lo < len(sorted_rows) and ids[sorted_rows[lo]].startswith(prefix):
+            rows.append(sorted_rows[lo])
+            lo += 1
+        rows.extend(row for row in self._unsorted if ids[row].startswith(prefix))
+        return rows
@@ -0,0 +1,217 @@
+import hashlib
+import math
+import os
+import struct
+
+BLOOM_MAGIC = b"IDBLOOM2"
+BLOOM_HEADER = struct.Struct("<8sQQIQ16s")  # Magic, capacity, bit count, hash count, IDs covered, last ID digest
+EXACT_AFTER = 32  # Possible matches searched in the history before switching to a hashed set
+
+
+def id_digest(issued_id):
+    """Returns a short fingerprint of an ID, to tell whether a saved filter was built from the same history."""
+    return hashlib.blake2b(issued_id.encode(), digest_size=16).digest() if issued_id else bytes(16)
+
+
+class BloomFilter:
+    """
+    A Bloom filter over strings, backed by a bit array.
+
+    Answers "definitely not added" or "possibly added"; the chance of a wrong
+    "possibly" stays near error_rate as long as no more than capacity items
+    are added.
+    """
+    def __init__(self, capacity, error_rate=0.0001):
+        """
+        Args:
+            capacity (int): Number of items the filter is sized for.
+            error_rate (float, optional): Target false positive rate at capacity.
+        """
+        self.capacity = max(int(capacity), 1)
+        self.bit_count = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / self.capacity * math.log(2)))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self.bit_count
+        return [(h1 + i * h2) % m for i in range(self.hash_count)]
+
+    def add(self, item):
+        bits = self.bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class IDMembership:
+    """
+    Answers "was this ID already issued?" without scanning the history.
+
+    Three strategies, chosen when the membership is opened:
+
+    - histories kept in SQLite are checked with the database's ID index;
+    - small histories are mirrored into a hashed set;
+    - histories of at least bloom_threshold IDs go through a Bloom filter
+      persisted next to the configuration, so a check does not require
+      loading the history.  Only when the filter says "possibly issued"
+      (a real collision, or a rare false positive) is the history itself
+      searched; if that keeps happening (e.g. when re-importing IDs that
+      are already there) the history is mirrored into a hashed set after
+      all.
+
+    Like IDIndex, the membership catches up with IDs appended to the list
+    since the last check.
+    """
+    def __init__(self, ids, path=None, bloom_threshold=100000, save_threshold=10000):
+        """
+        Args:
+            ids (list): The append-only list of issued IDs.  The list is
+                referenced, not copied.
+            path (str, optional): Where to persist the Bloom filter.  Without a
+                path a hashed set is always used.
+            bloom_threshold (int, optional): Use the Bloom filter for histories of
+                at least this many IDs.  None never uses it.
+            save_threshold (int, optional): Persist the filter whenever a single
+                update adds at least this many IDs.
+        """
+        self.ids = ids
+        self.path = path
+        self.save_threshold = save_threshold
+        self.count = 0  # Number of IDs covered so far
+        self.last_id = None  # The last of them
+        self.bloom = None
+        self._keys = None
+        self._searches = 0  # Possible matches of the filter searched in the history
+        if getattr(ids, "fast_contains", False):
+            self.count = None  # The list answers membership itself
+        elif path and bloom_threshold is not None and len(ids) >= bloom_threshold:
+            self.bloom = self._open_bloom(path, len(ids))
+        else:
+            self._keys = set()
+
+    @classmethod
+    def open(cls, ids, path=None, bloom_threshold=100000, save_threshold=10000):
+        """
+        Opens the membership of a history, loading a persisted Bloom filter if one matches.
+
+        Args:
+            ids, path, bloom_threshold, save_threshold: See __init__.
+
+        Returns:
+            IDMembership: The membership, brought up to date with ids.
+        """
+        membership = cls(ids, path, bloom_threshold, save_threshold)
+        membership.update()
+        return membership
+
+    def _open_bloom(self, path, size):
+        """Loads the persisted filter if it was built from this history and fits size IDs, else starts a new one."""
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    header = BLOOM_HEADER.unpack(f.read(BLOOM_HEADER.size))
+                    magic, capacity, bit_count, hash_count, count, digest = header
+                    bits = bytearray(f.read())
+                # A shorter history, or a different ID where the filter stopped, means the
+                # configuration was restored or edited since: rebuild.
+                if magic == BLOOM_MAGIC and count <= size <= capacity and len(bits) == (bit_count + 7) // 8:
+                    last_id = self._id_at(count - 1)
+                    if id_digest(last_id) == digest:
+                        bloom = BloomFilter.__new__(BloomFilter)
+                        bloom.capacity, bloom.bit_count, bloom.hash_count = capacity, bit_count, hash_count
+                        bloom.bits = bits
+                        self.count, self.last_id = count, last_id
+                        return bloom
+            except (OSError, struct.error):
+                pass  # Unreadable; rebuild from scratch
+        return BloomFilter(size * 2)
+
+    def _id_at(self, position):
+        """Returns the ID at a position of the history (None before the start) without loading a lazy list."""
+        if position < 0:
+            return None
+        if hasattr(self.ids, "iter_from"):
+            return next(iter(self.ids.iter_from(position)), None)
+        return self.ids[position]
+
+    def tracks(self, ids):
+        """
+        Tells whether this membership is for the given list.
+
+        The owner's list is replaced wholesale by load_config; the membership
+        then has to be reopened.
+        """
+        return self.ids is ids and (self.count is None or self.count <= len(ids))
+
+    def update(self):
+        """Adds the IDs appended to the list since the last update."""
+        if self.count is None or self.count == len(self.ids):
+            return
+        start = self.count
+        if self.bloom is not None:
+            size = len(self.ids)
+            if size > self.bloom.capacity:  # Outgrown: start over with room to grow
+                self.bloom = BloomFilter(size * 2)
+                start = self.count = 0
+        bloom, keys = self.bloom, self._keys
+        for issued_id in self.ids.iter_from(start) if hasattr(self.ids, "iter_from") else self.ids[start:]:
+            if bloom is not None:
+                bloom.add(issued_id)
+            if keys is not None:
+                keys.add(issued_id)
+            self.count += 1
+            self.last_id = issued_id
+        if self.bloom is not None and self.count - start >= self.save_threshold:
+            self.save()
+
+    def save(self):
+        """Writes the Bloom filter to its path, replacing any previous copy atomically."""
+        if self.bloom is None or not self.path:
+            return
+        bloom = self.bloom
+        tmp_file = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, bloom.capacity, bloom.bit_count, bloom.hash_count, self.count,
+                                          id_digest(self.last_id)))
+                f.write(bloom.bits)
+            os.replace(tmp_file, self.path)
+        except OSError as e:
+            print(f"Error saving Bloom filter: {e}")
+
+    def __contains__(self, issued_id):
+        """Tells whether issued_id is in the history, in constant time (up to rare false positives of the filter)."""
+        if self.count is None:
+            return issued_id in self.ids
+        self.update()
+        if self._keys is not None:
+            return issued_id in self._keys
+        if issued_id not in self.bloom:
+            return False
+        self._searches += 1
+        if self._searches > EXACT_AFTER:
+            self._keys = set(self.ids)
+            return issued_id in self._keys
+        return issued_id in self.ids
+
+    def any_issued(self, prefix, first, count, width=2):
+        """
+        Tells whether any of the IDs PREFIX{first} .. PREFIX{first + count - 1} was already issued.
+
+        Args:
+            prefix (str): Everything before the number, e.g. "Vendor1-Threat-20250301-".
+            first (int): The first number of the block.
+            count (int): The size of the block.
+            width (int, optional): The numbers are zero-padded to this many digits.
+
+        Returns:
+            bool: True on a collision.
+        """
+        return any(f"{prefix}{number:0{width}d}" in self for number in range(first, first + count))
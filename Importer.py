@@ -0,0 +1,275 @@
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+FORMATS = ("txt", "csv", "jsonl")
+HEADINGS = ("VirusTotal Collections:", "VirusTotal Graphs:")  # Section titles written by save_ids
+PLACEHOLDER_DESCRIPTIONS = ("No description",)  # Written by save_ids for collections without one
+CHUNK_LINES = 20000  # Lines parsed per task
+POOL_THRESHOLD = 16 * 1024 * 1024  # Inputs of this many bytes or more are parsed in a process pool
+SHOWN_REJECTS = 10  # Rejected lines printed in the summary
+
+
+def detect_format(filename):
+    """Guesses the input format from a file name: .csv, .jsonl/.ndjson, else txt."""
+    extension = os.path.splitext(str(filename))[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    return "txt"
+
+
+def parse_chunk(grammar, fmt, items, id_column="id", description_column="description"):
+    """
+    Parses and validates one chunk of input.  Runs in worker processes for large inputs.
+
+    Args:
+        grammar (callable): Checks an ID (see NamingScheme.SchemeGrammar).
+        fmt (str): "txt", "jsonl" or "csv".
+        items (list): (line number, line) pairs, or (line number, row) pairs
+            for CSV, where id_column and description_column are column positions.
+        id_column, description_column: Field names (JSONL) or positions (CSV);
+            a description position of None means there is no such column.
+
+    Returns:
+        tuple: The accepted records as (line number, ID, description, kind,
+            counter key, number, ambiguous) tuples, the rejected lines as
+            (line number, text, reason) tuples, and the last line number.
+    """
+    accepted = []
+    rejected = []
+    for line_no, item in items:
+        if fmt == "txt":
+            text = item.strip()
+            if not text or text in HEADINGS:
+                continue
+            issued_id, _, description = text.partition(":")
+            issued_id, description = issued_id.strip(), description.strip()
+            if description in PLACEHOLDER_DESCRIPTIONS:
+                description = ""
+        elif fmt == "jsonl":
+            text = item.strip()
+            if not text:
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                rejected.append((line_no, text, "not valid JSON"))
+                continue
+            if not isinstance(row, dict):
+                rejected.append((line_no, text, "not a JSON object"))
+                continue
+            issued_id = str(row.get(id_column) or "").strip()
+            description = str(row.get(description_column) or "").strip()
+        else:
+            if not any(field.strip() for field in item):
+                continue
+            text = ",".join(item)
+            issued_id = item[id_column].strip() if id_column < len(item) else ""
+            description = ""
+            if description_column is not None and description_column < len(item):
+                description = item[description_column].strip()
+        if not issued_id:
+            rejected.append((line_no, text, "no ID"))
+            continue
+        if len(issued_id.split()) != 1:
+            rejected.append((line_no, text, "ID contains whitespace"))
+            continue
+        result = grammar(issued_id)
+        if isinstance(result, str):
+            rejected.append((line_no, text, result))
+            continue
+        accepted.append((line_no, issued_id, description) + result)
+    return accepted, rejected, items[-1][0] if items else 0
+
+
+def _read_chunks(f, fmt, id_column, description_column):
+    """
+    Splits an input stream into chunks for parse_chunk.
+
+    Yields:
+        tuple: The id and description columns to use, and a list of items.
+    """
+    if fmt != "csv":
+        start = 1
+        while True:
+            lines = list(itertools.islice(f, CHUNK_LINES))
+            if not lines:
+                return
+            yield id_column, description_column, list(enumerate(lines, start))
+            start += len(lines)
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    names = [name.strip().lower() for name in header]
+    if id_column.lower() not in names:
+        raise ValueError(f"No '{id_column}' column in the CSV header: {', '.join(header)}")
+    id_index = names.index(id_column.lower())
+    description_index = names.index(description_column.lower()) if description_column.lower() in names else None
+    while True:
+        rows = [(reader.line_num, row) for row in itertools.islice(reader, CHUNK_LINES)]
+        if not rows:
+            return
+        yield id_index, description_index, rows
+
+
+def _parse_chunks(grammar, fmt, chunks, workers):
+    """Parses chunks in order, in up to workers processes (in this process for workers <= 1)."""
+    if not workers or workers <= 1:
+        for id_column, description_column, items in chunks:
+            yield parse_chunk(grammar, fmt, items, id_column, description_column)
+        return
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = collections.deque()
+        for id_column, description_column, items in chunks:
+            futures.append(pool.submit(parse_chunk, grammar, fmt, items, id_column, description_column))
+            if len(futures) >= workers * 2:  # Bounded read-ahead keeps memory flat
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
+def import_ids(owner, filename, grammar, targets, fmt=None, id_column="id", description_column="description",
+               workers=None, chunk_size=10000, rejects_file=None, resolve_key=None):
+    """
+    Imports issued IDs from a file into a naming object and rebuilds its counters.
+
+    The input is streamed: it is cut into chunks that are parsed and
+    validated (in a process pool for large files), and the accepted IDs are
+    committed chunk_size at a time.  Each commit appends the IDs that are
+    not issued yet (checked with the owner's membership index) together with
+    their descriptions, and raises every counter touched to the highest
+    number seen for its key, so a single pass over the input is enough.
+
+    Args:
+        owner (CTINaming or VTNaming): The naming object to import into.
+        filename (str): The file to read, or "-" for stdin.
+        grammar (callable): Checks an ID and returns (kind, counter key,
+            number, ambiguous) or a reason string (see NamingScheme.SchemeGrammar).
+        targets (dict): Kind returned by the grammar -> NamingScheme.Target.
+        fmt (str, optional): "txt" (the "ID: description" lines written by
+            save_report_ids and save_ids), "csv" or "jsonl".  Guessed from the
+            file name by default.
+        id_column (str, optional): CSV column or JSON key holding the ID.
+        description_column (str, optional): CSV column or JSON key holding
+            the description.
+        workers (int, optional): Parser processes.  Defaults to one per CPU
+            for inputs of POOL_THRESHOLD bytes or more, else none.
+        chunk_size (int, optional): IDs committed per journal record.
+        rejects_file (str, optional): Write every rejected line, with its line
+            number and the reason, to this file.
+        resolve_key (callable, optional): Called with the kind and an ID whose
+            key the grammar reported as ambiguous; returns its counter key, or
+            None to keep the grammar's key.
+
+    Returns:
+        dict: Counts of lines, valid IDs, imported IDs, duplicates and
+            rejected lines, plus the elapsed seconds; or None if the file
+            cannot be read.
+    """
+    fmt = fmt or detect_format(filename)
+    if fmt not in FORMATS:
+        print(f"Error: Unknown import format '{fmt}'.  Use one of: {', '.join(FORMATS)}")
+        return None
+    if workers is None:
+        big = filename != "-" and os.path.exists(filename) and os.path.getsize(filename) >= POOL_THRESHOLD
+        workers = (os.cpu_count() or 1) if big else 0
+    stats = {"lines": 0, "valid": 0, "imported": 0, "duplicates": 0, "rejected": 0, "seconds": 0.0}
+    shown = []
+    seen = set()
+    pending = []
+    start = time.perf_counter()
+    try:
+        with _open_input(filename, fmt) as f, _open_rejects(rejects_file) as rejects:
+            chunks = _read_chunks(f, fmt, id_column, description_column)
+            for accepted, rejected, last_line in _parse_chunks(grammar, fmt, chunks, workers):
+                stats["lines"] = last_line
+                stats["rejected"] += len(rejected)
+                if rejects is not None:
+                    rejects.writelines(f"{line_no}\t{reason}\t{text}\n" for line_no, text, reason in rejected)
+                shown.extend(rejected[:SHOWN_REJECTS - len(shown)])
+                for record in accepted:
+                    if record[1] in seen:
+                        stats["duplicates"] += 1
+                        continue
+                    seen.add(record[1])
+                    pending.append(record)
+                if len(pending) >= chunk_size:
+                    _commit(owner, targets, pending, stats, resolve_key)
+                    pending = []
+            _commit(owner, targets, pending, stats, resolve_key)
+    except (OSError, ValueError) as e:
+        print(f"Error importing {filename}: {e}")
+        return None
+    stats["valid"] = len(seen)
+    stats["seconds"] = time.perf_counter() - start
+    owner.retire_counters()  # Imported counters of closed days go straight to the archive
+    _report(filename, stats, shown, rejects_file)
+    return stats
+
+
+def _open_input(filename, fmt):
+    if filename == "-":
+        return open(sys.stdin.fileno(), encoding="utf-8-sig", errors="replace", newline="", closefd=False)
+    # SharePoint and Excel exports often start with a byte order mark
+    return open(filename, encoding="utf-8-sig", errors="replace", newline="" if fmt == "csv" else None)
+
+
+def _open_rejects(rejects_file):
+    if not rejects_file:
+        return contextlib.nullcontext()
+    return open(rejects_file, "w", encoding="utf-8")
+
+
+def _commit(owner, targets, records, stats, resolve_key):
+    """Appends the records that are not issued yet and raises the counters, as one journal record."""
+    if not records:
+        return
+    with owner.store.transaction():
+        memberships = {kind: target.membership() for kind, target in targets.items()}
+        new_ids = collections.defaultdict(list)
+        descriptions = []
+        highest = {}  # (kind, key) -> highest number in this chunk
+        for line_no, issued_id, description, kind, key, number, ambiguous in records:
+            if ambiguous and resolve_key is not None:
+                key = resolve_key(kind, issued_id) or key
+            if highest.get((kind, key), 0) < number:
+                highest[kind, key] = number
+            if issued_id in memberships[kind]:
+                stats["duplicates"] += 1
+                continue
+            new_ids[kind].append(issued_id)
+            descriptions_field = targets[kind].descriptions_field
+            if description and descriptions_field:
+                descriptions.append(["put", descriptions_field, issued_id, description])
+        ops = []
+        for (kind, key), number in highest.items():
+            counts_field = targets[kind].counts_field
+            if getattr(owner, counts_field).get(key, 0) < number:
+                ops.append(["put", counts_field, key, number])
+        for kind, ids in new_ids.items():
+            ops.append(["extend", targets[kind].ids_field, ids])
+            stats["imported"] += len(ids)
+        if ops or descriptions:
+            owner.store.commit(ops + descriptions)
+
+
+def _report(filename, stats, shown, rejects_file):
+    seconds = max(stats["seconds"], 1e-9)
+    print(f"Imported {stats['imported']} IDs from {filename}: {stats['duplicates']} already issued, "
+          f"{stats['rejected']} lines rejected.")
+    print(f"Read {stats['lines']} lines in {stats['seconds']:.2f}s "
+          f"({stats['lines'] / seconds:,.0f} lines/s, {stats['valid'] / seconds:,.0f} IDs/s).")
+    for line_no, text, reason in shown:
+        print(f"  line {line_no}: {reason}: {text[:80]}")
+    if stats["rejected"] > len(shown):
+        more = f"; all are listed in {rejects_file}" if rejects_file else ""
+        print(f"  ... and {stats['rejected'] - len(shown)} more{more}")
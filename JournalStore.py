@@ -0,0 +1,564 @@
+import contextlib
+import json
+import os
+import threading
+import zlib
+from CompactIDs import CompactIDList, CompactIDMap
+from LazySnapshot import load_snapshot, verify_snapshot, write_snapshot
+from StorageBackend import CorruptStateError, StorageBackend
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def apply_ops(state, ops):
+    """
+    Applies a list of journal operations to a state mapping.
+
+    Each operation is a list whose first two items are the operation kind
+    and the name of the field it targets:
+
+        ["append", field, value]     appends value to the list in state[field]
+        ["extend", field, values]    appends all values to the list in state[field]
+        ["put", field, key, value]   sets state[field][key] = value
+        ["set", field, value]        sets state[field] = value
+        ["delete", field, key]       removes key from state[field], if present
+
+    Args:
+        state (dict): The mapping to update.  This can be a loaded config dict
+            or the ``vars()`` of a naming object.
+        ops (list): The operations to apply.
+    """
+    for op in ops:
+        kind, field = op[0], op[1]
+        if kind == "append":
+            state.setdefault(field, []).append(op[2])
+        elif kind == "extend":
+            state.setdefault(field, []).extend(op[2])
+        elif kind == "put":
+            state.setdefault(field, {})[op[2]] = op[3]
+        elif kind == "set":
+            state[field] = op[2]
+        elif kind == "delete":
+            state.get(field, {}).pop(op[2], None)
+
+
+def _encode_record(seq, ops):
+    """Formats a journal record as a line prefixed with the CRC-32 of its JSON."""
+    payload = json.dumps({"seq": seq, "ops": ops}, separators=(",", ":")).encode("utf-8")
+    return b"%08x " % zlib.crc32(payload) + payload + b"\n"
+
+
+def _decode_record(line):
+    """Returns the record on a complete journal line, or None if the line is damaged."""
+    payload = line[:-1]
+    if not payload.startswith(b"{"):
+        checksum, _, payload = payload.partition(b" ")
+        try:
+            if int(checksum, 16) != zlib.crc32(payload):
+                return None
+        except ValueError:
+            return None
+    # Lines starting with "{" were written before records carried a checksum.
+    try:
+        record = json.loads(payload)
+        if isinstance(record["seq"], int) and isinstance(record["ops"], list):
+            return record
+    except (ValueError, TypeError, KeyError):
+        pass
+    return None
+
+
+def _fsync_dir(path):
+    """Makes file creations and renames in the directory of path durable (a no-op on Windows)."""
+    if os.name == "nt":
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _lock_file(f):
+    """Blocks until an exclusive OS-level lock is held on the open file."""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue  # LK_LOCK gives up after ten seconds; keep waiting
+
+
+def _unlock_file(f):
+    """Releases a lock taken with _lock_file."""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class JournalStore(StorageBackend):
+    """
+    Persists naming state as a JSON snapshot plus an append-only journal.
+
+    Every mutation is written to the journal as a single fsync'd line, so the
+    cost of recording an allocation does not depend on how much history
+    exists.  Once enough records have piled up, the journal is rotated and a
+    fresh snapshot is written by a background thread.  Loading reads the
+    snapshot and replays whatever journal records it does not yet include.
+
+    Several processes may share one store.  Mutations happen inside
+    transaction(), which holds an OS-level lock on a ".lock" file and first
+    applies any records other processes appended since we last looked, so
+    counters are always bumped from their latest value.
+
+    Snapshots record where their ID lists and descriptions are stored, so
+    those are only parsed when first used (see LazySnapshot) and startup
+    cost stays flat as history grows.
+
+    Nothing is ever rewritten in place.  Snapshots are written to a temporary
+    file, fsync'd and renamed over the old one, which is kept as the previous
+    generation (".prev", with the journal records since it in
+    ".journal.prev").  Snapshots carry a CRC-32 and journal records one each,
+    so damage is detected at load time; the newest generation whose snapshot
+    is intact and whose journal has no missing records is used.  Recovery
+    reads at most two snapshots and three journals of about
+    compact_threshold records each, so its cost is bounded.
+    """
+    # Lazy fields keep the snapshot open, which would block replacing it on Windows.
+    lazy_load = os.name != "nt"
+
+    def __init__(self, owner, config_file, compact_threshold=10000):
+        """
+        Initializes the JournalStore.
+
+        Args:
+            owner (object): The naming object whose state is persisted.  Its
+                attributes must be named after the config keys, and it must
+                provide _config_snapshot() and load_config().
+            config_file (str): Path of the JSON snapshot.  The journal and the
+                lock file live next to it.
+            compact_threshold (int, optional): Number of journal records after
+                which a background compaction is started.
+        """
+        self.owner = owner
+        self.config_file = config_file
+        self.journal_file = config_file + ".journal"
+        self.old_journal_file = config_file + ".journal.old"
+        self.prev_file = config_file + ".prev"  # The previous snapshot generation
+        self.prev_journal_file = config_file + ".journal.prev"  # Records since the previous snapshot
+        self.lock_file = config_file + ".lock"
+        self.compact_threshold = compact_threshold
+        self.seq = 0  # Sequence number of the last record applied or written
+        self.journal_records = 0  # Records written since the last compaction
+        self.generation = None  # Journal generation our view is based on
+        self._offset = 0  # How far into the live journal we have read
+        self._reserved = {}  # (field, key) -> counter value before reserve(), until the next record
+        self._journal = None
+        self._lock_handle = None
+        self._lock_depth = 0
+        self._compactor = None
+        self._lock = threading.RLock()
+        self._missing = 0  # Records skipped over by the replays of the current load
+        self._damaged = 0  # Damaged records found (and skipped) by those replays
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Holds the store lock and brings the owner up to date with the journal.
+
+        Transactions nest; only the outermost one takes the OS-level lock.
+        """
+        with self._lock:
+            self._acquire()
+            try:
+                if self._lock_depth == 1:
+                    self._reserved.clear()
+                    self._sync()
+                yield
+            finally:
+                self._release()
+
+    def _acquire(self):
+        if self._lock_depth == 0:
+            if self._lock_handle is None:
+                self._lock_handle = open(self.lock_file, "a+b")
+            _lock_file(self._lock_handle)
+        self._lock_depth += 1
+
+    def _release(self):
+        self._lock_depth -= 1
+        if self._lock_depth == 0:
+            _unlock_file(self._lock_handle)
+
+    def _read_lock_state(self):
+        """Reads the journal bookkeeping kept in the lock file."""
+        self._lock_handle.seek(0)
+        data = self._lock_handle.read()
+        try:
+            return json.loads(data)
+        except ValueError:  # Empty, or torn by a crash; rebuilt by the next rotation
+            return {"generation": 0, "snapshot_seq": 0, "old_seq": 0}
+
+    def _write_lock_state(self, lock_state):
+        self._lock_handle.seek(0)
+        self._lock_handle.truncate()
+        self._lock_handle.write(json.dumps(lock_state).encode("utf-8"))
+        self._lock_handle.flush()
+        os.fsync(self._lock_handle.fileno())
+
+    def _sync(self):
+        """Applies journal records appended by other processes."""
+        if self._read_lock_state()["generation"] != self.generation:
+            # Another process rotated the journal under us; start over.
+            self.owner.load_config()
+            return
+        records, self._offset = self._replay(self.journal_file, vars(self.owner), self._offset)
+        self.journal_records += records
+
+    def load(self):
+        """
+        Loads the newest intact snapshot and replays the journal on top of it.
+
+        The current snapshot is tried first, then the previous generation.  A
+        generation is rejected if its snapshot fails the checksum or does not
+        parse, or if journal records after it are missing.  When the previous
+        generation is used, the damaged snapshot is moved aside to ".corrupt".
+
+        Returns:
+            dict: The merged configuration, or None if neither a snapshot nor
+                a journal exists.
+
+        Raises:
+            CorruptStateError: If no generation can be recovered.
+        """
+        with self._lock:
+            self._acquire()
+            try:
+                self._close_journal()
+                self.generation = self._read_lock_state()["generation"]
+                snapshots = [path for path in (self.config_file, self.prev_file) if os.path.exists(path)]
+                if not snapshots and not any(os.path.exists(path) for path in self._journal_files()):
+                    return None
+                errors = []
+                for path in snapshots or [None]:
+                    try:
+                        config = self._recover(path)
+                    except CorruptStateError as e:
+                        errors.append(f"{path or self.journal_file}: {e}")
+                        print(f"Warning: Cannot load {path or self.journal_file}: {e}")
+                        continue
+                    if path == self.prev_file and os.path.exists(self.config_file):
+                        os.replace(self.config_file, self.config_file + ".corrupt")
+                        _fsync_dir(self.config_file)
+                        print(f"Recovered from {path}.  The damaged snapshot was moved to {self.config_file}.corrupt")
+                    return config
+                raise CorruptStateError("No intact copy of the state was found (" + "; ".join(errors) + ")")
+            finally:
+                self._release()
+
+    def _journal_files(self):
+        """The journal files, oldest records first."""
+        return self.prev_journal_file, self.old_journal_file, self.journal_file
+
+    def _recover(self, path):
+        """
+        Loads one snapshot generation and replays the journals on top of it.
+
+        Args:
+            path (str): The snapshot, or None to rebuild from the journals alone.
+
+        Returns:
+            dict: The configuration.
+
+        Raises:
+            CorruptStateError: If the snapshot is damaged or records are missing.
+        """
+        config = {}
+        if path is not None:
+            if verify_snapshot(path) is False:
+                raise CorruptStateError("checksum mismatch")
+            try:
+                config = load_snapshot(path, self._lazy_fields() if self.lazy_load else ())
+            except (ValueError, AttributeError) as e:
+                raise CorruptStateError(f"not a valid snapshot ({e})") from e
+        self._compact_fields(config)
+        self.seq = config.pop("journal_seq", 0)
+        self._missing = self._damaged = 0
+        self._replay(self.prev_journal_file, config)  # Only needed when starting from the previous snapshot
+        self.journal_records, _ = self._replay(self.old_journal_file, config)
+        records, self._offset = self._replay(self.journal_file, config)
+        self.journal_records += records
+        if self._missing > self._damaged:
+            raise CorruptStateError(f"{self._missing - self._damaged} journal records after it are missing")
+        return config
+
+    def _lazy_fields(self):
+        """Names of the owner's list and map fields, which snapshots store for lazy loading."""
+        state_fields = getattr(self.owner, "STATE_FIELDS", {})
+        return [name for name, kind in state_fields.items() if kind in ("list", "map")]
+
+    def _compact_fields(self, config):
+        """Stores the owner's ID lists and ID-keyed dicts in their compact forms (see CompactIDs)."""
+        for name, kind in getattr(self.owner, "STATE_FIELDS", {}).items():
+            value = config.get(name)
+            if kind == "list" and (value is None or isinstance(value, list)):
+                config[name] = CompactIDList(value or ())
+            elif kind == "map" and (value is None or isinstance(value, dict)):
+                config[name] = CompactIDMap(value or {})
+
+    def _replay(self, path, state, offset=0):
+        """
+        Applies the records of one journal file that are newer than self.seq.
+
+        A torn or damaged final line (left by a crash mid-append) is cut off so
+        that the next append starts on a clean line.  A damaged record followed
+        by intact ones is skipped with a warning; records skipped over are
+        counted in self._missing.
+
+        Args:
+            path (str): The journal file to read.
+            state (dict): The mapping to apply the records to.
+            offset (int, optional): Byte offset to start reading from.
+
+        Returns:
+            tuple: The number of records read and the offset just past them.
+        """
+        if not os.path.exists(path):
+            return 0, 0
+        records = 0
+        good_offset = offset
+        damaged = 0  # Damaged lines since the last intact record
+        with open(path, "rb") as f:
+            f.seek(offset)
+            pos = offset
+            for line in f:
+                pos += len(line)
+                record = _decode_record(line) if line.endswith(b"\n") else None
+                if record is None:
+                    damaged += 1
+                    continue
+                if damaged:
+                    print(f"Warning: Skipping {damaged} damaged record(s) in {path}.")
+                    self._damaged += damaged
+                    damaged = 0
+                good_offset = pos
+                records += 1
+                if record["seq"] > self.seq:
+                    self._missing += record["seq"] - self.seq - 1
+                    apply_ops(state, record["ops"])
+                    self.seq = record["seq"]
+        if good_offset < os.path.getsize(path):
+            print(f"Warning: Discarding incomplete record at the end of {path}.")
+            with open(path, "r+b") as f:
+                f.truncate(good_offset)
+        return records, good_offset
+
+    def reserve(self, field, key, count=1, floor=0):
+        """
+        Bumps an in-memory counter of the owner.  Must be called inside transaction().
+
+        The new value is persisted by the "put" operation the caller commits
+        together with the IDs built from the reserved numbers.
+
+        Returns:
+            int: The first reserved number.
+        """
+        counts = getattr(self.owner, field)
+        self._reserved.setdefault((field, key), counts.get(key))
+        first = max(counts.get(key, 0), floor) + 1
+        counts[key] = first + count - 1
+        return first
+
+    def commit(self, ops):
+        """
+        Journals operations as one record and then applies them to the owner's state.
+
+        If the record cannot be written, the state is left as it was
+        (including counters bumped by reserve()) and the OSError is raised.
+
+        Args:
+            ops (list): The operations (see apply_ops).
+        """
+        with self.transaction():
+            self._write_record(ops)
+            apply_ops(vars(self.owner), ops)
+            self._compact_if_due()
+
+    def append(self, ops):
+        """
+        Durably appends one record to the journal.
+
+        Callers that read state to build ops (e.g. to bump a counter) must
+        hold transaction() around both the read and the append.
+
+        Args:
+            ops (list): The operations making up the record (see apply_ops).
+        """
+        with self.transaction():
+            self._write_record(ops)
+            self._compact_if_due()
+
+    def _write_record(self, ops):
+        """
+        Writes and fsyncs one record; self.seq only moves once it is durable.
+
+        On failure (e.g. ENOSPC) the journal is cut back to where the record
+        started, so a partly written record can never be replayed later, and
+        the counters reserved for it are given back.  If even that fails, the
+        next transaction replays whatever reached the disk, so the numbers
+        stay taken rather than being issued twice.
+        """
+        seq = self.seq + 1
+        line = _encode_record(seq, ops)
+        try:
+            created = False
+            if self._journal is None:
+                created = not os.path.exists(self.journal_file)
+                self._journal = open(self.journal_file, "ab")
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            if created:
+                _fsync_dir(self.journal_file)
+        except OSError:
+            if self._discard_unwritten():
+                for (field, key), value in self._reserved.items():
+                    counts = getattr(self.owner, field)
+                    if value is None:
+                        counts.pop(key, None)
+                    else:
+                        counts[key] = value
+            self._reserved.clear()
+            raise
+        self.seq = seq
+        self._offset += len(line)
+        self.journal_records += 1
+        self._reserved.clear()
+
+    def _discard_unwritten(self):
+        """Cuts the live journal back to self._offset; returns whether that worked."""
+        with contextlib.suppress(OSError):
+            self._close_journal()  # Its buffer still holds the failed record
+        self._journal = None
+        try:
+            if os.path.exists(self.journal_file):
+                with open(self.journal_file, "r+b") as f:
+                    f.truncate(self._offset)
+                    os.fsync(f.fileno())
+        except OSError as e:
+            print(f"Warning: Could not remove a failed record from {self.journal_file}: {e}")
+            return False
+        return True
+
+    def _compact_if_due(self):
+        if self.journal_records >= self.compact_threshold:
+            self.compact()
+
+    def compact(self, wait=False):
+        """
+        Rotates the journal and writes a new snapshot in the background.
+
+        Args:
+            wait (bool, optional): Block until the snapshot has been written.
+        """
+        with self.transaction():
+            running = self._compactor is not None and self._compactor.is_alive()
+            if not running and self.journal_records:
+                config = self.owner._config_snapshot()
+                config["journal_seq"] = self.seq
+                self._rotate_journal()
+                self._compactor = threading.Thread(target=self._write_snapshot, args=(config,), daemon=True)
+                self._compactor.start()
+            compactor = self._compactor
+        if wait and compactor is not None:
+            compactor.join()
+
+    def _rotate_journal(self):
+        """Moves the live journal aside so appends can continue during compaction."""
+        self._close_journal()
+        lock_state = self._read_lock_state()
+        if os.path.exists(self.journal_file):
+            if os.path.exists(self.old_journal_file):
+                # A previous compaction has not finished; keep its records too.
+                with open(self.journal_file, "rb") as src, open(self.old_journal_file, "ab") as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.journal_file)
+            else:
+                os.replace(self.journal_file, self.old_journal_file)
+            _fsync_dir(self.journal_file)
+        lock_state["generation"] += 1
+        lock_state["old_seq"] = self.seq
+        self._write_lock_state(lock_state)
+        self.generation = lock_state["generation"]
+        self._offset = 0
+        self.journal_records = 0
+
+    def _write_snapshot(self, config):
+        """
+        Writes a snapshot and retires the journal records it supersedes.
+
+        The snapshot is written to a temporary file and fsync'd before it
+        replaces the current one, which becomes the previous generation; the
+        retired journal becomes its ".journal.prev".  The steps are ordered so
+        that a crash between any two of them leaves a loadable generation.
+        """
+        tmp_file = f"{self.config_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                write_snapshot(f, config, self._lazy_fields())
+                f.flush()
+                os.fsync(f.fileno())
+            with self.transaction():
+                lock_state = self._read_lock_state()
+                if config["journal_seq"] <= lock_state["snapshot_seq"]:
+                    os.remove(tmp_file)  # A newer snapshot is already in place
+                    return
+                retire = lock_state["old_seq"] <= config["journal_seq"] and os.path.exists(self.old_journal_file)
+                if os.path.exists(self.config_file):
+                    if retire:
+                        os.replace(self.old_journal_file, self.prev_journal_file)
+                    os.replace(self.config_file, self.prev_file)
+                elif retire:
+                    # No current snapshot (e.g. it was damaged): the previous one still needs these records.
+                    if os.path.exists(self.prev_file):
+                        with open(self.old_journal_file, "rb") as src, open(self.prev_journal_file, "ab") as dst:
+                            dst.write(src.read())
+                            dst.flush()
+                            os.fsync(dst.fileno())
+                    os.remove(self.old_journal_file)
+                os.replace(tmp_file, self.config_file)
+                _fsync_dir(self.config_file)
+                lock_state["snapshot_seq"] = config["journal_seq"]
+                self._write_lock_state(lock_state)
+        except Exception as e:
+            print(f"Error compacting journal: {e}")
+            with contextlib.suppress(OSError):
+                os.remove(tmp_file)
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def close(self):
+        """Waits for a running compaction and closes the journal and lock file."""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            self._close_journal()
+            if self._lock_handle is not None and self._lock_depth == 0:
+                self._lock_handle.close()
+                self._lock_handle = None
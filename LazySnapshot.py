@@ -0,0 +1,395 @@
+import itertools
+import json
+import os
+import threading
+import zlib
+from collections.abc import Mapping, MutableMapping, MutableSequence
+from CompactIDs import CompactIDList, CompactIDMap
+
+LAYOUT_KEY = "snapshot_layout"  # Last key of a snapshot, locating its large fields
+LAYOUT_TAIL = 4096  # Bytes at the end of a snapshot searched for the layout
+CHUNK_SIZE = 1 << 20  # Bytes read at a time when streaming a field
+
+
+def write_snapshot(f, config, lazy_fields=()):
+    """
+    Writes a configuration as indented JSON that can be loaded lazily.
+
+    The output is ordinary JSON in the same style as json.dump(indent=4), so
+    the file can still be read and edited by hand.  The large fields are
+    written last, one item per line, and a final "snapshot_layout" key records
+    the byte range of each of them so load_snapshot() can skip them, and a
+    CRC-32 of everything before it so verify_snapshot() can detect damage.
+
+    Args:
+        f (file): A binary file to write to.
+        config (dict): The configuration.
+        lazy_fields (iterable, optional): Names of the list and dict fields
+            that may be loaded lazily.
+    """
+    lazy_fields = set(lazy_fields)
+    names = [name for name in config if name not in lazy_fields] + [name for name in config if name in lazy_fields]
+    layout = {}
+    pos = 0
+    crc = 0
+
+    def emit(data):
+        nonlocal pos, crc
+        f.write(data)
+        pos += len(data)
+        crc = zlib.crc32(data, crc)
+
+    emit(b"{\n")
+    for name in names:
+        value = config[name]
+        emit(b"    " + json.dumps(name).encode("ascii") + b": ")
+        if name in lazy_fields:
+            start = pos
+            if isinstance(value, Mapping):
+                opening, closing = b"{", b"}"
+                lines = (f"{json.dumps(key)}: {json.dumps(item)}" for key, item in value.items())
+            else:
+                opening, closing = b"[", b"]"
+                lines = (json.dumps(item) for item in value)
+            emit(opening)
+            count = 0
+            batch = []
+            for line in lines:
+                batch.append(line)
+                if len(batch) >= 10000:
+                    emit(_item_lines(batch, count))
+                    count += len(batch)
+                    batch = []
+            if batch:
+                emit(_item_lines(batch, count))
+                count += len(batch)
+            emit(b"\n    " + closing if count else closing)
+            layout[name] = [start, pos, count]
+        else:
+            emit(json.dumps(value, indent=4).replace("\n", "\n    ").encode("ascii"))
+        emit(b",\n")
+    emit(b"    ")
+    offset, checksum = pos, crc  # The layout covers everything before its key
+    emit(json.dumps(LAYOUT_KEY).encode("ascii") + b": ")
+    emit(json.dumps({"offset": offset, "fields": layout, "crc32": checksum}).encode("ascii") + b"\n}\n")
+
+
+def _item_lines(batch, written):
+    """Formats a batch of items, one per line, continuing after written earlier items."""
+    return (("\n" if not written else ",\n") + "        " + ",\n        ".join(batch)).encode("ascii")
+
+
+def load_snapshot(path, lazy_fields=()):
+    """
+    Loads a snapshot, leaving its large fields on disk until they are used.
+
+    Fields listed in lazy_fields whose byte range is recorded in the
+    snapshot layout come back as LazyList or LazyDict objects reading from
+    the file; everything else is parsed as usual.  Snapshots without a valid
+    layout (e.g. older or hand-edited files) are parsed in full.
+
+    Args:
+        path (str): The snapshot file.
+        lazy_fields (iterable, optional): Names of the fields that may be
+            loaded lazily.
+
+    Returns:
+        dict: The configuration, without the layout key.
+
+    Raises:
+        json.JSONDecodeError: If the snapshot is not valid JSON.
+    """
+    lazy_fields = set(lazy_fields)
+    f = open(path, "rb")
+    try:
+        layout = _read_layout(f) if lazy_fields else None
+        ranges = sorted((start, end, count, name) for name, (start, end, count) in (layout or {}).items()
+                        if name in lazy_fields)
+        if not ranges:
+            f.seek(0)
+            config = json.loads(f.read())
+            config.pop(LAYOUT_KEY, None)
+            return config
+        # Parse the small fields with the large ones replaced by null.
+        parts = []
+        pos = 0
+        for start, end, count, name in ranges:
+            f.seek(pos)
+            parts.append(f.read(start - pos))
+            parts.append(b"null")
+            pos = end
+        f.seek(pos)
+        parts.append(f.read())
+        config = json.loads(b"".join(parts))
+        config.pop(LAYOUT_KEY, None)
+    except BaseException:
+        f.close()
+        raise
+    source = SnapshotSource(f)
+    for start, end, count, name in ranges:
+        f.seek(start)
+        if f.read(1) == b"{":
+            config[name] = LazyDict(source, start, end, count)
+        else:
+            config[name] = LazyList(source, start, end, count)
+    return config
+
+
+def verify_snapshot(path):
+    """
+    Checks a snapshot against the checksum recorded in its layout.
+
+    Args:
+        path (str): The snapshot file.
+
+    Returns:
+        bool: True if the checksum matches, False if it does not, or None if
+            there is nothing to check against (a snapshot written before
+            checksums were added, or one whose layout was edited away).
+    """
+    with open(path, "rb") as f:
+        layout = _read_layout_record(f)
+        if layout is None or not isinstance(layout.get("crc32"), int):
+            return None
+        f.seek(0)
+        remaining = layout["offset"]
+        crc = 0
+        while remaining > 0:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                return False
+            crc = zlib.crc32(data, crc)
+            remaining -= len(data)
+        return crc == layout["crc32"]
+
+
+def _read_layout_record(f):
+    """Returns the layout entry at the end of a snapshot, or None if it is missing or does not sit where it says."""
+    size = os.fstat(f.fileno()).st_size
+    f.seek(max(0, size - LAYOUT_TAIL))
+    tail = f.read()
+    at = tail.rfind(json.dumps(LAYOUT_KEY).encode("ascii") + b": ")
+    if at < 0:
+        return None
+    try:
+        layout, _ = json.JSONDecoder().raw_decode(tail[at + len(LAYOUT_KEY) + 4:].decode("ascii"))
+        if layout["offset"] != size - len(tail) + at or not isinstance(layout["fields"], dict):
+            return None  # Something before the layout was edited
+    except (ValueError, TypeError, KeyError):
+        return None
+    return layout
+
+
+def _read_layout(f):
+    """Returns the field ranges recorded at the end of a snapshot, or None if they are missing or stale."""
+    layout = _read_layout_record(f)
+    if layout is None:
+        return None
+    offset = layout["offset"]
+    fields = layout["fields"]
+    for start, end, count in fields.values():
+        if not 0 < start < end <= offset:
+            return None
+        f.seek(start)
+        opening = f.read(1)
+        f.seek(end - 1)
+        if (opening, f.read(1)) not in ((b"[", b"]"), (b"{", b"}")):
+            return None
+    return fields
+
+
+class SnapshotSource:
+    """An open snapshot file shared by the lazy fields loaded from it."""
+    def __init__(self, f):
+        self._file = f
+        self._lock = threading.Lock()
+
+    def read(self, start, end):
+        """Returns the bytes in [start, end)."""
+        with self._lock:
+            self._file.seek(start)
+            return self._file.read(end - start)
+
+    def iter_items(self, start, end):
+        """
+        Streams the item lines of a field written by write_snapshot.
+
+        Yields:
+            bytes: Comma-separated JSON items (list values or "key": value
+                pairs), a chunk at a time.
+        """
+        pos = start + 1  # Skip the opening bracket
+        end -= 1  # and the closing one
+        rest = b""
+        while pos < end:
+            chunk = rest + self.read(pos, min(pos + CHUNK_SIZE, end))
+            pos = min(pos + CHUNK_SIZE, end)
+            cut = chunk.rfind(b"\n") if pos < end else len(chunk)
+            if cut < 0:
+                rest = chunk
+                continue
+            rest = chunk[cut:]
+            items = chunk[:cut].strip().strip(b",")
+            if items:
+                yield items
+
+
+class LazyList(MutableSequence):
+    """
+    A list of issued IDs from a snapshot that is parsed on first use.
+
+    Appending, taking the length and iterating do not parse the field:
+    appended items are kept aside and iteration streams the file.  Any other
+    access loads the whole list into memory once, as a CompactIDList.
+    """
+    def __init__(self, source, start, end, count):
+        self._source = source
+        self._range = (start, end)
+        self._count = count  # Items in the snapshot
+        self._tail = []  # Items appended since the snapshot
+        self._items = None  # The full list, once loaded
+
+    def _load(self):
+        if self._items is None:
+            items = CompactIDList()
+            for chunk in self._source.iter_items(*self._range):
+                items.extend(json.loads(b"[" + chunk + b"]"))
+            items.extend(self._tail)
+            self._items = items
+            self._source = self._tail = None
+        return self._items
+
+    def loaded(self):
+        """Tells whether the list has been parsed into memory."""
+        return self._items is not None
+
+    def copy(self):
+        """Returns a shallow copy that is still lazy if this list is."""
+        if self._items is not None:
+            return self._items.copy()
+        other = LazyList(self._source, *self._range, self._count)
+        other._tail = list(self._tail)
+        return other
+
+    def __len__(self):
+        if self._items is not None:
+            return len(self._items)
+        return self._count + len(self._tail)
+
+    def __getitem__(self, index):
+        if self._items is None and isinstance(index, int) and index < 0 and -index <= len(self._tail):
+            return self._tail[index]  # e.g. the last issued ID
+        return self._load()[index]
+
+    def __setitem__(self, index, value):
+        self._load()[index] = value
+
+    def __delitem__(self, index):
+        del self._load()[index]
+
+    def insert(self, index, value):
+        self._load().insert(index, value)
+
+    def append(self, value):
+        (self._tail if self._items is None else self._items).append(value)
+
+    def extend(self, values):
+        (self._tail if self._items is None else self._items).extend(values)
+
+    def __iter__(self):
+        if self._items is not None:
+            yield from self._items
+            return
+        source, (start, end), tail = self._source, self._range, list(self._tail)
+        for items in source.iter_items(start, end):
+            yield from json.loads(b"[" + items + b"]")
+        yield from tail
+
+    def iter_from(self, start):
+        """Iterates from position start; items appended since the snapshot are reached without parsing it."""
+        if self._items is None and start >= self._count:
+            return iter(self._tail[start - self._count:])
+        return itertools.islice(self, start, None)
+
+    def __contains__(self, value):
+        return any(item == value for item in self)
+
+    def __eq__(self, other):
+        return isinstance(other, (list, LazyList)) and len(self) == len(other) and list(self) == list(other)
+
+    def __repr__(self):
+        state = "loaded" if self._items is not None else "not loaded"
+        return f"<LazyList of {len(self)} items, {state}>"
+
+
+class LazyDict(MutableMapping):
+    """
+    A dict keyed by issued IDs (e.g. descriptions) from a snapshot that is
+    parsed on first use.
+
+    Setting keys and iterating do not parse the field: new values are kept
+    aside and iteration streams the file.  Lookups load the whole dict into
+    memory once, as a CompactIDMap.
+    """
+    def __init__(self, source, start, end, count):
+        self._source = source
+        self._range = (start, end)
+        self._count = count  # Entries in the snapshot
+        self._pending = {}  # Entries set since the snapshot
+        self._items = None  # The full dict, once loaded
+
+    def _load(self):
+        if self._items is None:
+            items = CompactIDMap()
+            for chunk in self._source.iter_items(*self._range):
+                items.update(json.loads(b"{" + chunk + b"}"))
+            items.update(self._pending)
+            self._items = items
+            self._source = self._pending = None
+        return self._items
+
+    def loaded(self):
+        """Tells whether the dict has been parsed into memory."""
+        return self._items is not None
+
+    def copy(self):
+        """Returns a shallow copy that is still lazy if this dict is."""
+        if self._items is not None:
+            return self._items.copy()
+        other = LazyDict(self._source, *self._range, self._count)
+        other._pending = dict(self._pending)
+        return other
+
+    def __getitem__(self, key):
+        if self._items is None and key in self._pending:
+            return self._pending[key]
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        (self._pending if self._items is None else self._items)[key] = value
+
+    def __delitem__(self, key):
+        del self._load()[key]
+
+    def __len__(self):
+        if self._items is None and not self._pending:
+            return self._count
+        return len(self._load())
+
+    def __iter__(self):
+        for key, _ in self.items():
+            yield key
+
+    def items(self):
+        if self._items is not None:
+            yield from self._items.items()
+            return
+        source, (start, end), pending = self._source, self._range, dict(self._pending)
+        for items in source.iter_items(start, end):
+            for key, value in json.loads(b"{" + items + b"}").items():
+                yield key, pending.pop(key, value)
+        yield from pending.items()
+
+    def __repr__(self):
+        state = "loaded" if self._items is not None else "not loaded"
+        return f"<LazyDict of {self._count} snapshot entries, {state}>"
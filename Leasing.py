@@ -0,0 +1,391 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+import uuid
+import NamingScheme
+
+DEFAULT_TTL = 7 * 24 * 3600  # Seconds a lease stays usable unless given otherwise
+MAX_BLOCK = 100000  # Most numbers leased at once
+
+
+def _timestamp(seconds):
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _seconds(timestamp):
+    return datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=datetime.timezone.utc).timestamp()
+
+
+class Lease:
+    """
+    A block of sequence numbers leased to a worker by the master configuration.
+
+    IDs are numbered from the block in memory, so a sandbox worker can issue
+    them at full speed, or on a host without access to the configuration,
+    and report them back later (see report() and reconcile()).
+
+    Numbers are handed out in order.  With a path, the lease is kept in a
+    file that is rewritten before each run of checkpoint numbers is handed
+    out (write-ahead), so a worker restarted from that file never repeats a
+    number, whatever the moment it crashed.  Numbers handed out since the
+    last save() are then skipped rather than reused.  Without a path nothing
+    is written at all.
+
+    Once the lease expires, or after the final report, it issues no more IDs.
+    """
+    def __init__(self, record, path=None, checkpoint=1000):
+        """
+        Args:
+            record (dict): The lease as written by to_dict(), e.g. loaded from
+                a lease file or returned by the naming service.
+            path (str, optional): File to keep the lease in.
+            checkpoint (int, optional): Numbers handed out per write-ahead
+                save when a path is given.
+        """
+        self.lease_id = record["lease_id"]
+        self.kind = record["kind"]
+        self.key = record["key"]
+        self.prefix = record["prefix"]
+        self.width = record["width"]
+        self.first = record["first"]
+        self.last = record["last"]
+        self.expires = record["expires"]
+        self.holder = record.get("holder")
+        self.next = max(record.get("next", self.first), self.first)  # First number not handed out yet
+        self.ids = list(record.get("ids", ()))
+        self.descriptions = dict(record.get("descriptions", {}))
+        self.closed = record.get("closed", False)
+        self.path = path
+        self.checkpoint = max(int(checkpoint), 1)
+        self._expires_at = _seconds(self.expires)
+        self._number_format = f"0{self.width}d"
+        # Numbers up to here may be handed out without writing anything first.
+        self._persisted_to = self.last if not path and not self.closed else self.next - 1
+
+    @classmethod
+    def load(cls, path, checkpoint=1000):
+        """
+        Opens a lease file written by save() or by the --lease command line option.
+
+        Args:
+            path (str): The lease file.
+            checkpoint (int, optional): See __init__.
+
+        Returns:
+            Lease: The lease, or None if the file cannot be read.
+        """
+        try:
+            with open(path) as f:
+                return cls(json.load(f), path, checkpoint)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error: Cannot read lease file {path}: {e}")
+            return None
+
+    def to_dict(self, next_number=None):
+        """Returns the lease as a JSON-serializable dict (the lease file format and the report format)."""
+        return {
+            "lease_id": self.lease_id,
+            "kind": self.kind,
+            "key": self.key,
+            "prefix": self.prefix,
+            "width": self.width,
+            "first": self.first,
+            "last": self.last,
+            "next": self.next if next_number is None else next_number,
+            "expires": self.expires,
+            "holder": self.holder,
+            "closed": self.closed,
+            "ids": self.ids,
+            "descriptions": self.descriptions,
+        }
+
+    def save(self, path=None):
+        """
+        Writes the lease to its file, replacing any previous copy atomically.
+
+        Args:
+            path (str, optional): Where to write.  Defaults to the lease's path,
+                which it becomes.
+
+        Returns:
+            bool: True if the file was written.
+        """
+        path = path or self.path
+        if not path or not self._write(path, self.next):
+            return False
+        self.path = path
+        self._persisted_to = self.next - 1
+        return True
+
+    def _write(self, path, next_number):
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                json.dump(self.to_dict(next_number), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, path)
+        except OSError as e:
+            print(f"Error saving lease {self.lease_id}: {e}")
+            return False
+        return True
+
+    @property
+    def remaining(self):
+        """Numbers of the block not handed out yet."""
+        return self.last - self.next + 1
+
+    def expired(self, now=None):
+        """Tells whether the lease has expired (at now, in seconds since the epoch, default the current time)."""
+        return (time.time() if now is None else now) >= self._expires_at
+
+    def next_id(self, description=None):
+        """
+        Issues the next ID of the block.
+
+        Args:
+            description (str, optional): Description of the collection, passed
+                on to the master configuration by reconcile().
+
+        Returns:
+            str: The ID, or None if the lease is used up, expired or closed.
+        """
+        if time.time() >= self._expires_at:
+            print(f"Error: Lease {self.lease_id} expired at {self.expires}.")
+            return None
+        number = self.next
+        if number > self._persisted_to and not self._advance():
+            return None
+        self.next = number + 1
+        issued_id = self.prefix + format(number, self._number_format)
+        self.ids.append(issued_id)
+        if description:
+            self.descriptions[issued_id] = description
+        return issued_id
+
+    def next_ids(self, count, description=None):
+        """
+        Issues up to count IDs at once.
+
+        Returns:
+            list: The IDs; shorter than count if the lease ran out.
+        """
+        ids = []
+        for _ in range(count):
+            issued_id = self.next_id(description)
+            if issued_id is None:
+                break
+            ids.append(issued_id)
+        return ids
+
+    def _advance(self):
+        """Makes the next run of numbers available, persisting it first if the lease has a file."""
+        if self.closed:
+            print(f"Error: Lease {self.lease_id} was closed by its final report.")
+            return False
+        if self.next > self.last:
+            print(f"Error: Lease {self.lease_id} is used up ({self.first}-{self.last}).")
+            return False
+        if not self.path:
+            self._persisted_to = self.last
+            return True
+        persisted_to = min(self.last, self.next + self.checkpoint - 1)
+        # A worker restarted from the file resumes after the whole run, so it cannot repeat a number.
+        if not self._write(self.path, persisted_to + 1):
+            return False
+        self._persisted_to = persisted_to
+        return True
+
+    def report(self, final=True):
+        """
+        Returns the report to pass to reconcile() on the master.
+
+        Args:
+            final (bool, optional): Close the lease: it issues no more IDs, and
+                the master may take back the numbers it did not use.  With
+                final false, the IDs issued so far are recorded and the lease
+                stays open.
+
+        Returns:
+            dict: The lease with the IDs it issued.
+        """
+        if final and not self.closed:
+            self.closed = True
+            self._persisted_to = self.next - 1  # Nothing more is handed out
+            self.save()
+        return self.to_dict()
+
+
+def lease(owner, kind, fields, count, ttl=DEFAULT_TTL, holder=None):
+    """
+    Leases a block of numbers for the IDs with the given field values.
+
+    The counter is advanced past the block in the same journal record that
+    stores the lease, so the master never numbers these IDs itself.
+
+    Args:
+        owner (VTNaming): The naming object, providing scheme(), target() and leases.
+        kind (str): The kind of ID, e.g. "collections".
+        fields (dict): The validated field values, including "date".
+        count (int): Size of the block.
+        ttl (float, optional): Seconds until the lease expires.
+        holder (str, optional): Name of the worker, for listings.
+
+    Returns:
+        Lease: The lease, without a file (see Lease.save), or None on error.
+    """
+    if not 1 <= count <= MAX_BLOCK:
+        print(f"Error: A lease covers 1 to {MAX_BLOCK} numbers, not {count}.")
+        return None
+    if ttl <= 0:
+        print("Error: The lease time must be positive.")
+        return None
+    with owner.store.transaction():
+        scheme = owner.scheme(kind)
+        target = owner.target(kind)
+        key = scheme.key(fields)
+        first = NamingScheme.reserve(owner, kind, fields, count)
+        now = time.time()
+        record = {
+            "lease_id": uuid.uuid4().hex,
+            "kind": kind,
+            "key": key,
+            "prefix": scheme.prefix(fields),
+            "width": scheme.width,
+            "first": first,
+            "last": first + count - 1,
+            "expires": _timestamp(now + ttl),
+            "holder": holder,
+            "created": _timestamp(now),
+        }
+        owner.store.commit([
+            ["put", target.counts_field, key, record["last"]],
+            ["put", "leases", record["lease_id"], record],
+        ])
+    return Lease(record)
+
+
+def reconcile(owner, report, final=None):
+    """
+    Records the IDs a lease issued and, on the final report, closes the lease.
+
+    IDs outside the block, or numbered at or after the report's next number,
+    are rejected; IDs already recorded (e.g. by an earlier report) are
+    skipped.  On the final report, the unused numbers at the end of the
+    block are given back if the counter has not moved past the block since
+    and the lease has not expired; otherwise they are left unused, so a
+    number is never issued twice.
+
+    Args:
+        owner (VTNaming): The naming object.
+        report (dict or Lease): The report returned by Lease.report().
+        final (bool, optional): Whether to close the lease.  Defaults to the
+            report's "closed" flag.
+
+    Returns:
+        dict: "imported", "skipped" and "rejected" ID counts and the number of
+            "returned" numbers, or None if the lease is unknown.
+    """
+    if isinstance(report, Lease):
+        report = report.to_dict()
+    lease_id = report.get("lease_id")
+    final = report.get("closed", False) if final is None else final
+    with owner.store.transaction():  # Catch up with other processes
+        record = owner.leases.get(lease_id)
+        if record is None:
+            print(f"Error: Unknown lease {lease_id}; it may have been reconciled already.")
+            return None
+        kind, prefix, first, last = record["kind"], record["prefix"], record["first"], record["last"]
+        target = owner.target(kind)
+        membership = target.membership()
+        next_number = min(max(int(report.get("next", first)), first), last + 1)
+        descriptions = report.get("descriptions") or {}
+        number_format = f"0{record['width']}d"
+        new_ids = []
+        seen = set()
+        skipped = rejected = 0
+        for issued_id in report.get("ids", ()):
+            number = issued_id[len(prefix):] if isinstance(issued_id, str) and issued_id.startswith(prefix) else ""
+            if not (number.isascii() and number.isdigit() and first <= int(number) < next_number
+                    and number == format(int(number), number_format)):
+                print(f"Warning: {issued_id} is not part of lease {lease_id} ({prefix}{first}-{last}); rejected.")
+                rejected += 1
+            elif issued_id in seen or issued_id in membership:
+                skipped += 1
+            else:
+                seen.add(issued_id)
+                new_ids.append(issued_id)
+        ops = []
+        if new_ids:
+            ops.append(["extend", target.ids_field, new_ids])
+        if target.descriptions_field:
+            ops += [["put", target.descriptions_field, issued_id, descriptions[issued_id]]
+                    for issued_id in new_ids if descriptions.get(issued_id)]
+        returned = 0
+        if final:
+            counts = getattr(owner, target.counts_field)
+            if counts.get(record["key"]) == last and next_number <= last and time.time() < _seconds(record["expires"]):
+                returned = last - next_number + 1
+                ops.append(["put", target.counts_field, record["key"], next_number - 1])
+            ops.append(["delete", "leases", lease_id])
+        if ops:
+            owner.store.commit(ops)
+    return {"imported": len(new_ids), "skipped": skipped, "rejected": rejected, "returned": returned}
+
+
+def expired_leases(owner, now=None):
+    """
+    Lists the leases that expired without a final report.
+
+    Their numbers stay reserved: a worker cut off from the master may still
+    report IDs it issued before the expiry, and reconcile() accepts them.
+
+    Args:
+        owner (VTNaming): The naming object.
+        now (float, optional): Seconds since the epoch.  Defaults to the current time.
+
+    Returns:
+        list: The lease records, oldest expiry first.
+    """
+    now = time.time() if now is None else now
+    with owner.store.transaction():
+        records = [record for record in owner.leases.values() if _seconds(record["expires"]) <= now]
+    return sorted(records, key=lambda record: record["expires"])
+
+
+def main(argv=None):
+    """
+    Issues IDs from a lease file, for workers that run as shell scripts.
+
+    Args:
+        argv (list, optional): Command-line arguments.  Defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(description="Issue IDs from a leased block of numbers")
+    parser.add_argument("lease_file", help="Lease file written by VTName.py --lease")
+    parser.add_argument("--count", type=int, default=1, help="Number of IDs to issue")
+    parser.add_argument("--description", help="Description of the collections")
+    parser.add_argument("--close", action="store_true",
+                        help="Close the lease so that its file can be passed to VTName.py --reconcile")
+    args = parser.parse_args(argv)
+
+    leased = Lease.load(args.lease_file, checkpoint=max(args.count, 1))
+    if leased is None:
+        sys.exit(1)
+    ids = leased.next_ids(args.count, args.description) if not args.close else []
+    for issued_id in ids:
+        print(issued_id)
+    if args.close:
+        leased.report(final=True)
+        print(f"Lease {leased.lease_id} closed: {len(leased.ids)} IDs issued, "
+              f"{leased.remaining} numbers unused.", file=sys.stderr)
+    else:
+        leased.save()
+    if len(ids) < args.count:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
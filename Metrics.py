@@ -0,0 +1,274 @@
+import atexit
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "naming_operation_seconds": ("histogram", "Latency of allocate, validate, save, load, export and import calls"),
+    "naming_operation_errors_total": ("counter", "Naming operations that raised an exception"),
+    "naming_ids_allocated_total": ("counter", "IDs allocated"),
+    "naming_requests_rejected_total": ("counter", "Allocation requests rejected by validation"),
+    "naming_ids_exported_total": ("counter", "IDs written by exports"),
+    "naming_ids_imported_total": ("counter", "IDs added by imports"),
+    "naming_counter_repairs_total": ("counter", "Counters repaired because they would have re-issued an ID"),
+    "naming_issued_ids": ("gauge", "IDs issued so far"),
+    "naming_counter_keys": ("gauge", "Keys in the hot counter dict"),
+    "naming_archived_counter_keys": ("gauge", "Keys in the archived counter dict"),
+    "naming_config_bytes": ("gauge", "Size of the configuration, journal and database files"),
+}
+
+logger = logging.getLogger("naming")
+
+
+class Registry:
+    """
+    Counters, latency histograms and gauges for the naming tools.
+
+    Disabled by default: instrumented methods then only pay for one
+    attribute check (see timed).  Gauges are not stored but read from the
+    naming objects registered with track() whenever the metrics are rendered,
+    so they cost nothing between scrapes.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.log_events = False  # Also log every operation as a JSON line
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._owners = weakref.WeakSet()  # Naming objects whose gauges are rendered
+        self._writer = None
+
+    def enable(self, log_events=False):
+        """Starts collecting; with log_events, every operation is also logged through the "naming" logger."""
+        self.enabled = True
+        self.log_events = log_events
+
+    def disable(self):
+        self.enabled = False
+        self.log_events = False
+
+    def track(self, owner):
+        """Registers a naming object whose metrics_gauges() are rendered with the metrics."""
+        self._owners.add(owner)
+
+    def inc(self, name, value=1, **labels):
+        """Adds value to a counter."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, seconds, **labels):
+        """Records the latency of one operation in the naming_operation_seconds histogram."""
+        self._observe(seconds, tuple(sorted(labels.items())))
+
+    def _observe(self, seconds, labels):
+        with self._lock:
+            histogram = self._histograms.get(labels)
+            if histogram is None:
+                histogram = self._histograms[labels] = [0] * (len(BUCKETS) + 1) + [0.0]
+            histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+
+    def render(self):
+        """
+        Returns:
+            str: All metrics in the Prometheus text exposition format.
+        """
+        samples = {}  # name -> list of (labels, value)
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {labels: list(values) for labels, values in self._histograms.items()}
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append((labels, value))
+        for owner in list(self._owners):
+            for name, labels, value in owner.metrics_gauges():
+                samples.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+
+        lines = []
+        for name in sorted(set(samples) | ({"naming_operation_seconds"} if histograms else set())):
+            kind, text = HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if name == "naming_operation_seconds":
+                for labels, values in sorted(histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ("+Inf",), values):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {values[-1]:.6f}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+                continue
+            for labels, value in sorted(samples[name]):
+                lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Writes the metrics to path atomically, e.g. for the node_exporter textfile collector."""
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "w") as f:
+                f.write(self.render())
+            os.replace(tmp_file, path)
+        except OSError as e:
+            print(f"Error writing metrics to {path}: {e}")
+
+    def start_textfile(self, path, interval=15.0):
+        """
+        Enables the metrics and rewrites path every interval seconds and at exit.
+
+        Args:
+            path (str): The .prom file to write.
+            interval (float, optional): Seconds between writes.
+        """
+        self.enable(self.log_events)
+        if self._writer is not None:
+            return
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.write_textfile(path)
+
+        self._writer = threading.Thread(target=run, name="metrics-textfile", daemon=True)
+        self._writer.start()
+        atexit.register(lambda: (stop.set(), self.write_textfile(path)))
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+REGISTRY = Registry()
+
+
+def timed(operation, kind=None):
+    """
+    Instruments a method of CTINaming or VTNaming.
+
+    When the registry is enabled, the call is timed into
+    naming_operation_seconds (whose _count is the number of calls), the
+    IDs it allocated, rejected, imported or exported are counted, and
+    (with log_events) a JSON line is logged.  When disabled, the method
+    runs directly.
+
+    Args:
+        operation (str): "allocate", "validate", "save", "load", "export" or "import".
+        kind (str, optional): The kind of ID, e.g. "reports".
+    """
+    def decorate(func):
+        label_keys = {}  # Tool -> sorted histogram labels
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not REGISTRY.enabled:
+                return func(self, *args, **kwargs)
+            tool = self.METRICS_TOOL
+            key = label_keys.get(tool)
+            if key is None:
+                labels = {"tool": tool, "operation": operation}
+                if kind:
+                    labels["kind"] = kind
+                key = label_keys[tool] = tuple(sorted(labels.items()))
+            start = time.perf_counter()
+            try:
+                result = func(self, *args, **kwargs)
+            except Exception as e:
+                REGISTRY.inc("naming_operation_errors_total", **dict(key))
+                _log(dict(key), time.perf_counter() - start, error=f"{type(e).__name__}: {e}")
+                raise
+            seconds = time.perf_counter() - start
+            REGISTRY._observe(seconds, key)
+            counts = _count_result(operation, result, tool, kind or "")
+            if REGISTRY.log_events:
+                _log(dict(key), seconds, **counts)
+            return result
+        return wrapper
+    return decorate
+
+
+def _count_result(operation, result, tool, kind):
+    """Counts the IDs an operation produced; returns them as log fields."""
+    counts = {}
+    if operation == "allocate":
+        results = result if isinstance(result, list) else [result]
+        allocated = sum(1 for issued_id in results if issued_id)
+        counts = {"ids": allocated, "rejected": len(results) - allocated}
+        REGISTRY.inc("naming_ids_allocated_total", allocated, tool=tool, kind=kind)
+        if counts["rejected"]:
+            REGISTRY.inc("naming_requests_rejected_total", counts["rejected"], tool=tool, kind=kind)
+    elif operation == "validate":
+        counts = {"valid": result is not None}
+    elif operation == "export" and result is not None:
+        counts = {"ids": result}
+        REGISTRY.inc("naming_ids_exported_total", result, tool=tool)
+    elif operation == "import" and result is not None:
+        counts = {"ids": result["imported"], "rejected": result["rejected"]}
+        REGISTRY.inc("naming_ids_imported_total", result["imported"], tool=tool)
+    return counts
+
+
+def _log(labels, seconds, **fields):
+    if REGISTRY.log_events:
+        event = dict(labels, seconds=round(seconds, 6), **fields)
+        logger.info(json.dumps(event), extra={"event": event})
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line, merging the fields of naming events."""
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry.update(event)
+        else:
+            entry["message"] = record.getMessage()
+        return json.dumps(entry)
+
+
+def configure(textfile=None, log_file=None, interval=15.0):
+    """
+    Turns on metrics for a command-line tool.
+
+    Args:
+        textfile (str, optional): Prometheus .prom file to keep up to date.
+        log_file (str, optional): Write structured (JSON lines) operation
+            logs to this file, or to stderr if "-".
+        interval (float, optional): Seconds between textfile writes.
+    """
+    if log_file:
+        handler = logging.StreamHandler() if log_file == "-" else logging.FileHandler(log_file)
+        handler.setFormatter(JSONFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        REGISTRY.enable(log_events=True)
+    if textfile:
+        REGISTRY.start_textfile(textfile, interval)
+
+
+def file_bytes(config_file):
+    """Returns the combined size of a configuration file and the files kept next to it (journal, SQLite WAL)."""
+    total = 0
+    for path in (config_file, config_file + ".journal", config_file + "-wal"):
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
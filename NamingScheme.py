@@ -0,0 +1,475 @@
+import collections
+import datetime
+import functools
+import itertools
+import re
+import CounterRetention
+import Metrics
+
+# Templates of the built-in kinds of ID.  Their field order is also the order of the counter keys.
+DEFAULT_TEMPLATES = {
+    "reports": "{source}-{report_type}-{date}-{number:02}",
+    "collections": "COL-{source}-{date}-{number:02}",
+    "graphs": "GRAPH-{source}-{date}-{number:02}",
+}
+PLACEHOLDER = re.compile(r"\{([^{}:]*)(?::([^{}]*))?\}")
+KIND = re.compile(r"[A-Za-z0-9_]+")
+
+# Where the state of one kind of ID is kept (attribute names of the owner), and how to check and search it
+Target = collections.namedtuple("Target", "counts_field ids_field descriptions_field archive_field membership find")
+
+_valid_dates = {}
+
+
+def valid_date(date_str):
+    """Tells whether a YYYYMMDD string is a real date (cached, since IDs share few dates)."""
+    valid = _valid_dates.get(date_str)
+    if valid is None:
+        try:
+            datetime.datetime.strptime(date_str, "%Y%m%d")
+            valid = True
+        except ValueError:
+            valid = False
+        if len(_valid_dates) < 100000:
+            _valid_dates[date_str] = valid
+    return valid
+
+
+def invalid_value(value):
+    """
+    Tells why a field value cannot go into an ID.
+
+    Values become part of the ID and of its counter key ("source|type|date"),
+    so they must be strings of one word without "|".
+
+    Returns:
+        str: The reason, or None if the value can be used.
+    """
+    if not isinstance(value, str):
+        return "values must be strings"
+    if "|" in value or len(value.split()) != 1:
+        return "values cannot contain whitespace or '|'"
+    return None
+
+
+class SchemeError(ValueError):
+    """Raised for a template that cannot be compiled."""
+
+
+class Scheme:
+    """
+    An ID template compiled into a formatter and a parser.
+
+    A template is literal text with placeholders: {date} for the YYYYMMDD
+    date, {number} for the sequence number, zero-padded to the width given
+    as in {number:03} and always last, and free-text fields such as
+    {source}.  Placeholders must be separated by literal text.
+
+    Fields are passed in as dicts (with "date" among them).  parse()
+    returns the key_fields values followed by the number, the tuples
+    IDIndex and Exporter.select work with.
+    """
+    def __init__(self, kind, template, key_fields=None, key_prefix=""):
+        """
+        Compiles a template.
+
+        Args:
+            kind (str): The kind of ID, e.g. "reports".
+            template (str): The template, e.g. "COL-{source}-{date}-{number:02}".
+            key_fields (tuple, optional): Order of the fields in counter keys,
+                ending with "date".  Defaults to the free-text fields in
+                template order, then "date".
+            key_prefix (str, optional): Put in front of every counter key, e.g.
+                "yara|" for kinds that share one counter dict.
+
+        Raises:
+            SchemeError: If the template is invalid or its fields differ from key_fields.
+        """
+        self.kind = kind
+        self.template = template
+        self.key_prefix = key_prefix
+        self._args = (kind, template, tuple(key_fields) if key_fields else None, key_prefix)
+        literals = []  # Literal text before each placeholder
+        names = []
+        width = 1
+        position = 0
+        for match in PLACEHOLDER.finditer(template):
+            literals.append(template[position:match.start()])
+            name, spec = match.groups()
+            if not name.isidentifier():
+                raise SchemeError(f"invalid placeholder {match.group(0)}")
+            if name in names:
+                raise SchemeError(f"{{{name}}} appears twice")
+            if spec is not None:
+                if name != "number" or not re.fullmatch(r"0?[1-9][0-9]?d?", spec):
+                    raise SchemeError(f"invalid format {match.group(0)}: only {{number}} takes a width, e.g. {{number:03}}")
+                width = int(spec.rstrip("d"))
+            names.append(name)
+            position = match.end()
+        if any(brace in text for text in literals + [template[position:]] for brace in "{}"):
+            raise SchemeError("unbalanced braces")
+        if "date" not in names or "number" not in names:
+            raise SchemeError("a template needs {date} and {number}")
+        if names[-1] != "number" or template[position:]:
+            raise SchemeError("{number} must come last")
+        if not all(literals[1:]):
+            raise SchemeError("placeholders must be separated by literal text")
+
+        self.fields = tuple(name for name in names[:-1] if name != "date")
+        self.key_fields = tuple(key_fields) if key_fields else self.fields + ("date",)
+        if sorted(self.key_fields) != sorted(self.fields + ("date",)) or self.key_fields[-1] != "date":
+            raise SchemeError(f"the fields must be {', '.join('{' + name + '}' for name in self.key_fields)}")
+        self.width = width
+        self.literal_prefix = literals[0]
+        self.pattern = "".join(
+            literal + {"date": "YYYYMMDD", "number": "N" * max(width, 2)}.get(name, name)
+            for literal, name in zip(literals, names)
+        )
+
+        # The formatters are plain str.format templates; the parser is one regular expression.
+        prefix_template = "".join(literal + "{" + name + "}" for literal, name in zip(literals, names[:-1]))
+        prefix_template += literals[-1]
+        self._format_prefix = prefix_template.format_map
+        self._format_id = (prefix_template + "{number:0%dd}" % width).format
+        self._match = re.compile("".join(
+            re.escape(literal) + {"date": "([0-9]{8})", "number": "([0-9]+)"}.get(name, "(.+?)")
+            for literal, name in zip(literals, names)
+        )).fullmatch
+        self._date_group = names.index("date")
+        order = tuple(names.index(name) for name in self.key_fields)
+        self._order = None if order == tuple(range(len(order))) else order
+
+        # Runs of free-text fields with only literal text between them: where such
+        # a field contains that text, the ID can be split in more than one way.
+        # Each run is (first group, last group, separators).
+        self._runs = []
+        for index, name in enumerate(names[:-1]):
+            if name == "date":
+                continue
+            run = self._runs[-1] if self._runs else None
+            if run is not None and run[1] == index - 1:
+                self._runs[-1] = (run[0], index, run[2] + (literals[index],))
+            else:
+                self._runs.append((index, index, ()))
+        self._runs = [run for run in self._runs if run[2]]
+
+    def __reduce__(self):
+        # Compiled regular expressions and bound methods travel as the template (e.g. to import workers).
+        return compile_scheme, self._args
+
+    def __repr__(self):
+        return f"<Scheme {self.kind}: {self.template}>"
+
+    def format(self, fields, number):
+        """
+        Formats an ID.
+
+        Args:
+            fields (dict): The field values, including "date" (YYYYMMDD).
+            number (int): The sequence number.
+
+        Returns:
+            str: The ID.
+        """
+        return self._format_id(number=number, **fields)
+
+    def prefix(self, fields):
+        """Returns the part of the ID before the number, e.g. "COL-TeamX-20250301-"."""
+        return self._format_prefix(fields)
+
+    def key(self, fields):
+        """Returns the counter key of the IDs with these field values, e.g. "TeamX|20250301"."""
+        return self.key_prefix + "|".join([fields[name] for name in self.key_fields])
+
+    def key_of(self, parsed):
+        """Returns the counter key of an ID parsed by parse()."""
+        return self.key_prefix + "|".join(parsed[:-1])
+
+    def _parsed(self, groups):
+        if self._order is None:
+            return groups[:-1] + (int(groups[-1]),)
+        return tuple([groups[index] for index in self._order]) + (int(groups[-1]),)
+
+    def parse(self, issued_id, known=None):
+        """
+        Splits an ID into its fields.
+
+        Free-text fields may contain the literal text between them (e.g. a
+        report type with a hyphen); such IDs are split as early as possible,
+        unless known is given and holds the counter key of another split.
+
+        Args:
+            issued_id (str): The ID.
+            known (container, optional): Counter keys, used to resolve ambiguous splits.
+
+        Returns:
+            tuple: The key_fields values followed by the number (an int), or
+                None if the ID does not follow the scheme.
+        """
+        match = self._match(issued_id)
+        if match is None:
+            return None
+        groups = match.groups()
+        if known is None or not self._runs or self.key_of(self._parsed(groups)) in known:
+            return self._parsed(groups)
+        for parsed in self._splits(match):
+            if self.key_of(parsed) in known:
+                return parsed
+        return self._parsed(groups)
+
+    def splits(self, issued_id):
+        """
+        Lists every way an ID can be split into fields, earliest split first.
+
+        Returns:
+            list: Tuples as returned by parse(); empty if the ID does not follow the scheme.
+        """
+        match = self._match(issued_id)
+        return list(self._splits(match)) if match is not None else []
+
+    def _splits(self, match):
+        groups = match.groups()
+        choices = []
+        for first, last, separators in self._runs:
+            text = match.string[match.start(first + 1):match.end(last + 1)]
+            choices.append((first, last, list(_split_run(text, separators))))
+        for combination in itertools.product(*(splits for _, _, splits in choices)):
+            candidate = list(groups)
+            for (first, last, _), split in zip(choices, combination):
+                candidate[first:last + 1] = split
+            yield self._parsed(tuple(candidate))
+
+    def check(self, issued_id):
+        """
+        Validates an ID for Importer.parse_chunk.
+
+        Returns:
+            tuple: (kind, counter key, number, ambiguous) if the ID is valid,
+                where ambiguous tells that it can be split in more than one way
+                (see parse); a reason string if it follows the scheme but is
+                invalid; or None if it does not follow the scheme.
+        """
+        match = self._match(issued_id)
+        if match is None:
+            return None
+        groups = match.groups()
+        date_str = groups[self._date_group]
+        if not valid_date(date_str):
+            return f"invalid date {date_str}"
+        number = int(groups[-1])
+        if number < 1:
+            return "sequence number must be at least 1"
+        ambiguous = any(separator in groups[index]
+                        for first, last, separators in self._runs
+                        for index in range(first, last + 1) for separator in separators)
+        return self.kind, self.key_of(self._parsed(groups)), number, ambiguous
+
+
+def _split_run(text, separators):
+    """Yields the ways text can be cut at the separators, in order, into non-empty parts, earliest cut first."""
+    if not separators:
+        if text:
+            yield (text,)
+        return
+    separator = separators[0]
+    position = text.find(separator, 1)
+    while position != -1:
+        for rest in _split_run(text[position + len(separator):], separators[1:]):
+            yield (text[:position],) + rest
+        position = text.find(separator, position + 1)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_scheme(kind, template, key_fields=None, key_prefix=""):
+    """Compiles a template once and returns the cached Scheme afterwards (see Scheme)."""
+    return Scheme(kind, template, key_fields, key_prefix)
+
+
+class SchemeGrammar:
+    """
+    Checks IDs against several schemes, for Importer.import_ids.
+
+    The first scheme an ID follows decides; schemes with a literal prefix
+    should come before catch-all ones such as the report scheme.  Can be
+    pickled, so it is sent to parser processes as a list of templates.
+    """
+    def __init__(self, schemes):
+        self.schemes = tuple(schemes)
+        self._mismatch = "does not match " + " or ".join(scheme.pattern for scheme in self.schemes)
+
+    def __call__(self, issued_id):
+        for scheme in self.schemes:
+            result = scheme.check(issued_id)
+            if result is not None:
+                return result
+        return self._mismatch
+
+
+class SchemeSet:
+    """
+    The compiled schemes of one naming object.
+
+    Built-in kinds use DEFAULT_TEMPLATES unless the id_schemes setting
+    overrides their template with one over the same fields.  With custom
+    allowed, the other entries of id_schemes define custom kinds, whose
+    templates must start with literal text (e.g. "YARA-") and whose counter
+    keys start with the kind.  Invalid entries are reported and skipped.
+    """
+    def __init__(self, templates, builtin, custom=False):
+        """
+        Args:
+            templates (dict): The id_schemes setting, kind -> template.
+            builtin (tuple): The built-in kinds of the naming object.
+            custom (bool, optional): Allow kinds other than the built-in ones.
+        """
+        self.templates = dict(templates)
+        self.schemes = {}
+        self.custom = []  # Custom kinds, in configuration order
+        for kind in builtin:
+            default = compile_scheme(kind, DEFAULT_TEMPLATES[kind])
+            template = self.templates.get(kind, default.template)
+            try:
+                self.schemes[kind] = compile_scheme(kind, str(template), default.key_fields)
+            except SchemeError as e:
+                print(f"Error: Invalid ID scheme for {kind} ({template}): {e}.  Using {default.template}.")
+                self.schemes[kind] = default
+        for kind, template in self.templates.items():
+            if kind in self.schemes:
+                continue
+            if not custom:
+                print(f"Error: Unknown kind '{kind}' in id_schemes.  Use one of: {', '.join(builtin)}")
+                continue
+            try:
+                if not KIND.fullmatch(kind):
+                    raise SchemeError("kinds are made of letters, digits and underscores")
+                scheme = compile_scheme(kind, str(template), None, kind + "|")
+                if not scheme.literal_prefix:
+                    raise SchemeError("custom templates must start with literal text, e.g. YARA-")
+            except SchemeError as e:
+                print(f"Error: Invalid ID scheme for {kind} ({template}): {e}")
+                continue
+            self.schemes[kind] = scheme
+            self.custom.append(kind)
+
+    def tracks(self, templates):
+        """Tells whether these schemes were compiled from the given id_schemes setting."""
+        return self.templates == templates
+
+    def __getitem__(self, kind):
+        return self.schemes[kind]
+
+    def __contains__(self, kind):
+        return kind in self.schemes
+
+    def grammar(self, kinds):
+        """Returns a SchemeGrammar over the given kinds, in order."""
+        return SchemeGrammar(self.schemes[kind] for kind in kinds)
+
+
+def reserve(owner, kind, fields, count=1):
+    """
+    Reserves count consecutive numbers for the IDs with the given field values.
+
+    With counter retention on, a counter that may have been retired (see
+    CounterRetention) continues after the last number issued for its key;
+    without it, a missing counter is simply a new key.  If the counter would hand
+    out a number that was already issued (e.g. after a restore or a hand
+    edit), it is repaired to continue after the highest number issued for
+    the key.  Must be called inside owner.store.transaction().
+
+    Args:
+        owner (CTINaming or VTNaming): The naming object.
+        kind (str): The kind of ID.
+        fields (dict): The validated field values, including "date".
+        count (int, optional): How many numbers to reserve.
+
+    Returns:
+        int: The first of the reserved numbers.
+    """
+    scheme = owner.scheme(kind)
+    target = owner.target(kind)
+    key = scheme.key(fields)
+    prefix = scheme.prefix(fields)
+    current = getattr(owner, target.counts_field).get(key)
+    floor = 0
+    if (current is None and owner.counter_retention_days is not None
+            and fields["date"] < datetime.date.today().strftime("%Y%m%d")):
+        # The day may have been retired; carry on after its last issued number.
+        floor = getattr(owner, target.archive_field).get(key)
+        if floor is None:
+            floor = CounterRetention.highest_number(target.find(prefix=prefix), prefix)
+    first = max(current or 0, floor) + 1
+    if target.membership().any_issued(prefix, first, count, scheme.width):
+        floor = CounterRetention.highest_number(target.find(prefix=prefix), prefix)
+        print(f"Warning: {scheme.format(fields, first)} was already issued; counter {key} repaired to continue "
+              f"after {floor}.")
+        Metrics.REGISTRY.inc("naming_counter_repairs_total", tool=owner.METRICS_TOOL, kind=kind)
+    first = owner.store.reserve(target.counts_field, key, count, floor)
+    if first <= 10 ** scheme.width < first + count:
+        print(f"Warning: {scheme.format(fields, 10 ** scheme.width)} has more digits than the IDs before it, so "
+              f"{kind} IDs past {10 ** scheme.width - 1} a day no longer sort by number.  Give {{number}} a larger "
+              f"width in id_schemes, e.g. {{number:0{scheme.width + 1}}}.")
+    return first
+
+
+def allocate(owner, kind, requests):
+    """
+    Numbers and records validated requests for one kind of ID.
+
+    A contiguous block of numbers is reserved for each counter key, and the
+    IDs, counters and descriptions are written to the journal as a single
+    record.
+
+    Args:
+        owner (CTINaming or VTNaming): The naming object, providing scheme()
+            and target().
+        kind (str): The kind of ID.
+        requests (iterable): (fields, description) pairs, where fields are the
+            validated field values (see reserve), or None for a rejected
+            request.
+
+    Returns:
+        list: The IDs in request order, with None for rejected requests
+            (for all of them if the IDs could not be recorded).
+    """
+    requests = list(requests)
+    if all(fields is None for fields, _ in requests):
+        return [None] * len(requests)
+
+    with owner.store.transaction():
+        scheme = owner.scheme(kind)  # Inside the transaction, which may reload the settings
+        target = owner.target(kind)
+        keys = [scheme.key(fields) if fields is not None else None for fields, _ in requests]
+        needed = {}  # Counter key -> [fields, count]
+        for key, (fields, _) in zip(keys, requests):
+            if key is not None:
+                needed.setdefault(key, [fields, 0])[1] += 1
+        next_numbers = {key: reserve(owner, kind, fields, count) for key, (fields, count) in needed.items()}
+        ops = [["put", target.counts_field, key, next_numbers[key] + count - 1]
+               for key, (_, count) in needed.items()]
+        # {number} comes last, so each ID is the prefix of its key followed by the padded number.
+        prefixes = {key: scheme.prefix(fields) for key, (fields, _) in needed.items()}
+        number_format = f"0{scheme.width}d"
+        description_ops = []
+        results = []
+        new_ids = []
+        for key, (_, description) in zip(keys, requests):
+            if key is None:
+                results.append(None)
+                continue
+            issued_id = prefixes[key] + format(next_numbers[key], number_format)
+            next_numbers[key] += 1
+            results.append(issued_id)
+            new_ids.append(issued_id)
+            if description and target.descriptions_field:
+                description_ops.append(["put", target.descriptions_field, issued_id, description])
+        if len(new_ids) == 1:
+            ops.append(["append", target.ids_field, new_ids[0]])
+        else:
+            ops.append(["extend", target.ids_field, new_ids])
+        try:
+            owner.store.commit(ops + description_ops)  # One durable record per call
+        except OSError as e:  # E.g. a full disk; the store has rolled the reservation back
+            print(f"Error: Could not record the {kind} IDs: {e}")
+            return [None] * len(requests)
+    return results
@@ -0,0 +1,522 @@
+import argparse
+import contextlib
+import http.client
+import http.server
+import io
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import urllib.parse
+from concurrent.futures import Future
+
+import BatchIO
+import Exporter
+import Leasing
+import Metrics
+from CTIDataManager import CTINaming
+from VTName import VTNaming
+
+MAX_BODY = 16 * 1024 * 1024  # Largest request body accepted, in bytes
+# Request fields of each kind that are passed on as text (the date is parsed separately)
+TEXT_FIELDS = {
+    "reports": ("source", "report_type", "description"),
+    "collections": ("source", "description"),
+    "graphs": ("source",),
+}
+
+
+class GroupCommitter:
+    """
+    Funnels allocation requests from many threads into batch calls on one thread.
+
+    Each submitted request waits on a Future.  The worker takes every request
+    queued at the moment it wakes up (up to max_batch) and hands them to
+    allocate_batch in one call, which persists them with a single journal
+    record.  Under load, batches grow on their own; an idle service answers a
+    lone request immediately.  If a batch call fails, its requests are
+    retried one at a time, so a request that cannot be allocated only fails
+    its own caller.
+    """
+    def __init__(self, allocate_batch, max_batch=1000):
+        """
+        Starts the worker thread.
+
+        Args:
+            allocate_batch (callable): Takes a list of requests and returns a
+                list of results in the same order (e.g. generate_report_ids_batch).
+            max_batch (int, optional): Most requests allocated in one call.
+        """
+        self.allocate_batch = allocate_batch
+        self.max_batch = max_batch
+        self.batches = 0  # Batch calls made so far
+        self.allocated = 0  # Requests answered so far
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, requests):
+        """
+        Queues requests and waits for their results.
+
+        Args:
+            requests (list): Requests in the form allocate_batch takes.
+
+        Returns:
+            list: The results, in request order.
+        """
+        futures = []
+        for request in requests:
+            future = Future()
+            self._queue.put((request, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # Stop after this batch
+                    break
+                batch.append(item)
+            try:
+                results = self.allocate_batch([request for request, _ in batch])
+            except Exception:
+                # The batch is validated before anything is reserved, so nothing was
+                # allocated; retrying each request alone isolates the one that fails.
+                for request, future in batch:
+                    self._allocate_one(request, future)
+                continue
+            self.batches += 1
+            self.allocated += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _allocate_one(self, request, future):
+        try:
+            result = self.allocate_batch([request])[0]
+        except Exception as e:
+            future.set_exception(e)
+            return
+        self.batches += 1
+        self.allocated += 1
+        future.set_result(result)
+
+    def close(self):
+        """Finishes the queued requests and stops the worker."""
+        self._queue.put(None)
+        self._worker.join()
+
+
+class NamingService:
+    """
+    A local ID service wrapping one CTINaming and one VTNaming object.
+
+    Keeps their state in memory and answers the JSON API served by
+    ServiceHandler, so playbooks and scripts can allocate IDs without driving
+    the interactive menus.  Concurrent allocations are group-committed: one
+    worker per ID kind allocates everything that is waiting with a single
+    batch call, which is persisted with one journal record (one fsync).
+
+    Endpoints:
+        POST /reports, /collections, /graphs: Allocate one ID from a request
+            object ({"source", "report_type", "date", "description"}, without
+            the fields the kind does not use) or several from {"requests": [...]}.
+        GET /reports/ID, /collections/ID, /graphs/ID: Look up an issued ID.
+        GET /reports, /collections, /graphs: Search by source, report_type,
+            date_from, date_to, prefix and limit query parameters.
+        GET /search/reports, /search/collections: Full-text search of the
+            descriptions (q and limit parameters), best match first.
+        GET /export/reports, /export/ids: Stream an export (format, kind,
+            source, report_type, date_from, date_to parameters).  POST takes
+            the same parameters as a JSON object, plus since, which exports
+            only the IDs issued after the last export with that name and
+            advances its watermark (see Exporter.watermark_key).
+        POST /leases: Lease a block of collection or graph numbers to a worker
+            ({"kind", "source", "date", "count", "ttl", "holder"}, see
+            Leasing); POST /leases/reconcile records the IDs of a lease
+            report, and GET /leases lists the open leases.
+        GET /health: ID counts and group-commit statistics.
+        GET /metrics: Latencies, counters and state sizes in the Prometheus
+            text format (see Metrics).
+
+    Dates are YYYYMMDD strings; an empty or missing date means today.
+    """
+    def __init__(self, cti, vt, max_batch=1000):
+        """
+        Args:
+            cti (CTINaming): The report naming object.
+            vt (VTNaming): The collection and graph naming object.
+            max_batch (int, optional): Most allocations group-committed at once.
+        """
+        self.cti = cti
+        self.vt = vt
+        self.committers = {
+            "reports": GroupCommitter(cti.generate_report_ids_batch, max_batch),
+            "collections": GroupCommitter(vt.generate_collection_ids_batch, max_batch),
+            "graphs": GroupCommitter(vt.generate_graph_ids_batch, max_batch),
+        }
+
+    def allocate(self, kind, body):
+        """
+        Handles POST /reports, /collections and /graphs.
+
+        Returns:
+            tuple: (HTTP status, response dict).
+        """
+        single = "requests" not in body
+        rows = [body] if single else body["requests"]
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            return 400, {"error": "Expected a request object or {\"requests\": [objects]}"}
+        for position, row in enumerate(rows):
+            for field in TEXT_FIELDS[kind]:
+                if not isinstance(row.get(field, ""), (str, type(None))):
+                    where = "" if single else f"requests[{position}]: "
+                    return 400, {"error": f"{where}{field} must be a string"}
+        requests = []
+        for row in rows:
+            date = BatchIO.parse_date(row.get("date"))
+            if kind == "reports":
+                requests.append((row.get("source"), row.get("report_type"), date, row.get("description")))
+            elif kind == "collections":
+                requests.append((row.get("source"), date, row.get("description")))
+            else:
+                requests.append((row.get("source"), date))
+        ids = self.committers[kind].submit(requests)
+        if single:
+            if ids[0] is None:
+                return 400, {"error": "Request rejected: unknown source or type, or invalid date"}
+            return 200, {"id": ids[0]}
+        return 200, {"ids": ids, "rejected": ids.count(None)}
+
+    def lookup(self, kind, issued_id):
+        """Handles GET /reports/ID, /collections/ID and /graphs/ID."""
+        if kind == "reports":
+            namer, find, descriptions = self.cti, self.cti.find_reports, self.cti.report_descriptions
+        elif kind == "collections":
+            namer, find, descriptions = self.vt, self.vt.find_collections, self.vt.collection_descriptions
+        else:
+            namer, find, descriptions = self.vt, self.vt.find_graphs, None
+        with namer.store.transaction():
+            if issued_id not in find(prefix=issued_id, limit=None):
+                return 404, {"error": f"{issued_id} has not been issued"}
+            result = {"id": issued_id}
+            if descriptions is not None:
+                result["description"] = descriptions.get(issued_id)
+            return 200, result
+
+    def search(self, kind, params):
+        """Handles GET /reports, /collections and /graphs with query filters."""
+        limit = int(params["limit"]) if params.get("limit") else 1000
+        common = dict(source=params.get("source"), date_from=params.get("date_from"),
+                      date_to=params.get("date_to"), prefix=params.get("prefix"), limit=limit)
+        if kind == "reports":
+            ids = self.cti.find_reports(report_type=params.get("report_type"), **common)
+        elif kind == "collections":
+            ids = self.vt.find_collections(**common)
+        else:
+            ids = self.vt.find_graphs(**common)
+        return 200, {"ids": ids}
+
+    def search_text(self, kind, params):
+        """Handles GET /search/reports and /search/collections."""
+        if not params.get("q"):
+            return 400, {"error": "Missing q parameter"}
+        limit = int(params["limit"]) if params.get("limit") else 20
+        if kind == "reports":
+            namer, search, descriptions = self.cti, self.cti.search_reports, self.cti.report_descriptions
+        else:
+            namer, search, descriptions = self.vt, self.vt.search_collections, self.vt.collection_descriptions
+        with namer.store.transaction():
+            matches = search(params["q"], limit)
+            return 200, {"results": [{"id": issued_id, "score": score, "description": descriptions.get(issued_id)}
+                                     for issued_id, score in matches]}
+
+    def export(self, target, params, stream):
+        """
+        Handles GET and POST /export/reports and /export/ids by streaming to stream.
+
+        Returns:
+            int: The number of IDs exported, or None on error.
+        """
+        fmt = params.get("format", "jsonl")
+        if target == "reports":
+            return self.cti.export_reports(stream, fmt, params.get("source"), params.get("report_type"),
+                                           params.get("date_from"), params.get("date_to"), params.get("since"))
+        kinds = (params["kind"],) if params.get("kind") else ("collections", "graphs")
+        return self.vt.export_ids(stream, fmt, kinds, params.get("source"), params.get("date_from"),
+                                  params.get("date_to"), params.get("since"))
+
+    def lease(self, body):
+        """Handles POST /leases."""
+        if body.get("kind") not in ("collections", "graphs"):
+            return 400, {"error": "kind must be collections or graphs"}
+        count = int(body.get("count") or 1000)
+        ttl = float(body.get("ttl") or Leasing.DEFAULT_TTL)
+        lease = self.vt.lease_block(body["kind"], body.get("source"), BatchIO.parse_date(body.get("date")), count, ttl,
+                                    body.get("holder"))
+        if lease is None:
+            return 400, {"error": "Lease rejected: unknown source, invalid date, count or ttl"}
+        return 200, lease.to_dict()
+
+    def reconcile(self, body):
+        """Handles POST /leases/reconcile."""
+        stats = self.vt.reconcile_lease(body)
+        if stats is None:
+            return 404, {"error": f"Unknown lease {body.get('lease_id')}"}
+        return 200, stats
+
+    def leases(self):
+        """Handles GET /leases."""
+        # Copy under the lock: allocations and reconciles replace the records meanwhile.
+        with self.vt.store.transaction():
+            expired = {record["lease_id"] for record in self.vt.expired_leases()}
+            records = [dict(record, expired=record["lease_id"] in expired) for record in self.vt.leases.values()]
+        return 200, {"leases": records}
+
+    def health(self):
+        """Handles GET /health."""
+        return 200, {
+            "status": "ok",
+            "reports": len(self.cti.generated_report_ids),
+            "collections": len(self.vt.generated_collection_ids),
+            "graphs": len(self.vt.generated_graph_ids),
+            "batches": {kind: committer.batches for kind, committer in self.committers.items()},
+        }
+
+    def close(self):
+        """Drains the allocation queues and closes the stores."""
+        for committer in self.committers.values():
+            committer.close()
+        self.cti.store.close()
+        self.vt.store.close()
+
+
+class ServiceHandler(http.server.BaseHTTPRequestHandler):
+    """Maps HTTP requests onto NamingService."""
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients can reuse connections
+    server_version = "CTINamingService/1.0"
+
+    def setup(self):
+        # Small responses would otherwise wait for the client's delayed ACK (TCP only).
+        self.disable_nagle_algorithm = self.request.family in (socket.AF_INET, socket.AF_INET6)
+        super().setup()
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        parts = [urllib.parse.unquote(part) for part in url.path.strip("/").split("/")]
+        service = self.server.service
+        try:
+            if parts == ["health"]:
+                self._reply(*service.health())
+            elif parts == ["leases"]:
+                self._reply(*service.leases())
+            elif parts == ["metrics"]:
+                self._send(200, Metrics.REGISTRY.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+            elif len(parts) == 2 and parts[0] == "search" and parts[1] in ("reports", "collections"):
+                self._reply(*service.search_text(parts[1], params))
+            elif len(parts) == 2 and parts[0] == "export" and parts[1] in ("reports", "ids"):
+                if params.get("since"):
+                    # GETs may be retried and prefetched; moving a watermark needs a POST.
+                    self._reply(400, {"error": f"since advances a watermark; use POST /export/{parts[1]}"})
+                else:
+                    self._export(parts[1], params)
+            elif parts[0] in ("reports", "collections", "graphs") and len(parts) <= 2:
+                if len(parts) == 2:
+                    self._reply(*service.lookup(parts[0], parts[1]))
+                else:
+                    self._reply(*service.search(parts[0], params))
+            else:
+                self._reply(404, {"error": "Not found"})
+        except (ValueError, KeyError) as e:
+            self._reply(400, {"error": str(e)})
+
+    def do_POST(self):
+        parts = urllib.parse.urlsplit(self.path).path.strip("/").split("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self._reply(413, {"error": "Request body too large"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._reply(400, {"error": "Request body is not valid JSON"})
+            return
+        service = self.server.service
+        leasing = parts in (["leases"], ["leases", "reconcile"])
+        exporting = len(parts) == 2 and parts[0] == "export" and parts[1] in ("reports", "ids")
+        if not leasing and not exporting and (len(parts) != 1 or parts[0] not in ("reports", "collections", "graphs")):
+            self._reply(404, {"error": "Not found"})
+        elif not isinstance(body, dict):
+            self._reply(400, {"error": "Expected a JSON object"})
+        elif exporting:
+            if any(not isinstance(value, str) for value in body.values()):
+                self._reply(400, {"error": "Export parameters must be strings"})
+            else:
+                self._export(parts[1], body)
+        elif leasing:
+            try:
+                self._reply(*(service.lease(body) if len(parts) == 1 else service.reconcile(body)))
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply(400, {"error": str(e)})
+        else:
+            try:
+                self._reply(*service.allocate(parts[0], body))
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply(400, {"error": str(e)})
+            except Exception as e:
+                self._reply(500, {"error": f"Allocation failed: {e}"})
+
+    def _reply(self, status, payload):
+        self._send(status, (json.dumps(payload) + "\n").encode("utf-8"), "application/json")
+
+    def _send(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _export(self, target, params):
+        if params.get("format", "jsonl") not in Exporter.FORMATS:
+            self._reply(400, {"error": f"Unknown export format.  Use one of: {', '.join(Exporter.FORMATS)}"})
+            return
+        # The size is not known up front, so the body runs until the connection closes.
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if params.get("format", "jsonl") == "jsonl"
+                         else "text/plain; charset=utf-8")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        stream = io.TextIOWrapper(self.wfile, encoding="utf-8", newline="\n", write_through=True)
+        try:
+            self.server.service.export(target, params, stream)
+        finally:
+            stream.detach()
+
+    def address_string(self):
+        # Unix-socket clients have no address.
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ThreadingHTTPService(http.server.ThreadingHTTPServer):
+    """HTTP over TCP, one thread per connection."""
+    daemon_threads = True
+    request_queue_size = 128  # Listen backlog; the default of 5 resets bursts of new clients
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, ServiceHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+class ThreadingUnixHTTPService(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP over a Unix-domain socket, one thread per connection."""
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, path, service, verbose=False):
+        if os.path.exists(path):
+            os.remove(path)  # Left over from a previous run
+        super().__init__(path, ServiceHandler)
+        self.service = service
+        self.verbose = verbose
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+
+def serve(service, host="127.0.0.1", port=8765, socket_path=None, verbose=False, ready=None):
+    """
+    Serves the API until interrupted.
+
+    Args:
+        service (NamingService): The service to expose.
+        host (str, optional): Interface to bind for TCP.
+        port (int, optional): TCP port; 0 picks a free one.
+        socket_path (str, optional): Serve on this Unix-domain socket instead of TCP.
+        verbose (bool, optional): Log every request to stderr.
+        ready (callable, optional): Called with the server once it is listening.
+    """
+    if socket_path:
+        server = ThreadingUnixHTTPService(socket_path, service, verbose)
+        where = socket_path
+    else:
+        server = ThreadingHTTPService((host, port), service, verbose)
+        where = "http://%s:%d" % server.server_address[:2]
+    print(f"Naming service listening on {where}", file=sys.stderr)
+    if ready:
+        ready(server)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An http.client connection over a Unix-domain socket, for clients and the load test."""
+    def __init__(self, path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def main(argv=None):
+    """
+    Runs the naming service.
+
+    Args:
+        argv (list, optional): Command-line arguments.  Defaults to sys.argv[1:].
+    """
+    parser = argparse.ArgumentParser(description="CTI/VirusTotal naming service")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument("--socket", help="Listen on this Unix-domain socket instead of TCP")
+    parser.add_argument("--cti-config", default="cti_naming_config.json", help="CTI naming configuration file")
+    parser.add_argument("--vt-config", default="vt_naming_config.json", help="VirusTotal naming configuration file")
+    parser.add_argument("--max-batch", type=int, default=1000, help="Most allocations committed together")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    parser.add_argument("--no-metrics", action="store_true", help="Do not collect metrics for GET /metrics")
+    parser.add_argument("--metrics-file", metavar="FILE", help="Also keep Prometheus metrics in FILE")
+    parser.add_argument("--log-json", metavar="FILE",
+                        help="Log every allocation, save, load and export as a JSON line to FILE (\"-\" for stderr)")
+    args = parser.parse_args(argv)
+    if not args.no_metrics:
+        Metrics.REGISTRY.enable()
+    Metrics.configure(args.metrics_file, args.log_json)
+
+    with contextlib.redirect_stdout(sys.stderr):
+        service = NamingService(CTINaming(args.cti_config), VTNaming(args.vt_config), args.max_batch)
+    try:
+        serve(service, args.host, args.port, args.socket, args.verbose)
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
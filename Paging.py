@@ -0,0 +1,116 @@
+import collections
+import itertools
+
+PAGE_SIZE = 50  # Lines shown before asking whether to go on
+MORE_PROMPT = "-- {shown} shown; press Enter for more, q to stop -- "
+
+
+def show_pages(lines, page_size=PAGE_SIZE, prompt=input):
+    """
+    Prints lines a page at a time, asking before each further page.
+
+    The lines are read only as far as they are shown (plus the next page), so
+    a generator over a large history costs no more than what is displayed.
+    Each page is printed with a single write.
+
+    Args:
+        lines (iterable): The lines to print, e.g. a generator.
+        page_size (int, optional): Lines per page.  None or 0 prints
+            everything in pages without pausing.
+        prompt (callable, optional): Asks whether to go on; an answer starting
+            with "q" stops.  None never pauses.
+
+    Returns:
+        int: The number of lines printed.
+    """
+    lines = iter(lines)
+    size = page_size or PAGE_SIZE
+    shown = 0
+    page = list(itertools.islice(lines, size))
+    while page:
+        print("\n".join(page))
+        shown += len(page)
+        page = list(itertools.islice(lines, size))
+        if page and page_size and prompt is not None:
+            try:
+                answer = prompt(MORE_PROMPT.format(shown=shown))
+            except EOFError:
+                break
+            if answer.strip().lower().startswith("q"):
+                break
+    return shown
+
+
+def summarize(counters, key_fields, filters=None, date_from=None, date_to=None):
+    """
+    Adds up counters into the number of IDs per value of each key field.
+
+    Counters hold the last number issued for each key (e.g.
+    "source|type|YYYYMMDD"), which is the number of IDs issued for it unless
+    numbers were skipped (e.g. by an import with gaps), so the totals come
+    from the counter dicts alone without reading the issued IDs.
+
+    Args:
+        counters (iterable): Counter dicts, e.g. the hot and the archived
+            counters.  A key found in more than one counts once, with its
+            highest value.
+        key_fields (tuple): Names of the parts of a key, ending with "date".
+        filters (dict, optional): Exact values the key fields must have, e.g.
+            {"source": "Vendor1"}.
+        date_from (str, optional): First date to include, as YYYYMMDD.  A
+            shorter value such as "202503" means the start of that period.
+        date_to (str, optional): Last date to include, as YYYYMMDD.  A
+            shorter value such as "202503" means the end of that period.
+
+    Returns:
+        dict: "total" (the number of IDs), "keys" (the number of counters),
+            and for each key field a collections.Counter of IDs per value.
+    """
+    merged = {}
+    for counts in counters:
+        for key, value in counts.items():
+            if merged.get(key, 0) < value:
+                merged[key] = value
+    checks = [(key_fields.index(name), value) for name, value in (filters or {}).items()]
+    low = (date_from or "").ljust(8, "0")
+    high = (date_to or "").ljust(8, "9")
+    summary = {name: collections.Counter() for name in key_fields}
+    total = keys = 0
+    for key, value in merged.items():
+        parts = key.split("|")
+        if len(parts) != len(key_fields) or any(parts[field] != wanted for field, wanted in checks):
+            continue
+        if not low <= parts[-1] <= high:
+            continue
+        for name, part in zip(key_fields, parts):
+            summary[name][part] += value
+        total += value
+        keys += 1
+    summary["total"] = total
+    summary["keys"] = keys
+    return summary
+
+
+def summary_lines(summary, key_fields, title="IDs"):
+    """
+    Formats a summary from summarize() for show_pages.
+
+    Values are listed by count, except dates, which are listed newest first.
+
+    Yields:
+        str: The lines.
+    """
+    yield f"\n{title}: {summary['total']} issued under {summary['keys']} counter(s)"
+    if not summary["keys"]:
+        return
+    for name in key_fields:
+        counts = summary[name]
+        if name == "date":
+            yield "\nPer day (newest first):"
+            rows = sorted(counts.items(), reverse=True)
+        else:
+            yield f"\nPer {name.replace('_', ' ')}:"
+            rows = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        width = max((len(value) for value in counts), default=0)
+        for value, count in rows:
+            yield f"  {value.ljust(width)}  {count}"
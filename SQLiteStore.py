@@ -0,0 +1,349 @@
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping, Sequence
+from StorageBackend import StorageBackend
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    field TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (field, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS ids (
+    field TEXT NOT NULL,
+    pos INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    PRIMARY KEY (field, pos)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ids_by_id ON ids (field, id);
+CREATE TABLE IF NOT EXISTS entries (
+    field TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value,
+    PRIMARY KEY (field, key)
+) WITHOUT ROWID;
+"""
+
+SETTINGS_VERSION = "__settings_version__"  # Settings row bumped whenever a setting changes
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def _connect(db_file):
+    """Opens a database in autocommit mode with WAL journaling and the schema in place."""
+    conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class SQLiteStore(StorageBackend):
+    """
+    Keeps naming state in an embedded SQLite database.
+
+    Settings are loaded at startup, but counters, issued IDs and
+    descriptions stay in indexed tables and are exposed to the owner through
+    read-only views, so startup time does not grow with history.  Counters
+    are bumped with a single UPDATE ... RETURNING inside a BEGIN IMMEDIATE
+    transaction, which also serializes allocations across processes.
+    """
+    def __init__(self, owner, db_file, compact_threshold=10000):
+        """
+        Opens (and if needed creates) the database.
+
+        Args:
+            owner (object): The naming object whose state is persisted.  It must
+                provide STATE_FIELDS and load_config().
+            db_file (str): Path of the SQLite database.
+            compact_threshold (int, optional): Number of commits after which the
+                write-ahead log is checkpointed and truncated.
+        """
+        self.owner = owner
+        self.db_file = db_file
+        self.compact_threshold = compact_threshold
+        self.conn = _connect(db_file)
+        self.commits = 0  # Commits since the last checkpoint
+        self._settings_version = None  # Settings version the owner was loaded with
+        self._depth = 0
+        self._lock = threading.RLock()
+        self._views = {}
+        for field, kind in owner.STATE_FIELDS.items():
+            if kind == "list":
+                self._views[field] = SQLiteIDList(self, field)
+            elif kind == "counter":
+                self._views[field] = SQLiteMap(self, "counters", field)
+            else:
+                self._views[field] = SQLiteMap(self, "entries", field)
+
+    def query(self, sql, params=()):
+        """Runs a read query and returns all rows."""
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def load(self):
+        """
+        Loads the settings and attaches views for the state fields.
+
+        Returns:
+            dict: The configuration.  Counters, ID lists and descriptions are
+                views onto the database rather than copies.
+        """
+        with self._lock:
+            config = {name: json.loads(value) for name, value in self.conn.execute("SELECT name, value FROM settings")}
+            self._settings_version = config.pop(SETTINGS_VERSION, 0)
+            config.update(self._views)
+            return config
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Runs the enclosed block in one BEGIN IMMEDIATE transaction.
+
+        Transactions nest; only the outermost one talks to SQLite.  If another
+        process changed the settings since the owner loaded them, the owner is
+        reloaded first.
+        """
+        with self._lock:
+            outer = self._depth == 0
+            if outer:
+                self.conn.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                if outer and self._read_settings_version() != self._settings_version:
+                    self.owner.load_config()
+                yield
+            except BaseException:
+                self._depth -= 1
+                if outer:
+                    self.conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if outer:
+                self.conn.execute("COMMIT")
+                self.commits += 1
+                if self.commits >= self.compact_threshold:
+                    self.compact()
+
+    def _read_settings_version(self):
+        row = self.conn.execute("SELECT value FROM settings WHERE name = ?", (SETTINGS_VERSION,)).fetchone()
+        return json.loads(row[0]) if row else 0
+
+    def reserve(self, field, key, count=1, floor=0):
+        """
+        Bumps a counter in the database.  Must be called inside transaction().
+
+        Returns:
+            int: The first reserved number.
+        """
+        upsert = ("INSERT INTO counters (field, key, value) VALUES (?, ?, ?) "
+                  "ON CONFLICT (field, key) DO UPDATE SET value = MAX(value, ?) + ?")
+        params = (field, key, floor + count, floor, count)
+        if HAS_RETURNING:
+            (value,) = self.conn.execute(upsert + " RETURNING value", params).fetchone()
+        else:
+            self.conn.execute(upsert, params)
+            (value,) = self.conn.execute(
+                "SELECT value FROM counters WHERE field = ? AND key = ?", (field, key)
+            ).fetchone()
+        return value - count + 1
+
+    def commit(self, ops):
+        """
+        Writes operations to the database in one transaction.
+
+        Operations on state fields go to their tables; settings are also
+        applied to the owner, since it keeps those in memory.
+
+        Args:
+            ops (list): The operations (see JournalStore.apply_ops).
+        """
+        state_fields = self.owner.STATE_FIELDS
+        with self.transaction():
+            settings_changed = False
+            for op in ops:
+                kind, field = op[0], op[1]
+                if kind in ("append", "extend"):
+                    values = [op[2]] if kind == "append" else op[2]
+                    start = len(self._views[field])
+                    self.conn.executemany(
+                        "INSERT INTO ids (field, pos, id) VALUES (?, ?, ?)",
+                        [(field, pos, value) for pos, value in enumerate(values, start)],
+                    )
+                elif kind == "put" and field in state_fields:
+                    table = "counters" if state_fields[field] == "counter" else "entries"
+                    self.conn.execute(
+                        f"INSERT INTO {table} (field, key, value) VALUES (?, ?, ?) "
+                        "ON CONFLICT (field, key) DO UPDATE SET value = excluded.value",
+                        (field, op[2], op[3]),
+                    )
+                elif kind == "delete" and field in state_fields:
+                    table = "counters" if state_fields[field] == "counter" else "entries"
+                    self.conn.execute(f"DELETE FROM {table} WHERE field = ? AND key = ?", (field, op[2]))
+                else:
+                    # A setting: the owner holds it in memory, the table holds a JSON copy.
+                    state = vars(self.owner)
+                    if kind == "put":
+                        state.setdefault(field, {})[op[2]] = op[3]
+                    elif kind == "delete":
+                        state.get(field, {}).pop(op[2], None)
+                    else:
+                        state[field] = op[2]
+                    self._write_setting(field, state[field])
+                    settings_changed = True
+            if settings_changed:
+                self._settings_version = self._read_settings_version() + 1
+                self._write_setting(SETTINGS_VERSION, self._settings_version)
+
+    def _write_setting(self, name, value):
+        self.conn.execute(
+            "INSERT INTO settings (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            (name, json.dumps(value)),
+        )
+
+    def compact(self, wait=False):
+        """Checkpoints the write-ahead log into the database and truncates it."""
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                self.commits = 0
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self.conn.close()
+
+
+class SQLiteIDList(Sequence):
+    """Read-only, list-like view of the issued IDs of one field, in issue order."""
+    fast_contains = True  # `in` is answered by the ids_by_id index, not a scan
+
+    def __init__(self, store, field, chunk_size=10000):
+        self.store = store
+        self.field = field
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.store.query("SELECT COALESCE(MAX(pos) + 1, 0) FROM ids WHERE field = ?", (self.field,))[0][0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            rows = self.store.query(
+                "SELECT id FROM ids WHERE field = ? AND pos >= ? AND pos < ? ORDER BY pos", (self.field, start, stop)
+            )
+            return [row[0] for row in rows]
+        if index < 0:
+            index += len(self)
+        rows = self.store.query("SELECT id FROM ids WHERE field = ? AND pos = ?", (self.field, index))
+        if not rows:
+            raise IndexError("ID index out of range")
+        return rows[0][0]
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, start):
+        """Iterates from position start."""
+        # Stream in chunks rather than holding a cursor open across yields.
+        pos = start
+        while True:
+            rows = self.store.query(
+                "SELECT id FROM ids WHERE field = ? AND pos >= ? ORDER BY pos LIMIT ?",
+                (self.field, pos, self.chunk_size),
+            )
+            for row in rows:
+                yield row[0]
+            if len(rows) < self.chunk_size:
+                return
+            pos += len(rows)
+
+    def __contains__(self, value):
+        return bool(self.store.query("SELECT 1 FROM ids WHERE field = ? AND id = ? LIMIT 1", (self.field, value)))
+
+    def __repr__(self):
+        return f"<SQLiteIDList {self.field}: {len(self)} IDs>"
+
+
+class SQLiteMap(Mapping):
+    """Read-only, dict-like view of one counter or map field."""
+    def __init__(self, store, table, field):
+        self.store = store
+        self.table = table
+        self.field = field
+
+    def __getitem__(self, key):
+        rows = self.store.query(f"SELECT value FROM {self.table} WHERE field = ? AND key = ?", (self.field, key))
+        if not rows:
+            raise KeyError(key)
+        return rows[0][0]
+
+    def __iter__(self):
+        return iter([row[0] for row in self.store.query(f"SELECT key FROM {self.table} WHERE field = ?", (self.field,))])
+
+    def __len__(self):
+        return self.store.query(f"SELECT COUNT(*) FROM {self.table} WHERE field = ?", (self.field,))[0][0]
+
+    def items(self):
+        return self.store.query(f"SELECT key, value FROM {self.table} WHERE field = ?", (self.field,))
+
+    def __repr__(self):
+        return f"<SQLiteMap {self.field}: {len(self)} entries>"
+
+
+def migrate_from_json(config_file, db_file, state_fields):
+    """
+    Copies a JSON configuration (snapshot plus journal) into a new SQLite database.
+
+    Args:
+        config_file (str): The JSON configuration to read.
+        db_file (str): The database to create.  It must not contain any IDs yet.
+        state_fields (dict): The STATE_FIELDS of the naming class the
+            configuration belongs to.
+
+    Returns:
+        bool: True if the migration succeeded.
+    """
+    from JournalStore import JournalStore
+    config = JournalStore(None, config_file).load()
+    if config is None:
+        print(f"Error: {config_file} not found.")
+        return False
+    conn = _connect(db_file)
+    try:
+        if conn.execute("SELECT 1 FROM ids LIMIT 1").fetchone():
+            print(f"Error: {db_file} already contains IDs; refusing to migrate into it.")
+            return False
+        conn.execute("BEGIN IMMEDIATE")
+        for name, value in config.items():
+            kind = state_fields.get(name)
+            if kind == "list":
+                conn.executemany("INSERT INTO ids (field, pos, id) VALUES (?, ?, ?)",
+                                 ((name, pos, issued_id) for pos, issued_id in enumerate(value)))
+            elif kind == "counter":
+                conn.executemany("INSERT OR REPLACE INTO counters (field, key, value) VALUES (?, ?, ?)",
+                                 ((name, key, count) for key, count in value.items()))
+            elif kind == "map":
+                conn.executemany("INSERT OR REPLACE INTO entries (field, key, value) VALUES (?, ?, ?)",
+                                 ((name, key, entry) for key, entry in value.items()))
+            else:
+                conn.execute("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)", (name, json.dumps(value)))
+        conn.execute("COMMIT")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    except sqlite3.Error as e:
+        print(f"Error migrating to {db_file}: {e}")
+        return False
+    finally:
+        conn.close()
+    issued = sum(len(config.get(name, [])) for name, kind in state_fields.items() if kind == "list")
+    print(f"Migrated {issued} IDs from {config_file} to {db_file} ({os.path.getsize(db_file)} bytes).")
+    return True
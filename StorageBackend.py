@@ -0,0 +1,92 @@
+class CorruptStateError(ValueError):
+    """Raised when no intact copy of the stored state can be found."""
+
+
+class StorageBackend:
+    """
+    Interface shared by the storage backends of CTINaming and VTNaming.
+
+    A backend is bound to one naming object, its owner.  The owner lists the
+    shape of its state in STATE_FIELDS, mapping each attribute name to one of
+
+        "counter"   a dict of per-key sequence counters
+        "list"      an append-only list of issued IDs
+        "map"       a dict keyed by ID (e.g. descriptions)
+
+    Every other config key is a plain setting.  All changes go through
+    commit() as a list of operations (see JournalStore.apply_ops), inside a
+    transaction() that makes reading a counter and recording the IDs built
+    from it atomic, also across processes.
+    """
+    def load(self):
+        """
+        Loads the configuration.
+
+        Returns:
+            dict: The configuration, with the STATE_FIELDS values as dicts and
+                lists (or objects that behave like them), or None if there is
+                no stored configuration yet.
+
+        Raises:
+            CorruptStateError: If the stored state is damaged and cannot be
+                recovered.  Starting over with empty counters instead would
+                re-issue IDs that are already in use.
+        """
+        raise NotImplementedError
+
+    def transaction(self):
+        """Returns a context manager that serializes changes to the store."""
+        raise NotImplementedError
+
+    def reserve(self, field, key, count=1, floor=0):
+        """
+        Bumps a counter by count.  Must be called inside transaction().
+
+        Args:
+            field (str): The counter field, e.g. "report_counts".
+            key (str): The counter key, e.g. "Vendor1|Threat|20250301".
+            count (int, optional): How many consecutive numbers to reserve.
+            floor (int, optional): Numbers up to floor are taken even if the
+                counter is lower (or missing), e.g. because the counter was
+                retired (see CounterRetention).
+
+        Returns:
+            int: The first reserved number.
+        """
+        raise NotImplementedError
+
+    def commit(self, ops):
+        """
+        Applies operations to the owner's state and persists them durably.
+
+        Args:
+            ops (list): The operations (see JournalStore.apply_ops).
+        """
+        raise NotImplementedError
+
+    def compact(self, wait=False):
+        """Reclaims space used by superseded data, if the backend needs to."""
+
+    def close(self):
+        """Releases files and connections held by the backend."""
+
+
+def open_store(owner, config_file):
+    """
+    Opens the storage backend that matches a configuration file.
+
+    Files ending in .db, .sqlite or .sqlite3 use the SQLite backend; anything
+    else is treated as a JSON snapshot with a journal.
+
+    Args:
+        owner (object): The naming object the backend persists.
+        config_file (str): Path of the configuration file or database.
+
+    Returns:
+        StorageBackend: The backend.
+    """
+    if config_file.lower().endswith((".db", ".sqlite", ".sqlite3")):
+        from SQLiteStore import SQLiteStore
+        return SQLiteStore(owner, config_file)
+    from JournalStore import JournalStore
+    return JournalStore(owner, config_file)
@@ -0,0 +1,261 @@
+import bisect
+import collections
+import heapq
+import math
+import marshal
+import os
+import re
+from array import array
+
+INDEX_VERSION = 1
+TOKEN = re.compile(r"[^\W_]+")
+PHRASE = re.compile(r'"([^"]*)"?')
+K1 = 1.2  # BM25 term frequency saturation
+B = 0.75  # BM25 length normalization
+
+
+def tokenize(text):
+    """Splits text into lowercase words (letters and digits)."""
+    return TOKEN.findall(text.casefold()) if text else []
+
+
+def parse_query(query):
+    """
+    Splits a search query into words and "quoted phrases".
+
+    Returns:
+        tuple: (words, phrases), where words are all distinct words of the
+            query and phrases are tuples of two or more words that must
+            appear next to each other.
+    """
+    phrases = []
+    for match in PHRASE.finditer(query):
+        words = tokenize(match.group(1))
+        if len(words) > 1:
+            phrases.append(tuple(words))
+    words = list(dict.fromkeys(tokenize(query)))
+    return words, phrases
+
+
+def _contains(words, phrase):
+    size = len(phrase)
+    first = phrase[0]
+    return any(words[start:start + size] == list(phrase)
+               for start, word in enumerate(words) if word == first)
+
+
+def _has(rows, row):
+    position = bisect.bisect_left(rows, row)
+    return position < len(rows) and rows[position] == row
+
+
+class TextIndex:
+    """
+    Full-text index over the descriptions of an append-only list of issued IDs.
+
+    Every description is tokenized once, when its ID is indexed, into an
+    inverted index: for each word, the rows (positions in the ID list) of
+    the descriptions containing it, plus how often it occurs where that is
+    more than once.  Word queries intersect the rows of their words, rarest
+    first, and rank the matches with BM25; phrases are checked against the
+    description text of the best matches only.  Like IDIndex, the index catches up with new IDs
+    on each search and is persisted next to the configuration.
+
+    Descriptions are recorded together with their IDs (see
+    NamingScheme.allocate and Importer), so the rows never need to be
+    re-indexed.
+    """
+    def __init__(self, ids, descriptions, path=None, save_threshold=100000):
+        """
+        Initializes an empty index.
+
+        Args:
+            ids (list): The append-only list of issued IDs.  The list is
+                referenced, not copied.
+            descriptions (dict): Descriptions by ID, likewise referenced.
+            path (str, optional): Where to persist the index.
+            save_threshold (int, optional): Persist the index whenever a single
+                update indexes at least this many new IDs.
+        """
+        self.ids = ids
+        self.descriptions = descriptions
+        self.path = path
+        self.save_threshold = save_threshold
+        self.count = 0  # Number of IDs indexed so far
+        self.last_id = None
+        self.terms = []  # Code -> word
+        self.rows = []  # Code -> rows of the descriptions containing the word, ascending
+        self.repeats = {}  # (code << 32) | row -> occurrences of the word in the row, where more than one
+        self.lengths = array("I")  # Row -> words in the description
+        self.documents = 0  # Rows with a non-empty description
+        self.total_length = 0
+        self._codes = {}  # Word -> code
+
+    @classmethod
+    def open(cls, ids, descriptions, path=None, save_threshold=100000):
+        """
+        Loads a persisted index if it matches ids, else starts an empty one.
+
+        Args:
+            ids, descriptions, path, save_threshold: See __init__.
+
+        Returns:
+            TextIndex: The index, brought up to date with ids.
+        """
+        index = cls(ids, descriptions, path, save_threshold)
+        if path and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    data = marshal.load(f)
+                if (data["version"] == INDEX_VERSION and 0 < data["count"] <= len(ids)
+                        and ids[data["count"] - 1] == data["last_id"]):
+                    index._restore(data)
+            except (OSError, EOFError, ValueError, TypeError, KeyError):
+                pass  # Unreadable or stale; rebuild from scratch
+        index.update()
+        return index
+
+    def tracks(self, ids, descriptions):
+        """
+        Tells whether this index is for the given list and descriptions.
+
+        The owner's list is replaced wholesale by load_config; the index then
+        has to be reopened.
+        """
+        return self.ids is ids and self.descriptions is descriptions and self.count <= len(ids)
+
+    def _restore(self, data):
+        self.count = data["count"]
+        self.last_id = data["last_id"]
+        self.terms = data["terms"]
+        self._codes = {term: code for code, term in enumerate(self.terms)}
+        self.rows = [array("I", rows) for rows in data["rows"]]
+        self.repeats = data["repeats"]
+        self.lengths = array("I", data["lengths"])
+        self.documents = data["documents"]
+        self.total_length = data["total_length"]
+
+    def save(self):
+        """Writes the index to its path, replacing any previous copy atomically."""
+        if not self.path:
+            return
+        data = {
+            "version": INDEX_VERSION,
+            "count": self.count,
+            "last_id": self.last_id,
+            "terms": self.terms,
+            "rows": [rows.tobytes() for rows in self.rows],
+            "repeats": self.repeats,
+            "lengths": self.lengths.tobytes(),
+            "documents": self.documents,
+            "total_length": self.total_length,
+        }
+        tmp_file = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                marshal.dump(data, f)
+            os.replace(tmp_file, self.path)
+        except OSError as e:
+            print(f"Error saving text index: {e}")
+
+    def update(self):
+        """Indexes the descriptions of the IDs appended to the list since the last update."""
+        ids = self.ids
+        start = self.count
+        if start == len(ids):
+            return
+        descriptions = self.descriptions
+        if len(ids) - start > 10000:
+            descriptions = dict(descriptions.items())  # One pass instead of a lookup per ID (e.g. in SQLite)
+        # Rows are collected per word first, so that each word is looked up once per update.
+        new_rows = collections.defaultdict(list)  # Word -> rows
+        repeats = []  # (word, row, occurrences)
+        lengths = self.lengths
+        for row, issued_id in enumerate(ids[start:], start):
+            words = tokenize(descriptions.get(issued_id))
+            lengths.append(len(words))
+            if not words:
+                continue
+            self.documents += 1
+            self.total_length += len(words)
+            unique = set(words)
+            if len(unique) < len(words):
+                repeats.extend((word, row, occurrences)
+                               for word, occurrences in collections.Counter(words).items() if occurrences > 1)
+            for word in unique:
+                new_rows[word].append(row)
+        codes = self._codes
+        for word, rows in new_rows.items():
+            code = codes.get(word)
+            if code is None:
+                code = codes[word] = len(self.terms)
+                self.terms.append(word)
+                self.rows.append(array("I"))
+            self.rows[code].extend(rows)
+        for word, row, occurrences in repeats:
+            self.repeats[(codes[word] << 32) | row] = occurrences
+        self.count = len(ids)
+        self.last_id = ids[-1]
+        if self.count - start >= self.save_threshold:
+            self.save()
+
+    def search(self, query, limit=20):
+        """
+        Finds the IDs whose description contains every word and phrase of a query.
+
+        Args:
+            query (str): Words, and phrases in double quotes, e.g.
+                'lazarus "npm packages"'.  Case and punctuation are ignored.
+            limit (int, optional): Return at most this many IDs.  None returns
+                all matches.
+
+        Returns:
+            list: (ID, score) tuples, best match first; among equal scores,
+                the most recently issued ID first.
+        """
+        self.update()
+        words, phrases = parse_query(query)
+        codes = [self._codes.get(word) for word in words]
+        if not codes or None in codes:
+            return []
+        codes.sort(key=lambda code: len(self.rows[code]))
+
+        # Intersect the rows, rarest word first, scoring as we go (BM25).
+        documents = self.documents
+        average = self.total_length / documents
+        lengths = self.lengths
+        repeats = self.repeats
+        scores = None
+        for code in codes:
+            rows = self.rows[code]
+            idf = math.log(1 + (documents - len(rows) + 0.5) / (len(rows) + 0.5))
+            if scores is None:
+                candidates = rows
+            elif len(scores) * 16 < len(rows):  # Few candidates: binary search each one
+                candidates = [row for row in scores if _has(rows, row)]
+            else:
+                candidates = [row for row in rows if row in scores]
+            matched = {}
+            code_key = code << 32
+            for row in candidates:
+                frequency = repeats.get(code_key | row, 1)
+                weight = idf * frequency * (K1 + 1) / (frequency + K1 * (1 - B + B * lengths[row] / average))
+                matched[row] = (scores[row] if scores is not None else 0.0) + weight
+            scores = matched
+            if not scores:
+                return []
+
+        ids = self.ids
+        ranked = ((score, row) for row, score in scores.items())
+        if not phrases:
+            best = heapq.nlargest(len(scores) if limit is None else limit, ranked)
+            return [(ids[row], round(score, 4)) for score, row in best]
+        results = []
+        for score, row in sorted(ranked, reverse=True):
+            issued_id = ids[row]
+            words = tokenize(self.descriptions.get(issued_id))
+            if all(_contains(words, phrase) for phrase in phrases):
+                results.append((issued_id, round(score, 4)))
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
@@ -1,74 +1,188 @@
+import argparse
+import contextlib
 import datetime
-import os
-import json
+import functools
+import sys
+import BatchIO
+import CounterRetention
+import Exporter
+import Importer
+import Leasing
+import Metrics
+import NamingScheme
+import Paging
+from Allowlist import Allowlist
+from IDIndex import IDIndex, date_key
+from IDMembership import IDMembership
+from SQLiteStore import migrate_from_json
+from StorageBackend import CorruptStateError, open_store
+from TextIndex import TextIndex
+from WriteBehind import DebouncedFlusher, SettingsTracker
 
 class VTNaming:
     """
     A class to generate names and descriptions for VirusTotal collections
     and names for VirusTotal graphs.
     """
-    def __init__(self):
+    METRICS_TOOL = "vt"  # "tool" label of the metrics (see Metrics)
+    # Allowlist fields and the alias maps that go with them
+    ALLOWLIST_ALIASES = {
+        "valid_collection_sources": "collection_source_aliases",
+        "valid_graph_sources": "graph_source_aliases",
+    }
+    # Shape of the state kept by the storage backend (see StorageBackend)
+    STATE_FIELDS = {
+        "collection_counts": "counter",
+        "generated_collection_ids": "list",
+        "collection_descriptions": "map",
+        "graph_counts": "counter",
+        "generated_graph_ids": "list",
+        "archived_collection_counts": "map",
+        "archived_graph_counts": "map",
+    }
+
+    # Settings written by save_config(), as opposed to state journaled on every allocation
+    SETTINGS_FIELDS = ("base_filename", "valid_collection_sources", "valid_graph_sources", "collection_source_aliases",
+                       "graph_source_aliases", "counter_retention_days", "counter_archive", "bloom_filter_threshold",
+                       "id_schemes")
+
+    def __init__(self, config_file="vt_naming_config.json"):
         """
         Initializes the VTNaming class.
+
+        Args:
+            config_file (str, optional): Path of the configuration file.  Several
+                processes may share the same file.  A path ending in .db or
+                .sqlite selects the SQLite backend.
         """
+        self._settings = SettingsTracker(self, self.SETTINGS_FIELDS)
         self.collection_counts = {}
         self.generated_collection_ids = []
         self.collection_descriptions = {}
         self.graph_counts = {}
         self.generated_graph_ids = []
-        self.config_file = "vt_naming_config.json"  # Configuration file name
+        self.archived_collection_counts = {}  # Counters of closed days (see retire_counters)
+        self.archived_graph_counts = {}
+        self.export_watermarks = {}  # "name[?filters]:kind" -> number of IDs already exported
+        self.leases = {}  # Lease ID -> blocks of numbers leased to workers (see Leasing)
+        self._allowlists = {}  # Lookup indexes built from the valid_* lists
+        self._schemes = None  # Compiled from id_schemes on first use
+        self._indexes = {}  # Search indexes, opened on the first search
+        self._memberships = {}  # Issued-ID membership checks, opened on the first allocation
+        self._text_index = None  # Opened on the first description search
+        self.config_file = config_file  # Configuration file name
+        self.store = open_store(self, self.config_file)
+        Metrics.REGISTRY.track(self)
         self.load_config()  # Load configuration at initialization
+        self.retire_counters()
 
+    @Metrics.timed("load")
     def load_config(self):
-        """Loads configuration from a JSON file."""
-        if os.path.exists(self.config_file):
-            try:
-                with open(self.config_file, "r") as f:
-                    config = json.load(f)
-                    self.collection_counts = config.get("collection_counts", {})
-                    self.generated_collection_ids = config.get("generated_collection_ids", [])
-                    self.collection_descriptions = config.get("collection_descriptions", {})
-                    self.graph_counts = config.get("graph_counts", {})
-                    self.generated_graph_ids = config.get("generated_graph_ids", [])
-                    self.base_filename = config.get("base_filename", "vt_names.txt")
-                    self.valid_collection_sources = config.get("valid_collection_sources", [])
-                    self.valid_graph_sources = config.get("valid_graph_sources", [])
-                    print("Configuration loaded from", self.config_file)
-            except json.JSONDecodeError:
-                print("Error: Invalid JSON in configuration file. Using default settings.")
-                self.collection_counts = {}
-                self.generated_collection_ids = []
-                self.collection_descriptions = {}
-                self.graph_counts = {}
-                self.generated_graph_ids = []
-                self.base_filename = "vt_names.txt"
-                self.valid_collection_sources = []
-                self.valid_graph_sources = []
+        """Loads configuration from the storage backend (see StorageBackend.open_store)."""
+        with self._settings.reloading():  # Settings changed here but not yet saved are kept
+            self._load_config()
+
+    def _load_config(self):
+        try:
+            config = self.store.load()
+        except CorruptStateError as e:
+            # Falling back to empty counters here would re-issue IDs that are already in use.
+            print(f"Error: Cannot load {self.config_file}: {e}")
+            raise
+        if config is not None:
+            self.collection_counts = config.get("collection_counts", {})
+            self.generated_collection_ids = config.get("generated_collection_ids", [])
+            self.collection_descriptions = config.get("collection_descriptions", {})
+            self.graph_counts = config.get("graph_counts", {})
+            self.generated_graph_ids = config.get("generated_graph_ids", [])
+            self.archived_collection_counts = config.get("archived_collection_counts", {})
+            self.archived_graph_counts = config.get("archived_graph_counts", {})
+            self.base_filename = config.get("base_filename", "vt_names.txt")
+            self.valid_collection_sources = config.get("valid_collection_sources", [])
+            self.valid_graph_sources = config.get("valid_graph_sources", [])
+            self.collection_source_aliases = config.get("collection_source_aliases", {})
+            self.graph_source_aliases = config.get("graph_source_aliases", {})
+            self.export_watermarks = config.get("export_watermarks", {})
+            self.leases = config.get("leases", {})
+            self.counter_retention_days = config.get("counter_retention_days")  # None keeps every counter hot
+            self.counter_archive = config.get("counter_archive", True)
+            self.bloom_filter_threshold = config.get("bloom_filter_threshold", 100000)
+            self.id_schemes = config.get("id_schemes", {})  # Kind -> ID template (see NamingScheme)
+            self.store.compact_threshold = config.get("journal_compact_threshold", self.store.compact_threshold)
+            print("Configuration loaded from", self.config_file)
         else:
             print("Configuration file not found. Using default settings.")
             self.base_filename = "vt_names.txt"
             self.valid_collection_sources = []
             self.valid_graph_sources = []
+            self.collection_source_aliases = {}
+            self.graph_source_aliases = {}
+            self.export_watermarks = {}
+            self.leases = {}
+            self.counter_retention_days = None
+            self.counter_archive = True
+            self.bloom_filter_threshold = 100000
+            self.id_schemes = {}
 
-    def save_config(self):
-        """Saves configuration to a JSON file."""
-        config = {
-            "collection_counts": self.collection_counts,
-            "generated_collection_ids": self.generated_collection_ids,
-            "collection_descriptions": self.collection_descriptions,
-            "graph_counts": self.graph_counts,
-            "generated_graph_ids": self.generated_graph_ids,
+    def _config_snapshot(self):
+        """Returns a copy of the full configuration for the store to write as a snapshot."""
+        return {
+            "collection_counts": dict(self.collection_counts),
+            "generated_collection_ids": self.generated_collection_ids.copy(),
+            "collection_descriptions": self.collection_descriptions.copy(),
+            "graph_counts": dict(self.graph_counts),
+            "generated_graph_ids": self.generated_graph_ids.copy(),
+            "archived_collection_counts": self.archived_collection_counts.copy(),
+            "archived_graph_counts": self.archived_graph_counts.copy(),
             "base_filename": self.base_filename,
-            "valid_collection_sources": self.valid_collection_sources,
-            "valid_graph_sources": self.valid_graph_sources,
+            "valid_collection_sources": list(self.valid_collection_sources),
+            "valid_graph_sources": list(self.valid_graph_sources),
+            "collection_source_aliases": dict(self.collection_source_aliases),
+            "graph_source_aliases": dict(self.graph_source_aliases),
+            "export_watermarks": dict(self.export_watermarks),
+            "leases": dict(self.leases),
+            "counter_retention_days": self.counter_retention_days,
+            "counter_archive": self.counter_archive,
+            "bloom_filter_threshold": self.bloom_filter_threshold,
+            "id_schemes": dict(self.id_schemes),
+            "journal_compact_threshold": self.store.compact_threshold,
         }
+
+    @Metrics.timed("save")
+    def save_config(self, quiet=False):
+        """
+        Saves the settings that changed since they were last loaded or saved.
+
+        Allocations are journaled as they happen, so only changed settings are
+        written here, and nothing at all if none changed.
+
+        Args:
+            quiet (bool, optional): Do not print a message after saving.
+
+        Returns:
+            bool: True if anything was written.
+        """
+        dirty = self._settings.dirty()
+        if not dirty:
+            return False
         try:
-            with open(self.config_file, "w") as f:
-                json.dump(config, f, indent=4)
-            print("Configuration saved to", self.config_file)
+            self.store.commit([["set", field, getattr(self, field)] for field in dirty])
         except Exception as e:
             print(f"Error saving configuration: {e}")
+            return False
+        self._settings.mark_clean(*dirty)
+        if not quiet:
+            print("Configuration saved to", self.config_file)
+        return True
+
+    def dirty_settings(self):
+        """
+        Returns:
+            list: Names of the settings changed since they were last loaded or saved.
+        """
+        return self._settings.dirty()
 
+    @Metrics.timed("allocate", "collections")
     def generate_collection_id(self, source, collection_date=None, description=None):
         """
         Generates a unique ID for VirusTotal collections.
@@ -82,52 +196,185 @@ class VTNaming:
         Returns:
             str: The generated collection ID, or None on error.
         """
+        request = self._validate_collection_request(source, collection_date)
+        if request is None:
+            return None
+        # Reserve the number and journal it atomically, as one durable record
+        return NamingScheme.allocate(self, "collections", [(request, description)])[0]
+
+    @Metrics.timed("allocate", "collections")
+    def generate_collection_ids_batch(self, requests):
+        """
+        Generates IDs for many VirusTotal collections at once.
+
+        All requests are validated first, a contiguous block of numbers is then
+        reserved for each source/date key, and the whole batch is written to
+        the journal as a single record.
+
+        Args:
+            requests (iterable): (source, collection_date, description) tuples,
+                with the same meaning as the arguments of generate_collection_id.
+
+        Returns:
+            list: The generated collection IDs in request order, with None in
+                place of requests that failed validation.
+        """
+        return NamingScheme.allocate(self, "collections", [
+            (self._validate_collection_request(source, collection_date), description)
+            for source, collection_date, description in requests
+        ])
+
+    @Metrics.timed("validate", "collections")
+    def _validate_collection_request(self, source, collection_date):
+        """
+        Validates the arguments of a collection ID request.
+
+        Args:
+            source (str): The source of the collection.
+            collection_date (datetime.date): The date of the collection, or None for today.
+
+        Returns:
+            dict: The canonical source and the collection date in %Y%m%d format,
+                or None if the request is invalid.
+        """
         if collection_date is None:
             collection_date = datetime.date.today()
         if not isinstance(collection_date, datetime.date):
             print("Error: collection_date must be a datetime.date object.")
             return None
 
-        if self.valid_collection_sources and source not in self.valid_collection_sources:
-            print(f"Error: Invalid collection source '{source}'. Valid sources are: {self.valid_collection_sources}")
+        if not source:
+            print("Error: collection source is required.")
             return None
+        if not isinstance(source, str):
+            print(f"Error: Invalid collection source '{source}': values must be strings.")
+            return None
+
+        sources = self.get_allowlist("valid_collection_sources")
+        if sources:
+            canonical = sources.resolve(source)
+            if canonical is None:
+                print(f"Error: Invalid collection source '{source}'. Valid sources are: {sources.describe()}")
+                return None
+            source = canonical
+        reason = NamingScheme.invalid_value(source)
+        if reason:
+            print(f"Error: Invalid collection source '{source}': {reason}.")
+            return None
+        return {"source": source, "date": collection_date.strftime("%Y%m%d")}
+
+    @Metrics.timed("allocate", "graphs")
+    def generate_graph_id(self, source, graph_date=None):
+        """
+        Generates a unique ID for VirusTotal graphs.
 
-        date_str = collection_date.strftime("%Y%m%d")
-        collection_number = self._get_next_collection_number(source, date_str)
-        collection_id = f"COL-{source}-{date_str}-{collection_number:02d}"
-        self.generated_collection_ids.append(collection_id)
-        if description:
-            self.collection_descriptions[collection_id] = description
-        return collection_id
+        Args:
+            source (str): The source of the graph.
+            graph_date (datetime.date, optional): The date of the graph. Defaults to today.
+
+        Returns:
+            str: The generated graph ID, or None on error.
+        """
+        request = self._validate_graph_request(source, graph_date)
+        if request is None:
+            return None
+        # Reserve the number and journal it atomically, as one durable record
+        return NamingScheme.allocate(self, "graphs", [(request, None)])[0]
 
-    def _get_next_collection_number(self, source, date_str):
+    @Metrics.timed("allocate", "graphs")
+    def generate_graph_ids_batch(self, requests):
         """
-        Gets the next collection number for a source and date.
+        Generates IDs for many VirusTotal graphs at once.
+
+        Works like generate_collection_ids_batch: one validation pass, one
+        contiguous block of numbers per source/date key and one journal record.
 
         Args:
-            source (str): Source of the collection.
-            date_str (str): Date string.
+            requests (iterable): (source, graph_date) tuples, with the same
+                meaning as the arguments of generate_graph_id.
 
         Returns:
-            int: Next collection number.
+            list: The generated graph IDs in request order, with None in place
+                of requests that failed validation.
+        """
+        return NamingScheme.allocate(self, "graphs", [
+            (self._validate_graph_request(source, graph_date), None) for source, graph_date in requests
+        ])
+
+    @Metrics.timed("lease")
+    def lease_block(self, kind, source, block_date=None, count=1000, ttl=Leasing.DEFAULT_TTL, holder=None):
         """
-        key = f"{source}|{date_str}"
-        if key not in self.collection_counts:
-            self.collection_counts[key] = 1
+        Leases a block of collection or graph numbers to a worker.
+
+        The worker numbers IDs from the block itself (see Leasing.Lease), with
+        no access to this configuration, and reports them back with
+        reconcile_lease().  The numbers are taken from the counter right away,
+        so nothing else issues them.
+
+        Args:
+            kind (str): "collections" or "graphs".
+            source (str): The source of the IDs.
+            block_date (datetime.date, optional): The date of the IDs.  Defaults to today.
+            count (int, optional): How many numbers to lease.
+            ttl (float, optional): Seconds until the lease expires and the
+                worker stops issuing IDs from it.
+            holder (str, optional): Name of the worker, shown in lease listings.
+
+        Returns:
+            Leasing.Lease: The lease, or None on error.
+        """
+        if kind == "collections":
+            request = self._validate_collection_request(source, block_date)
+        elif kind == "graphs":
+            request = self._validate_graph_request(source, block_date)
         else:
-            self.collection_counts[key] += 1
-        return self.collection_counts[key]
+            print(f"Error: Unknown kind '{kind}'.  Use collections or graphs.")
+            return None
+        if request is None:
+            return None
+        return Leasing.lease(self, kind, request, count, ttl, holder)
 
-    def generate_graph_id(self, source, graph_date=None):
+    @Metrics.timed("import")
+    def reconcile_lease(self, report, final=None):
         """
-        Generates a unique ID for VirusTotal graphs.
+        Records the IDs a worker issued from a lease (see Leasing.reconcile).
+
+        Args:
+            report (dict or Leasing.Lease): The worker's report (Lease.report()
+                or the lease file).
+            final (bool, optional): Close the lease and take back the numbers
+                it did not use.  Defaults to whether the worker closed it.
+
+        Returns:
+            dict: "imported", "skipped" and "rejected" ID counts and the number
+                of "returned" numbers, or None if the lease is unknown.
+        """
+        return Leasing.reconcile(self, report, final)
+
+    def expired_leases(self, now=None):
+        """
+        Lists the leases that expired without being reconciled.
+
+        Args:
+            now (float, optional): Seconds since the epoch.  Defaults to the current time.
+
+        Returns:
+            list: The lease records, oldest expiry first.
+        """
+        return Leasing.expired_leases(self, now)
+
+    @Metrics.timed("validate", "graphs")
+    def _validate_graph_request(self, source, graph_date):
+        """
+        Validates the arguments of a graph ID request.
 
         Args:
             source (str): The source of the graph.
-            graph_date (datetime.date, optional): The date of the graph. Defaults to today.
+            graph_date (datetime.date): The date of the graph, or None for today.
 
         Returns:
-            str: The generated graph ID, or None on error.
+            dict: The canonical source and the graph date in %Y%m%d format, or
+                None if the request is invalid.
         """
         if graph_date is None:
             graph_date = datetime.date.today()
@@ -135,33 +382,94 @@ class VTNaming:
             print("Error: graph_date must be a datetime.date object.")
             return None
 
-        if self.valid_graph_sources and source not in self.valid_graph_sources:
-            print(f"Error: Invalid graph source '{source}'. Valid sources are: {self.valid_graph_sources}")
+        if not source:
+            print("Error: graph source is required.")
+            return None
+        if not isinstance(source, str):
+            print(f"Error: Invalid graph source '{source}': values must be strings.")
             return None
 
-        date_str = graph_date.strftime("%Y%m%d")
-        graph_number = self._get_next_graph_number(source, date_str)
-        graph_id = f"GRAPH-{source}-{date_str}-{graph_number:02d}"
-        self.generated_graph_ids.append(graph_id)
-        return graph_id
+        sources = self.get_allowlist("valid_graph_sources")
+        if sources:
+            canonical = sources.resolve(source)
+            if canonical is None:
+                print(f"Error: Invalid graph source '{source}'. Valid sources are: {sources.describe()}")
+                return None
+            source = canonical
+        reason = NamingScheme.invalid_value(source)
+        if reason:
+            print(f"Error: Invalid graph source '{source}': {reason}.")
+            return None
+        return {"source": source, "date": graph_date.strftime("%Y%m%d")}
 
-    def _get_next_graph_number(self, source, date_str):
+    def get_allowlist(self, field):
         """
-        Gets the next graph number for a source and date.
+        Returns the lookup index for an allowlist, rebuilding it if the list was replaced.
 
         Args:
-            source (str): Source of the graph.
-            date_str (str): Date string.
+            field (str): "valid_collection_sources" or "valid_graph_sources".
 
         Returns:
-            int: The next graph number.
+            Allowlist: The index.
         """
-        key = f"{source}|{date_str}"
-        if key not in self.graph_counts:
-            self.graph_counts[key] = 1
-        else:
-            self.graph_counts[key] += 1
-        return self.graph_counts[key]
+        values = getattr(self, field)
+        aliases = getattr(self, self.ALLOWLIST_ALIASES[field])
+        allowlist = self._allowlists.get(field)
+        if allowlist is None or not allowlist.tracks(values, aliases):
+            allowlist = self._allowlists[field] = Allowlist(values, aliases)
+        return allowlist
+
+    def update_allowlist(self, field, add=(), remove=(), aliases=None):
+        """
+        Changes an allowlist in place, e.g. after syncing sources from MISP.
+
+        Only the affected index entries are touched, and the new list is
+        journaled so other processes pick it up.
+
+        Args:
+            field (str): "valid_collection_sources" or "valid_graph_sources".
+            add (iterable, optional): Sources to allow.
+            remove (iterable, optional): Sources to disallow.
+            aliases (dict, optional): Alternative spellings to add, mapped to
+                their canonical names.
+        """
+        aliases_field = self.ALLOWLIST_ALIASES[field]
+        with self.store.transaction():
+            allowlist = self.get_allowlist(field)
+            for value in add:
+                allowlist.add(value)
+            for value in remove:
+                allowlist.remove(value)
+            for alias, canonical in (aliases or {}).items():
+                allowlist.add_alias(alias, canonical)
+            self.store.commit([["set", field, allowlist.values], ["set", aliases_field, allowlist.aliases]])
+            self._settings.mark_clean(field, aliases_field)
+
+    def retire_counters(self, today=None):
+        """
+        Moves the counters of closed days out of collection_counts and graph_counts.
+
+        Works like CTINaming.retire_counters: only days within
+        counter_retention_days of today stay in the hot dicts, older ones are
+        archived (or dropped if counter_archive is false).
+
+        Args:
+            today (datetime.date, optional): Defaults to the current date.
+
+        Returns:
+            int: The number of counters retired.
+        """
+        if self.counter_retention_days is None:
+            return 0
+        cutoff = CounterRetention.retention_cutoff(self.counter_retention_days, today)
+        ops = []
+        with self.store.transaction():
+            for field in ("collection_counts", "graph_counts"):
+                archive = getattr(self, "archived_" + field) if self.counter_archive else None
+                ops += CounterRetention.retirement_ops(getattr(self, field), field, archive, "archived_" + field, cutoff)
+            if ops:
+                self.store.commit(ops)
+        return sum(op[0] == "delete" for op in ops)
 
     def save_ids(self, filename=None):
         """
@@ -177,21 +485,158 @@ class VTNaming:
             print("No collection or graph IDs to save.")
             return False
 
+        if self.export_ids(filename) is None:
+            return False
+        print(f"IDs and descriptions saved to {filename}")
+        return True
+
+    @Metrics.timed("export")
+    def export_ids(self, filename=None, fmt="txt", kinds=("collections", "graphs"), source=None, date_from=None,
+                   date_to=None, since=None, chunk_size=1000):
+        """
+        Streams issued collection and/or graph IDs to a file.
+
+        IDs are read and written chunk_size at a time, so neither the full
+        lists nor the output are held in memory.  Records carry a "kind"
+        field ("collection" or "graph"); the text format writes each kind
+        under its own heading.
+
+        Args:
+            filename (str, optional): The file to write, "-" for stdout, or an
+                open text stream.
+                Defaults to the configured base filename.
+            fmt (str, optional): "txt", "csv", "jsonl" or "stix" (a STIX 2.1
+                bundle of report objects).
+            kinds (tuple, optional): "collections" and/or "graphs".
+            source, date_from, date_to: Optional filters, as for
+                find_collections().
+            since (str, optional): Name of an export watermark, e.g. "tip".
+                Only IDs issued after the last successful export with the same
+                name and filters are written, and the watermark is advanced
+                afterwards (see Exporter.watermark_key).
+            chunk_size (int, optional): Number of IDs formatted per write.
+
+        Returns:
+            int: The number of IDs exported, or None on error.
+        """
+        if filename is None:
+            filename = self.base_filename
+        sections = {
+            "collections": ("VirusTotal Collections:", "collection", self.generated_collection_ids,
+                            "valid_collection_sources"),
+            "graphs": ("VirusTotal Graphs:", "graph", self.generated_graph_ids, "valid_graph_sources"),
+        }
+        filters = {kind: {} for kind in kinds}
+        if source:
+            for kind in kinds:
+                filters[kind]["source"] = self.get_allowlist(sections[kind][3]).resolve(source) or source
+        marks = {kind: f"{Exporter.watermark_key(since, filters[kind], date_key(date_from), date_key(date_to))}:{kind}"
+                 for kind in kinds}
+        with self.store.transaction():  # Catch up with other processes
+            ranges = {
+                kind: (self.export_watermarks.get(marks[kind], 0) if since else 0, len(sections[kind][2]))
+                for kind in kinds
+            }
+        watermark_ops = []
         try:
-            with open(filename, "w") as f:
-                f.write("VirusTotal Collections:\n")
-                for collection_id in self.generated_collection_ids:
-                    description = self.collection_descriptions.get(collection_id, "No description")
-                    f.write(f"{collection_id}: {description}\n")
-                f.write("\nVirusTotal Graphs:\n")
-                for graph_id in self.generated_graph_ids:
-                    f.write(f"{graph_id}\n")
-            print(f"IDs and descriptions saved to {filename}")
-            self.save_config()
-            return True
-        except Exception as e:
+            with Exporter.open_output(filename) as f:
+                exporter = Exporter.Exporter(f, fmt, ("kind", "source", "date"), chunk_size, "VirusTotal Naming")
+                for kind in kinds:
+                    title, record_kind, ids, _ = sections[kind]
+                    start, stop = ranges[kind]
+                    records = Exporter.select(ids, self.scheme(kind).parse, ("source", "date"), filters[kind],
+                                              date_key(date_from), date_key(date_to), start, stop)
+                    if kind == "collections":
+                        missing = "No description" if fmt == "txt" else ""
+                        records = (dict(record, kind=record_kind,
+                                        description=self.collection_descriptions.get(record["id"], missing))
+                                   for record in records)
+                    else:
+                        records = (dict(record, kind=record_kind) for record in records)
+                    exporter.section(title)
+                    exporter.write(records)
+                    watermark_ops.append(["put", "export_watermarks", marks[kind], stop])
+                exporter.close()
+        except (OSError, ValueError) as e:
             print(f"Error saving IDs: {e}")
-            return False
+            return None
+        if since:
+            self.store.commit(watermark_ops)
+        return exporter.count
+
+    @Metrics.timed("import")
+    def import_ids(self, filename, fmt=None, id_column="id", description_column="description", workers=None,
+                   chunk_size=10000, rejects_file=None):
+        """
+        Imports collection and graph IDs issued elsewhere and raises the counters to match.
+
+        Reads the files written by save_ids (with their section headings), or
+        CSV and JSONL exports, validates every ID against the collection and
+        graph schemes (COL-source-YYYYMMDD-NN and GRAPH-source-YYYYMMDD-NN by
+        default) and adds the ones not issued yet (see Importer.import_ids).
+
+        Args:
+            filename (str): The file to import, or "-" for stdin.
+            fmt (str, optional): "txt", "csv" or "jsonl".  Guessed from the
+                file name by default.
+            id_column (str, optional): CSV column or JSON key holding the ID.
+            description_column (str, optional): CSV column or JSON key holding
+                the collection description.
+            workers (int, optional): Parser processes; by default a process
+                pool is used for large files only.
+            chunk_size (int, optional): IDs committed per journal record.
+            rejects_file (str, optional): File to list every rejected line in.
+
+        Returns:
+            dict: Import statistics, or None on error.
+        """
+        kinds = ("collections", "graphs")
+        targets = {kind: self.target(kind) for kind in kinds}
+        return Importer.import_ids(self, filename, self.schemes().grammar(kinds), targets, fmt, id_column,
+                                   description_column, workers, chunk_size, rejects_file)
+
+    def schemes(self):
+        """
+        Returns the compiled ID schemes, recompiling them if id_schemes changed.
+
+        id_schemes may override the "collections" and "graphs" templates, e.g.
+        with "COL-{source}-{date}-{number:03}" (see NamingScheme.SchemeSet).
+
+        Returns:
+            NamingScheme.SchemeSet: The schemes.
+        """
+        if self._schemes is None or not self._schemes.tracks(self.id_schemes):
+            self._schemes = NamingScheme.SchemeSet(self.id_schemes, ("collections", "graphs"))
+        return self._schemes
+
+    def scheme(self, kind):
+        """
+        Returns the compiled ID scheme of a kind.
+
+        Args:
+            kind (str): "collections" or "graphs".
+
+        Returns:
+            NamingScheme.Scheme: The scheme.
+        """
+        return self.schemes()[kind]
+
+    def target(self, kind):
+        """
+        Returns where the IDs of a kind are kept, for NamingScheme.allocate and Importer.import_ids.
+
+        Args:
+            kind (str): "collections" or "graphs".
+
+        Returns:
+            NamingScheme.Target: The state fields, membership check and search of the kind.
+        """
+        if kind == "collections":
+            return NamingScheme.Target("collection_counts", "generated_collection_ids", "collection_descriptions",
+                                       "archived_collection_counts", functools.partial(self.membership, kind),
+                                       self.find_collections)
+        return NamingScheme.Target("graph_counts", "generated_graph_ids", None, "archived_graph_counts",
+                                   functools.partial(self.membership, kind), self.find_graphs)
 
     def get_collection_description(self, collection_id):
         """
@@ -205,32 +650,421 @@ class VTNaming:
         """
         return self.collection_descriptions.get(collection_id)
 
-    def display_all_generated(self):
-        """Displays all generated collection and graph IDs and descriptions."""
+    def id_index(self, kind):
+        """
+        Returns the search index over collection or graph IDs, opening it on first use.
+
+        The index is persisted next to the configuration file and catches up
+        with newly issued IDs on every query.
+
+        Args:
+            kind (str): "collections" or "graphs".
+
+        Returns:
+            IDIndex: The index.
+        """
+        ids = self.generated_collection_ids if kind == "collections" else self.generated_graph_ids
+        index = self._indexes.get(kind)
+        if index is None or not index.tracks(ids):
+            index = self._indexes[kind] = IDIndex.open(
+                ids,
+                ("source", "date"),
+                self.scheme(kind).parse,
+                f"{self.config_file}.{kind}.index",
+            )
+        return index
+
+    def membership(self, kind):
+        """
+        Returns the membership check over collection or graph IDs, opening it on first use.
+
+        Histories of at least bloom_filter_threshold IDs are checked through a
+        Bloom filter persisted next to the configuration file.
+
+        Args:
+            kind (str): "collections" or "graphs".
+
+        Returns:
+            IDMembership: The membership.
+        """
+        ids = self.generated_collection_ids if kind == "collections" else self.generated_graph_ids
+        membership = self._memberships.get(kind)
+        if membership is None or not membership.tracks(ids):
+            membership = self._memberships[kind] = IDMembership.open(
+                ids, f"{self.config_file}.{kind}.bloom", self.bloom_filter_threshold
+            )
+        return membership
+
+    def metrics_gauges(self):
+        """
+        Returns the current size of the state, for Metrics.Registry.render.
+
+        Returns:
+            list: (metric name, labels, value) tuples.
+        """
+        labels = {"tool": self.METRICS_TOOL, "config": self.config_file}
+        gauges = []
+        for kind, ids, counts, archived in (
+            ("collections", self.generated_collection_ids, self.collection_counts, self.archived_collection_counts),
+            ("graphs", self.generated_graph_ids, self.graph_counts, self.archived_graph_counts),
+        ):
+            gauges.append(("naming_issued_ids", dict(labels, kind=kind), len(ids)))
+            gauges.append(("naming_counter_keys", dict(labels, kind=kind), len(counts)))
+            gauges.append(("naming_archived_counter_keys", dict(labels, kind=kind), len(archived)))
+        gauges.append(("naming_config_bytes", labels, Metrics.file_bytes(self.config_file)))
+        return gauges
+
+    def find_collections(self, source=None, date_from=None, date_to=None, prefix=None, limit=None):
+        """
+        Finds issued collection IDs by source, date range and/or ID prefix.
+
+        Args:
+            source (str, optional): Only collections from this source.
+            date_from (datetime.date or str, optional): First collection date to
+                include.  Strings may be shortened, e.g. "202503" for 1 March 2025.
+            date_to (datetime.date or str, optional): Last collection date to
+                include.  Strings may be shortened, e.g. "202503" for 31 March 2025.
+            prefix (str, optional): Only IDs starting with this string.
+            limit (int, optional): Return at most this many IDs.
+
+        Returns:
+            list: The matching collection IDs, in the order they were issued.
+        """
+        with self.store.transaction():
+            return self.id_index("collections").query(self._source_filters("collections", source), date_key(date_from),
+                                                      date_key(date_to), prefix, limit)
+
+    def _source_filters(self, kind, source):
+        if not source:
+            return {}
+        field = "valid_collection_sources" if kind == "collections" else "valid_graph_sources"
+        return {"source": self.get_allowlist(field).resolve(source) or source}
+
+    def text_index(self):
+        """
+        Returns the full-text index over collection_descriptions, opening it on first use.
+
+        Returns:
+            TextIndex: The description index, persisted next to the configuration file.
+        """
+        if (self._text_index is None
+                or not self._text_index.tracks(self.generated_collection_ids, self.collection_descriptions)):
+            self._text_index = TextIndex.open(self.generated_collection_ids, self.collection_descriptions,
+                                              self.config_file + ".collections.text")
+        return self._text_index
+
+    def search_collections(self, query, limit=20):
+        """
+        Finds collections by the words and phrases of their descriptions.
+
+        Args:
+            query (str): Words, and phrases in double quotes.  Every word and
+                phrase must match.
+            limit (int, optional): Return at most this many collections.  None
+                returns all matches.
+
+        Returns:
+            list: (collection ID, score) tuples, best match first.
+        """
+        with self.store.transaction():
+            return self.text_index().search(query, limit)
+
+    def find_graphs(self, source=None, date_from=None, date_to=None, prefix=None, limit=None):
+        """
+        Finds issued graph IDs by source, date range and/or ID prefix.
+
+        Takes the same arguments as find_collections.
+
+        Returns:
+            list: The matching graph IDs, in the order they were issued.
+        """
+        with self.store.transaction():
+            return self.id_index("graphs").query(self._source_filters("graphs", source), date_key(date_from),
+                                                 date_key(date_to), prefix, limit)
+
+    def iter_ids(self, kind, source=None, date_from=None, date_to=None, prefix=None, newest_first=True):
+        """
+        Finds issued collection or graph IDs like find_collections, but yields them one at a time.
+
+        Only the IDs actually consumed are read, so the first page of a large
+        history is shown without going through the rest.
+
+        Args:
+            kind (str): "collections" or "graphs".
+            source, date_from, date_to, prefix: See find_collections.
+            newest_first (bool, optional): Yield the most recently issued IDs first.
+
+        Returns:
+            iterator: The matching IDs.
+        """
+        with self.store.transaction():
+            return self.id_index(kind).iter_query(self._source_filters(kind, source), date_key(date_from),
+                                                  date_key(date_to), prefix, newest_first)
+
+    def id_summary(self, kind, source=None, date_from=None, date_to=None):
+        """
+        Counts issued collection or graph IDs per source and day from the counters.
+
+        The hot and archived counters are added up (see Paging.summarize)
+        instead of reading every issued ID.  Days retired with counter_archive
+        set to false have no counter left and are not counted.
+
+        Args:
+            kind (str): "collections" or "graphs".
+            source, date_from, date_to: See find_collections.
+
+        Returns:
+            dict: See Paging.summarize.
+        """
+        target = self.target(kind)
+        with self.store.transaction():
+            return Paging.summarize((getattr(self, target.counts_field), getattr(self, target.archive_field)),
+                                    self.scheme(kind).key_fields, self._source_filters(kind, source),
+                                    date_key(date_from), date_key(date_to))
+
+    def display_all_generated(self, kind=None, source=None, date_from=None, date_to=None, newest_first=True,
+                              page_size=Paging.PAGE_SIZE, prompt=input):
+        """
+        Displays generated collection and graph IDs and descriptions, a page at a time.
+
+        Descriptions are looked up only for the collections shown.
+
+        Args:
+            kind (str, optional): "collections" or "graphs".  Defaults to both.
+            source, date_from, date_to: Only show matching IDs (see find_collections).
+            newest_first (bool, optional): Show the most recently issued IDs first.
+            page_size (int, optional): Lines per page.  None shows all at once.
+            prompt (callable, optional): Asks whether to show the next page
+                (see Paging.show_pages).
+        """
         if not self.generated_collection_ids and not self.generated_graph_ids:
             print("No collections or graphs generated yet.")
             return
 
-        print("\nGenerated VirusTotal Collections:")
-        if self.generated_collection_ids:
-            for collection_id in self.generated_collection_ids:
-                description = self.collection_descriptions.get(collection_id, "No description")
-                print(f"- {collection_id}: {description}")
-        else:
-            print("  None")
+        def lines():
+            for current in (kind,) if kind else ("collections", "graphs"):
+                yield f"\nGenerated VirusTotal {current.capitalize()}:"
+                shown = 0
+                for issued_id in self.iter_ids(current, source, date_from, date_to, newest_first=newest_first):
+                    shown += 1
+                    if current == "collections":
+                        yield f"- {issued_id}: {self.collection_descriptions.get(issued_id, 'No description')}"
+                    else:
+                        yield f"- {issued_id}"
+                if not shown:
+                    yield "  None"
+
+        Paging.show_pages(lines(), page_size, prompt)
+
+    def display_summary(self, kind=None, source=None, date_from=None, date_to=None, page_size=Paging.PAGE_SIZE,
+                        prompt=input):
+        """
+        Displays the number of issued collection and graph IDs per source and day.
+
+        Args:
+            kind (str, optional): "collections" or "graphs".  Defaults to both.
+            source, date_from, date_to: See id_summary.
+            page_size, prompt: See display_all_generated.
+        """
+        def lines():
+            for current in (kind,) if kind else ("collections", "graphs"):
+                summary = self.id_summary(current, source, date_from, date_to)
+                yield from Paging.summary_lines(summary, self.scheme(current).key_fields,
+                                                f"VirusTotal {current.capitalize()}")
+
+        Paging.show_pages(lines(), page_size, prompt)
+
+def run_batch(namer, kind, fmt="csv", chunk_size=1000, stdin=None, stdout=None):
+    """
+    Assigns collection or graph IDs to requests read from stdin and streams them to stdout.
+
+    Collection requests have the fields source, date (YYYYMMDD, empty for
+    today) and description; graph requests have source and date.  Each chunk
+    is allocated with a single batch call and written out as soon as it is
+    done, with the assigned ID appended (empty for rejected requests).  Errors
+    and the final summary go to stderr.
+
+    Args:
+        namer (VTNaming): The naming object to allocate from.
+        kind (str): "collections" or "graphs".
+        fmt (str, optional): "csv" or "jsonl", used for input and output.
+        chunk_size (int, optional): Number of requests allocated per batch.
+        stdin (file, optional): Input stream.  Defaults to sys.stdin.
+        stdout (file, optional): Output stream.  Defaults to sys.stdout.
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    if kind == "collections":
+        fields = ["source", "date", "description"]
+    else:
+        fields = ["source", "date"]
+    issued = rejected = 0
+    for chunk in BatchIO.read_requests(stdin, fields, fmt, chunk_size):
+        with contextlib.redirect_stdout(sys.stderr):
+            if kind == "collections":
+                ids = namer.generate_collection_ids_batch(
+                    (row.get("source"), BatchIO.parse_date(row.get("date")), row.get("description")) for row in chunk
+                )
+            else:
+                ids = namer.generate_graph_ids_batch(
+                    (row.get("source"), BatchIO.parse_date(row.get("date"))) for row in chunk
+                )
+        for row, new_id in zip(chunk, ids):
+            row["id"] = new_id
+            if new_id:
+                issued += 1
+            else:
+                rejected += 1
+        BatchIO.write_results(stdout, chunk, fields, fmt)
+        stdout.flush()
+    print(f"Issued {issued} {kind[:-1]} IDs, rejected {rejected} requests.", file=sys.stderr)
 
-        print("\nGenerated VirusTotal Graphs:")
-        if self.generated_graph_ids:
-            for graph_id in self.generated_graph_ids:
-                print(f"- {graph_id}")
+def run_leases(args):
+    """
+    Handles the --lease, --reconcile and --list-leases options.
+
+    Returns:
+        int: The exit status.
+    """
+    namer = VTNaming(args.config)
+    status = 0
+    if args.lease:
+        if not args.lease_file:
+            print("Error: --lease needs --lease-file.")
+            return 2
+        block_date = BatchIO.parse_date(args.date)
+        lease = namer.lease_block(args.lease, args.source, block_date, args.count, args.ttl_hours * 3600, args.holder)
+        if lease is None or not lease.save(args.lease_file):
+            status = 1
         else:
-            print("  None")
+            print(f"Leased {lease.prefix}{lease.first:0{lease.width}d} to {lease.prefix}{lease.last:0{lease.width}d} "
+                  f"until {lease.expires}: {args.lease_file}")
+    for filename in args.reconcile or ():
+        lease = Leasing.Lease.load(filename)
+        stats = namer.reconcile_lease(lease) if lease is not None else None
+        if stats is None:
+            status = 1
+            continue
+        print(f"{filename}: {stats['imported']} IDs recorded, {stats['skipped']} already known, "
+              f"{stats['rejected']} rejected, {stats['returned']} unused numbers returned"
+              + ("" if lease.closed else "; the lease stays open"))
+    if args.list_leases:
+        expired = {record["lease_id"] for record in namer.expired_leases()}
+        for record in sorted(namer.leases.values(), key=lambda record: record["expires"]):
+            width = record["width"]
+            print(f"{record['lease_id']}  {record['kind']:<11} "
+                  f"{record['prefix']}{record['first']:0{width}d}..{record['last']:0{width}d}  "
+                  f"{record.get('holder') or '-'}  {'expired' if record['lease_id'] in expired else 'expires'} "
+                  f"{record['expires']}")
+        if not namer.leases:
+            print("No open leases.")
+    namer.store.close()
+    return status
+
 
-def main():
+def main(argv=None):
     """
     Main function to run the VirusTotal Naming Tool.
+
+    Args:
+        argv (list, optional): Command-line arguments.  Defaults to sys.argv[1:].
     """
-    namer = VTNaming()
+    parser = argparse.ArgumentParser(description="VirusTotal Naming Tool")
+    parser.add_argument("--config", default="vt_naming_config.json", help="Configuration file to use")
+    parser.add_argument("--batch", choices=["collections", "graphs"],
+                        help="Read collection or graph requests from stdin and write IDs to stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv", help="Batch input/output format")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Requests allocated per batch, or IDs written per chunk when exporting")
+    parser.add_argument("--export", metavar="FILE", help="Export issued IDs to FILE (\"-\" for stdout) and exit")
+    parser.add_argument("--export-format", choices=Exporter.FORMATS, default="txt", help="Export format")
+    parser.add_argument("--summary", action="store_true",
+                        help="Print the number of issued collection and graph IDs per source and day and exit")
+    parser.add_argument("--kind", choices=["collections", "graphs"],
+                        help="Export or summarize only collection or graph IDs")
+    parser.add_argument("--source", help="Export or summarize only IDs from this source")
+    parser.add_argument("--date-from",
+                        help="Export or summarize only IDs dated on or after this date (YYYYMMDD or YYYYMM)")
+    parser.add_argument("--date-to",
+                        help="Export or summarize only IDs dated on or before this date (YYYYMMDD or YYYYMM)")
+    parser.add_argument("--since-last", metavar="NAME",
+                        help="Export only IDs issued since the last export with this name, then remember the position")
+    parser.add_argument("--migrate-to-sqlite", metavar="DB_FILE",
+                        help="Copy the JSON configuration into a new SQLite database and exit")
+    parser.add_argument("--import", metavar="FILE", dest="import_files", action="append",
+                        help="Import collection and graph IDs from FILE (txt, csv or jsonl; may be repeated) and exit")
+    parser.add_argument("--import-format", choices=Importer.FORMATS, help="Import format (default: from the file name)")
+    parser.add_argument("--id-column", default="id", help="CSV column or JSON key holding the ID when importing")
+    parser.add_argument("--description-column", default="description",
+                        help="CSV column or JSON key holding the description when importing")
+    parser.add_argument("--workers", type=int, help="Parser processes when importing (default: one per CPU for large files)")
+    parser.add_argument("--rejects", metavar="FILE", help="List lines rejected by the import in FILE")
+    parser.add_argument("--lease", choices=["collections", "graphs"],
+                        help="Lease a block of numbers for --source to a worker, write it to --lease-file and exit")
+    parser.add_argument("--lease-file", metavar="FILE", help="Lease file to write (see Leasing.py)")
+    parser.add_argument("--count", type=int, default=1000, help="Numbers per lease")
+    parser.add_argument("--date", help="Date of the leased IDs (YYYYMMDD, default today)")
+    parser.add_argument("--ttl-hours", type=float, default=Leasing.DEFAULT_TTL / 3600,
+                        help="Hours until the lease expires")
+    parser.add_argument("--holder", help="Name of the worker taking the lease")
+    parser.add_argument("--reconcile", metavar="FILE", action="append",
+                        help="Record the IDs issued from a lease file (may be repeated) and exit")
+    parser.add_argument("--list-leases", action="store_true", help="List open leases and exit")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help="Keep Prometheus metrics in FILE (e.g. for the node_exporter textfile collector)")
+    parser.add_argument("--log-json", metavar="FILE",
+                        help="Log every allocation, save, load and export as a JSON line to FILE (\"-\" for stderr)")
+    args = parser.parse_args(argv)
+    Metrics.configure(args.metrics_file, args.log_json)
+
+    if args.migrate_to_sqlite:
+        if not migrate_from_json(args.config, args.migrate_to_sqlite, VTNaming.STATE_FIELDS):
+            sys.exit(1)
+        return
+
+    if args.export:
+        with contextlib.redirect_stdout(sys.stderr):
+            namer = VTNaming(args.config)
+            kinds = (args.kind,) if args.kind else ("collections", "graphs")
+            count = namer.export_ids(args.export, args.export_format, kinds, args.source,
+                                     args.date_from, args.date_to, args.since_last, args.chunk_size)
+            namer.store.close()
+            if count is None:
+                sys.exit(1)
+            print(f"Exported {count} IDs.")
+        return
+
+    if args.summary:
+        with contextlib.redirect_stdout(sys.stderr):
+            namer = VTNaming(args.config)
+        namer.display_summary(args.kind, args.source, args.date_from, args.date_to, prompt=None)
+        namer.store.close()
+        return
+
+    if args.import_files:
+        namer = VTNaming(args.config)
+        failed = False
+        for filename in args.import_files:
+            stats = namer.import_ids(filename, args.import_format, args.id_column, args.description_column,
+                                     args.workers, rejects_file=args.rejects)
+            failed = failed or stats is None
+        namer.store.close()
+        if failed:
+            sys.exit(1)
+        return
+
+    if args.lease or args.reconcile or args.list_leases:
+        sys.exit(run_leases(args))
+
+    if args.batch:
+        with contextlib.redirect_stdout(sys.stderr):
+            namer = VTNaming(args.config)
+        run_batch(namer, args.batch, args.format, args.chunk_size)
+        namer.store.close()
+        return
+
+    namer = VTNaming(args.config)
+    flusher = DebouncedFlusher(lambda: namer.save_config(quiet=True))
+    flusher.install()  # Final save on exit, Ctrl+C or SIGTERM
 
     # Add ASCII art here
     print(r"""
@@ -252,12 +1086,14 @@ def main():
         print("4. Get Collection Description")
         print("5. Display All Generated IDs")
         print("6. Set Output Filename")
-        print("7. Exit")
+        print("7. Search IDs")
+        print("8. Search Collection Descriptions")
+        print("9. Exit")
 
         choice = input("Enter your choice: ")
 
         if choice == "1":
-            source = input(f"Enter collection source ({namer.valid_collection_sources}): ")
+            source = input(f"Enter collection source ({namer.get_allowlist('valid_collection_sources').describe()}): ")
             date_str = input("Enter collection date (YYYYMMDD, press Enter for today): ")
             description = input("Enter collection description (optional): ")
             if date_str:
@@ -274,7 +1110,7 @@ def main():
             else:
                 print("Failed to generate Collection ID")
         elif choice == "2":
-            source = input(f"Enter graph source ({namer.valid_graph_sources}): ")
+            source = input(f"Enter graph source ({namer.get_allowlist('valid_graph_sources').describe()}): ")
             date_str = input("Enter graph date (YYYYMMDD, press Enter for today): ")
             if date_str:
                 try:
@@ -293,7 +1129,14 @@ def main():
             filename = input(f"Enter filename to save IDs (default: {namer.base_filename}): ")
             if not filename:
                 filename = namer.base_filename
-            saved = namer.save_ids(filename)
+            fmt = input(f"Format ({', '.join(Exporter.FORMATS)}; press Enter for txt): ") or "txt"
+            if fmt == "txt":
+                saved = namer.save_ids(filename)
+            else:
+                saved = ((namer.generated_collection_ids or namer.generated_graph_ids)
+                         and namer.export_ids(filename, fmt) is not None)
+                if saved:
+                    print(f"IDs exported to {filename}")
             if not saved:
                 print("Saving failed.")
         elif choice == "4":
@@ -304,18 +1147,53 @@ def main():
             else:
                 print(f"Collection ID {collection_id} not found, or has no description.")
         elif choice == "5":
-            namer.display_all_generated()
+            mode = input("Show (l)ist or (s)ummary? (press Enter for list): ").strip().lower()
+            kind = input("Show (c)ollections, (g)raphs or (b)oth? (press Enter for both): ").strip().lower()
+            kind = "collections" if kind.startswith("c") else "graphs" if kind.startswith("g") else None
+            source = input("Source (optional): ")
+            date_from = input("From date (YYYYMMDD or YYYYMM, optional): ")
+            date_to = input("To date (YYYYMMDD or YYYYMM, optional): ")
+            if mode.startswith("s"):
+                namer.display_summary(kind, source, date_from, date_to)
+            else:
+                namer.display_all_generated(kind, source, date_from, date_to)
         elif choice == "6":
             new_filename = input("Enter new filename to save IDs: ")
             namer.base_filename = new_filename
-            namer.save_config()
             print(f"Output filename set to {new_filename}")
         elif choice == "7":
+            kind = input("Search (c)ollections or (g)raphs? ").strip().lower()
+            source = input("Source (optional): ")
+            date_from = input("From date (YYYYMMDD or YYYYMM, optional): ")
+            date_to = input("To date (YYYYMMDD or YYYYMM, optional): ")
+            prefix = input("ID prefix (optional): ")
+            if kind.startswith("g"):
+                matches = namer.find_graphs(source, date_from, date_to, prefix)
+                print(f"\nFound {len(matches)} matching graph(s):")
+                for graph_id in matches:
+                    print(f"- {graph_id}")
+            else:
+                matches = namer.find_collections(source, date_from, date_to, prefix)
+                print(f"\nFound {len(matches)} matching collection(s):")
+                for collection_id in matches:
+                    description = namer.collection_descriptions.get(collection_id, "No description")
+                    print(f"- {collection_id}: {description}")
+        elif choice == "8":
+            query = input('Words to search for (use "double quotes" for phrases): ')
+            matches = namer.search_collections(query)
+            print(f"\nFound {len(matches)} matching collection(s), best first:")
+            for collection_id, score in matches:
+                description = namer.collection_descriptions.get(collection_id, "No description")
+                print(f"- {collection_id} ({score:.2f}): {description}")
+        elif choice == "9":
             print("Exiting...")
             break
         else:
             print("Invalid choice. Please try again.")
-        namer.save_config()
+        if namer.dirty_settings():
+            flusher.changed()  # Saved once changes settle; read-only actions write nothing
+    flusher.close()
+    namer.store.close()
     input("Press Enter to continue...")
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+import atexit
+import contextlib
+import copy
+import signal
+import threading
+import time
+
+_MISSING = object()
+
+
+class SettingsTracker:
+    """
+    Tells which settings of a naming object changed since they were last saved.
+
+    Keeps a copy of each setting as it was last loaded or saved and compares
+    the current values against it, so in-place edits (e.g. appending to
+    valid_sources) are noticed as well as assignments.  Settings are small,
+    so the comparison costs next to nothing.
+    """
+    def __init__(self, owner, fields):
+        """
+        Args:
+            owner (object): The naming object holding the settings as attributes.
+            fields (tuple): Names of the settings to track.
+        """
+        self.owner = owner
+        self.fields = tuple(fields)
+        self._saved = {}
+
+    def dirty(self):
+        """
+        Returns:
+            list: The settings whose value differs from the saved one.
+        """
+        return [field for field in self.fields
+                if getattr(self.owner, field, _MISSING) != self._saved.get(field, _MISSING)]
+
+    def mark_clean(self, *fields):
+        """Records the current values of fields (default: all settings) as saved."""
+        for field in fields or self.fields:
+            value = getattr(self.owner, field, _MISSING)
+            if value is _MISSING:
+                self._saved.pop(field, None)
+            else:
+                self._saved[field] = copy.deepcopy(value)
+
+    @contextlib.contextmanager
+    def reloading(self):
+        """
+        Wraps a reload from the store: the loaded values become the saved ones,
+        and settings changed locally but not yet saved keep their local values.
+        """
+        pending = {field: getattr(self.owner, field) for field in self.dirty()}
+        yield
+        self.mark_clean()
+        for field, value in pending.items():
+            setattr(self.owner, field, value)
+
+
+class DebouncedFlusher:
+    """
+    Calls a flush function once changes have settled, instead of after every change.
+
+    A flush happens `delay` seconds after the last reported change, but no
+    later than `max_latency` seconds after the first unflushed one, and
+    immediately once `max_pending` changes are waiting.  install() adds a
+    final flush when the interpreter exits or receives SIGTERM/SIGHUP.
+    """
+    def __init__(self, flush, delay=0.5, max_latency=5.0, max_pending=100):
+        """
+        Args:
+            flush (callable): Writes the pending changes (e.g. save_config).
+            delay (float, optional): Quiet period, in seconds, before flushing.
+            max_latency (float, optional): Longest a change may wait, in seconds.
+            max_pending (int, optional): Flush at once when this many changes wait.
+        """
+        self._flush = flush
+        self.delay = delay
+        self.max_latency = max_latency
+        self.max_pending = max_pending
+        self.flushes = 0  # Flushes performed so far
+        self.pending = 0  # Changes reported since the last flush
+        self._first_change = None
+        self._timer = None
+        self._lock = threading.RLock()
+        self._closed = False
+
+    def changed(self, count=1):
+        """Reports count changes that need to be flushed."""
+        with self._lock:
+            if self._closed:
+                self._flush()
+                return
+            now = time.monotonic()
+            if self._first_change is None:
+                self._first_change = now
+            self.pending += count
+            if self.pending >= self.max_pending:
+                self.flush()
+                return
+            wait = min(self.delay, self._first_change + self.max_latency - now)
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(max(wait, 0), self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Flushes now if anything is pending."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self.pending:
+                return
+            self.pending = 0
+            self._first_change = None
+            self.flushes += 1
+            self._flush()
+
+    def close(self):
+        """Performs the final flush; later changes are flushed as they are reported."""
+        with self._lock:
+            self.flush()
+            self._closed = True
+
+    def install(self, signals=("SIGTERM", "SIGHUP")):
+        """
+        Makes sure pending changes are flushed when the process ends.
+
+        Registers close() with atexit and turns the given signals into a
+        normal exit (SystemExit), so the atexit hook runs for them too.  Ctrl+C
+        already raises KeyboardInterrupt, which exits normally.  Signal
+        handlers can only be set from the main thread; elsewhere only the
+        atexit hook is installed.
+        """
+        atexit.register(self.close)
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for name in signals:
+            signum = getattr(signal, name, None)  # SIGHUP does not exist on Windows
+            if signum is not None and signal.getsignal(signum) in (signal.SIG_DFL, None):
+                signal.signal(signum, _exit_on_signal)
+
+
+def _exit_on_signal(signum, frame):
+    raise SystemExit(128 + signum)
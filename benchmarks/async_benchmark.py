@@ -0,0 +1,104 @@
+"""
+Concurrent asyncio allocation: one executor call per ID versus AsyncNaming.
+
+Runs N tasks that each await a report ID against a fresh configuration in a
+temporary directory, first by calling CTINaming.generate_report_id in the
+default executor (one journal write per ID), then through AsyncCTINaming
+(one batched write per coalescing window).  Reports wall time, allocations
+per second, journal writes, and the worst event-loop stall seen by a 1 ms
+ticker task while the allocations were running.
+
+Usage:
+    python benchmarks/async_benchmark.py [--tasks 2000] [--window 0.002] [--json]
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AsyncNaming import AsyncCTINaming  # noqa: E402
+from CTIDataManager import CTINaming  # noqa: E402
+
+REPORT_DATE = datetime.date(2025, 3, 1)
+
+
+async def ticker(stop, lags):
+    """Records how late a 1 ms sleep wakes up, i.e. how long the loop was blocked."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - start - 0.001)
+
+
+async def run(tasks, allocate):
+    stop = asyncio.Event()
+    lags = []
+    watcher = asyncio.create_task(ticker(stop, lags))
+    start = time.perf_counter()
+    ids = await asyncio.gather(*(allocate(i) for i in range(tasks)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await watcher
+    return ids, elapsed, max(lags, default=0.0)
+
+
+async def per_call(namer, tasks):
+    loop = asyncio.get_running_loop()
+    return await run(tasks, lambda i: loop.run_in_executor(
+        None, namer.generate_report_id, "Vendor1", "Threat", REPORT_DATE, f"task {i}"))
+
+
+async def coalesced(namer, tasks, window):
+    async with AsyncCTINaming(namer, window=window) as naming:
+        result = await run(tasks, lambda i: naming.generate_report_id("Vendor1", "Threat", REPORT_DATE, f"task {i}"))
+        writes = naming._coalescers["reports"].flushes
+    return result + (writes,)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tasks", type=int, default=2000, help="Concurrent allocation tasks")
+    parser.add_argument("--window", type=float, default=0.002, help="Coalescing window in seconds")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for name in ("per_call", "coalesced"):
+        os.chdir(tempfile.mkdtemp(prefix="cti_async_"))
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            namer = CTINaming()
+            if name == "per_call":
+                ids, elapsed, lag = asyncio.run(per_call(namer, args.tasks))
+                writes = args.tasks
+            else:
+                ids, elapsed, lag, writes = asyncio.run(coalesced(namer, args.tasks, args.window))
+            namer.store.close()
+        if None in ids or len(set(ids)) != len(ids):
+            print(f"FAIL: {name} issued missing or duplicate IDs")
+            sys.exit(1)
+        results[name] = {
+            "tasks": args.tasks,
+            "seconds": round(elapsed, 4),
+            "allocations_per_second": round(args.tasks / elapsed),
+            "journal_writes": writes,
+            "max_loop_stall_ms": round(lag * 1000, 2),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'mode':<10} {'tasks':>7} {'seconds':>9} {'alloc/s':>9} {'writes':>7} {'max stall ms':>13}")
+    for name, row in results.items():
+        print(f"{name:<10} {row['tasks']:>7} {row['seconds']:>9.3f} {row['allocations_per_second']:>9} "
+              f"{row['journal_writes']:>7} {row['max_loop_stall_ms']:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
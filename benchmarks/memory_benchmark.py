@@ -0,0 +1,99 @@
+"""
+Memory per issued ID: plain lists and dicts versus CompactIDs.
+
+Builds synthetic ID histories of 10k, 100k and 1M IDs and measures, with
+tracemalloc, how much memory the ID list and the ID-keyed description dict
+take as plain Python objects and as CompactIDList / CompactIDMap.  Every
+description is the same string, so the dict figures show the cost of the
+keys and entries alone.
+
+Usage:
+    python benchmarks/memory_benchmark.py [--sizes 10000,100000,1000000] [--json]
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CompactIDs import CompactIDList, CompactIDMap  # noqa: E402
+
+SOURCES = [f"Vendor{i}" for i in range(10)]
+REPORT_TYPES = ["Threat", "Activity", "Indicator"]
+PER_KEY = 99
+
+
+def synthetic_ids(count):
+    """Yields count report IDs spread over sources, types and dates."""
+    start = datetime.date(2020, 1, 1)
+    issued = 0
+    key_number = 0
+    while issued < count:
+        source = SOURCES[key_number % len(SOURCES)]
+        report_type = REPORT_TYPES[key_number // len(SOURCES) % len(REPORT_TYPES)]
+        date_str = (start + datetime.timedelta(days=key_number // 30)).strftime("%Y%m%d")
+        for number in range(1, min(PER_KEY, count - issued) + 1):
+            yield f"{source}-{report_type}-{date_str}-{number:02d}"
+        issued += min(PER_KEY, count - issued)
+        key_number += 1
+
+
+def measure(build):
+    """Returns (object, bytes allocated while building it, seconds)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    obj = build()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated numbers of issued IDs")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(value) for value in args.sizes.split(",")):
+        cases = [
+            ("list", lambda: list(synthetic_ids(size))),
+            ("CompactIDList", lambda: CompactIDList(synthetic_ids(size))),
+            ("dict", lambda: dict.fromkeys(synthetic_ids(size), "description")),
+            ("CompactIDMap", lambda: CompactIDMap(dict.fromkeys(synthetic_ids(size), "description"))),
+        ]
+        measured = {}
+        for name, build in cases:
+            if name == "CompactIDMap":
+                # Building from a plain dict would count the dict; fill it directly instead.
+                def build():
+                    compact = CompactIDMap()
+                    for issued_id in synthetic_ids(size):
+                        compact[issued_id] = "description"
+                    return compact
+            obj, nbytes, elapsed = measure(build)
+            measured[name] = obj
+            results.append({"ids": size, "container": name, "bytes_per_id": nbytes / size, "build_s": elapsed})
+            del obj
+        # The compact forms must read back exactly what went in.
+        assert list(measured["CompactIDList"]) == measured["list"]
+        assert dict(measured["CompactIDMap"].items()) == measured["dict"]
+        del measured
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+    print(f"{'IDs':>9} {'container':>14} {'bytes/ID':>9} {'build s':>8}")
+    for r in results:
+        print(f"{r['ids']:>9} {r['container']:>14} {r['bytes_per_id']:>9.1f} {r['build_s']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
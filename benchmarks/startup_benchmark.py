@@ -0,0 +1,140 @@
+"""
+Startup time and peak memory of CTINaming on large configurations.
+
+Generates synthetic CTI configurations with 10k, 100k and 1M issued IDs (each
+with a description), once as a plain json.dump file (how configurations
+written before lazy loading look, which are parsed in full) and once as a
+snapshot with a layout (written by compaction, whose ID history and
+descriptions are loaded lazily).  Each case is measured in a fresh
+subprocess: time to construct CTINaming, time to allocate one ID, and the
+peak resident set size of the process.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--sizes 10000,100000,1000000] [--json]
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from CTIDataManager import CTINaming  # noqa: E402
+from LazySnapshot import write_snapshot  # noqa: E402
+
+SOURCES = [f"Vendor{i}" for i in range(10)]
+REPORT_TYPES = ["Threat", "Activity", "Indicator"]
+PER_KEY = 99  # IDs per source/type/date, the most a two-digit counter holds
+
+
+def make_config(count):
+    """Builds a configuration with count issued IDs and descriptions."""
+    counts = {}
+    ids = []
+    descriptions = {}
+    start = datetime.date(2020, 1, 1)
+    for key_number in range(-(-count // PER_KEY)):
+        source = SOURCES[key_number % len(SOURCES)]
+        report_type = REPORT_TYPES[key_number // len(SOURCES) % len(REPORT_TYPES)]
+        date_str = (start + datetime.timedelta(days=key_number // 30)).strftime("%Y%m%d")
+        numbers = min(PER_KEY, count - len(ids))
+        counts[f"{source}|{report_type}|{date_str}"] = numbers
+        for number in range(1, numbers + 1):
+            report_id = f"{source}-{report_type}-{date_str}-{number:02d}"
+            ids.append(report_id)
+            descriptions[report_id] = f"Synthetic report {len(ids)} about {report_type.lower()} seen by {source}"
+    return {
+        "report_counts": counts,
+        "generated_report_ids": ids,
+        "report_descriptions": descriptions,
+        "base_filename": "report_ids.txt",
+        "valid_sources": SOURCES,
+        "valid_report_types": REPORT_TYPES,
+        "journal_seq": 0,
+    }
+
+
+def measure(config_file):
+    """Runs in the child process: loads the configuration and allocates one ID."""
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        namer = CTINaming(config_file)
+        loaded = time.perf_counter()
+        namer.generate_report_id("Vendor1", "Threat", datetime.date(2030, 1, 1), "benchmark")
+        allocated = time.perf_counter()
+        namer.store.close()
+    print(json.dumps({"load_s": loaded - start, "first_id_s": allocated - loaded, "peak_rss_mb": peak_rss_mb()}))
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MB, or None if unknown."""
+    # On Linux ru_maxrss survives exec and would include the parent's peak, so
+    # prefer the per-process high-water mark.
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated numbers of issued IDs")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        measure(args.child)
+        return
+
+    lazy_fields = ["generated_report_ids", "report_descriptions"]
+    results = []
+    workdir = tempfile.mkdtemp(prefix="cti_startup_")
+    try:
+        for size in (int(value) for value in args.sizes.split(",")):
+            config = make_config(size)
+            sources = {}
+            with open(os.path.join(workdir, f"eager-{size}.json"), "w") as f:
+                json.dump(config, f, indent=4)
+                sources["eager"] = f.name
+            with open(os.path.join(workdir, f"lazy-{size}.json"), "wb") as f:
+                write_snapshot(f, config, lazy_fields)
+                sources["lazy"] = f.name
+            del config
+            for mode, source in sources.items():
+                config_file = os.path.join(workdir, f"run-{mode}-{size}.json")
+                shutil.copyfile(source, config_file)
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", config_file],
+                                        check=True, capture_output=True, text=True).stdout
+                result = {"ids": size, "mode": mode, "file_mb": os.path.getsize(source) / (1024 * 1024)}
+                result.update(json.loads(output.splitlines()[-1]))
+                results.append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+    print(f"{'IDs':>9} {'mode':>6} {'file MB':>8} {'load s':>8} {'1st ID s':>9} {'peak RSS MB':>12}")
+    for r in results:
+        peak = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "n/a"
+        print(f"{r['ids']:>9} {r['mode']:>6} {r['file_mb']:>8.1f} {r['load_s']:>8.3f} {r['first_id_s']:>9.4f} {peak:>12}")
+
+
+if __name__ == "__main__":
+    main()
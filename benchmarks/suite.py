@@ -0,0 +1,313 @@
+"""
+Benchmark suite for CTINaming and VTNaming, with JSON output for comparing runs.
+
+For every tool and history size, a synthetic configuration is written as a
+compacted snapshot in a temporary directory and measured in a fresh
+subprocess:
+
+    load_s              construct the naming object (load_config)
+    first_id_s          allocate the first ID after loading
+    alloc_per_s         single-ID allocations per second (generate_*_id)
+    batch_alloc_per_s   IDs per second through generate_*_ids_batch
+    save_s              save_config after changing one setting (median)
+    compact_s           write a full snapshot (store.compact)
+    export_ids_per_s    IDs per second exported as CSV
+    peak_rss_mb         peak resident set size of the process
+
+Results are printed as a table and, with --output, written as JSON together
+with the Python version, platform and git commit.  --compare reads an
+earlier JSON file, prints the change of every metric and exits with status
+1 if any got worse by more than --threshold.  --profile DIR additionally
+dumps a cProfile file (.prof, for pstats or snakeviz) and a tracemalloc
+snapshot (.tracemalloc, for tracemalloc.Snapshot.load) per measured phase;
+timings of a profiled run are inflated and marked as such.
+
+Usage:
+    python benchmarks/suite.py [--sizes 1000,10000,100000] [--tools cti,vt]
+        [--allocations 500] [--output results.json] [--compare baseline.json]
+        [--threshold 0.2] [--profile DIR]
+"""
+import argparse
+import contextlib
+import cProfile
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from CTIDataManager import CTINaming  # noqa: E402
+from LazySnapshot import write_snapshot  # noqa: E402
+from VTName import VTNaming  # noqa: E402
+from startup_benchmark import make_config, peak_rss_mb  # noqa: E402
+
+NEW_DATE = datetime.date(2030, 1, 1)  # Allocations go to a day without history
+# Metrics where a larger value is better; for all others smaller is better.
+HIGHER_IS_BETTER = ("alloc_per_s", "batch_alloc_per_s", "export_ids_per_s")
+
+
+def make_vt_config(count):
+    """Builds a VT configuration with count issued IDs, half collections (with descriptions) and half graphs."""
+    cti = make_config(count)
+    collections = {}
+    collection_ids = []
+    descriptions = {}
+    graphs = {}
+    graph_ids = []
+    for index, key in enumerate(cti["report_counts"]):
+        source, report_type, date_str = key.split("|")
+        source = f"{source}{report_type}"
+        numbers = cti["report_counts"][key]
+        if index % 2 == 0:
+            collections[f"{source}|{date_str}"] = numbers
+            for number in range(1, numbers + 1):
+                collection_id = f"COL-{source}-{date_str}-{number:02d}"
+                collection_ids.append(collection_id)
+                descriptions[collection_id] = f"Synthetic collection {len(collection_ids)} from {source}"
+        else:
+            graphs[f"{source}|{date_str}"] = numbers
+            graph_ids.extend(f"GRAPH-{source}-{date_str}-{number:02d}" for number in range(1, numbers + 1))
+    return {
+        "collection_counts": collections,
+        "generated_collection_ids": collection_ids,
+        "collection_descriptions": descriptions,
+        "graph_counts": graphs,
+        "generated_graph_ids": graph_ids,
+        "base_filename": "vt_names.txt",
+        "valid_collection_sources": [],
+        "valid_graph_sources": [],
+        "journal_seq": 0,
+    }
+
+
+# Per tool: naming class, config builder, lazily loaded fields, and the calls measured.
+TOOLS = {
+    "cti": {
+        "cls": CTINaming,
+        "config": make_config,
+        "lazy_fields": ["generated_report_ids", "report_descriptions"],
+        "allocate": lambda namer: namer.generate_report_id("Vendor1", "Threat", NEW_DATE, "benchmark"),
+        "allocate_batch": lambda namer, count: namer.generate_report_ids_batch(
+            [("Vendor2", "Threat", NEW_DATE, "benchmark")] * count),
+        "export": lambda namer, f: namer.export_reports(f, "csv"),
+    },
+    "vt": {
+        "cls": VTNaming,
+        "config": make_vt_config,
+        "lazy_fields": ["generated_collection_ids", "collection_descriptions", "generated_graph_ids"],
+        "allocate": lambda namer: namer.generate_collection_id("Vendor1", NEW_DATE, "benchmark"),
+        "allocate_batch": lambda namer, count: namer.generate_graph_ids_batch([("Vendor2", NEW_DATE)] * count),
+        "export": lambda namer, f: namer.export_ids(f, "csv"),
+    },
+}
+
+
+class Phases:
+    """Times the phases of a child run, profiling each one if a profile directory is given."""
+    def __init__(self, profile_dir, label):
+        self.profile_dir = profile_dir
+        self.label = label
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        profiler = None
+        if self.profile_dir:
+            tracemalloc.start()
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        result = {}
+        try:
+            yield result
+        finally:
+            result["seconds"] = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                base = os.path.join(self.profile_dir, f"{self.label}-{name}")
+                profiler.dump_stats(base + ".prof")
+                tracemalloc.take_snapshot().dump(base + ".tracemalloc")
+                tracemalloc.stop()
+
+
+def run_child(tool, config_file, allocations, profile_dir, label):
+    """Runs in the child process: measures one tool on one configuration and prints the metrics as JSON."""
+    spec = TOOLS[tool]
+    phases = Phases(profile_dir, label)
+    metrics = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with phases.phase("load") as timing:
+            namer = spec["cls"](config_file)
+        metrics["load_s"] = timing["seconds"]
+
+        with phases.phase("first_id") as timing:
+            spec["allocate"](namer)
+        metrics["first_id_s"] = timing["seconds"]
+
+        with phases.phase("allocate") as timing:
+            for _ in range(allocations):
+                spec["allocate"](namer)
+        metrics["alloc_per_s"] = allocations / timing["seconds"]
+
+        with phases.phase("allocate_batch") as timing:
+            spec["allocate_batch"](namer, allocations)
+        metrics["batch_alloc_per_s"] = allocations / timing["seconds"]
+
+        saves = []
+        with phases.phase("save"):
+            for i in range(5):
+                namer.base_filename = f"benchmark-{i}.txt"
+                start = time.perf_counter()
+                namer.save_config(quiet=True)
+                saves.append(time.perf_counter() - start)
+        metrics["save_s"] = statistics.median(saves)
+
+        with phases.phase("compact") as timing:
+            namer.store.compact(wait=True)
+        metrics["compact_s"] = timing["seconds"]
+
+        with phases.phase("export") as timing:
+            exported = spec["export"](namer, devnull)
+        metrics["export_ids_per_s"] = (exported or 0) / timing["seconds"]
+        namer.store.close()
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(metrics))
+
+
+def run_suite(sizes, tools, allocations, profile_dir):
+    """Generates the configurations and measures each one in a fresh subprocess."""
+    results = []
+    workdir = tempfile.mkdtemp(prefix="naming_bench_")
+    try:
+        for tool in tools:
+            for size in sizes:
+                config_file = os.path.join(workdir, f"{tool}-{size}.json")
+                config = TOOLS[tool]["config"](size)
+                with open(config_file, "wb") as f:
+                    write_snapshot(f, config, TOOLS[tool]["lazy_fields"])
+                del config
+                command = [sys.executable, os.path.abspath(__file__), "--child", tool, config_file,
+                           "--allocations", str(allocations)]
+                if profile_dir:
+                    command += ["--profile", profile_dir]
+                output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=workdir).stdout
+                result = {"tool": tool, "ids": size}
+                result.update(json.loads(output.splitlines()[-1]))
+                results.append(result)
+                for name in os.listdir(workdir):  # Keep the disk footprint to one configuration
+                    os.remove(os.path.join(workdir, name))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, threshold):
+    """
+    Prints the change of every metric against a baseline run.
+
+    Returns:
+        list: (tool, ids, metric, change) for metrics worse by more than threshold.
+    """
+    previous = {(r["tool"], r["ids"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('commit') or 'baseline'} ({baseline['meta'].get('date')}):")
+    if report["meta"]["profiled"] != baseline["meta"].get("profiled", False):
+        print("  Warning: only one of the runs was profiled, so their timings are not comparable")
+    for result in report["results"]:
+        before = previous.get((result["tool"], result["ids"]))
+        if before is None:
+            continue
+        changes = []
+        for metric, value in result.items():
+            old = before.get(metric)
+            if metric in ("tool", "ids") or not old or value is None:
+                continue
+            change = value / old - 1
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            if worse > threshold:
+                regressions.append((result["tool"], result["ids"], metric, change))
+            changes.append(f"{metric} {change:+.0%}{' !' if worse > threshold else ''}")
+        print(f"  {result['tool']:>3} {result['ids']:>8}: {', '.join(changes)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated numbers of issued IDs")
+    parser.add_argument("--tools", default="cti,vt", help="Comma-separated tools to measure (cti, vt)")
+    parser.add_argument("--allocations", type=int, default=500, help="IDs allocated per throughput measurement")
+    parser.add_argument("--output", metavar="FILE", help="Write the results as JSON to FILE")
+    parser.add_argument("--compare", metavar="FILE", help="Compare with the JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Relative change counted as a regression by --compare (default 0.2 = 20%%)")
+    parser.add_argument("--profile", metavar="DIR", help="Dump cProfile and tracemalloc snapshots of each phase to DIR")
+    parser.add_argument("--child", nargs=2, metavar=("TOOL", "CONFIG"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    profile_dir = os.path.abspath(args.profile) if args.profile else None
+
+    if args.child:
+        tool, config_file = args.child
+        label = f"{tool}-{os.path.splitext(os.path.basename(config_file))[0].split('-')[-1]}"
+        run_child(tool, config_file, args.allocations, profile_dir, label)
+        return
+
+    tools = [tool for tool in args.tools.split(",") if tool]
+    unknown = [tool for tool in tools if tool not in TOOLS]
+    if unknown:
+        parser.error(f"unknown tool(s): {', '.join(unknown)}")
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+    sizes = [int(value) for value in args.sizes.split(",")]
+    results = run_suite(sizes, tools, args.allocations, profile_dir)
+    report = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "allocations": args.allocations,
+            "profiled": bool(profile_dir),
+        },
+        "results": results,
+    }
+
+    print(f"{'tool':>4} {'IDs':>8} {'load s':>8} {'1st ID s':>9} {'alloc/s':>9} {'batch/s':>9} {'save s':>8} "
+          f"{'compact s':>10} {'export/s':>10} {'peak MB':>8}")
+    for r in results:
+        peak = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "n/a"
+        print(f"{r['tool']:>4} {r['ids']:>8} {r['load_s']:>8.4f} {r['first_id_s']:>9.4f} {r['alloc_per_s']:>9.0f} "
+              f"{r['batch_alloc_per_s']:>9.0f} {r['save_s']:>8.4f} {r['compact_s']:>10.4f} "
+              f"{r['export_ids_per_s']:>10.0f} {peak:>8}")
+    if profile_dir:
+        print(f"\nProfiles written to {profile_dir} (timings above include profiling overhead)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+Fault-injection tests for the JSON journal store.
+
+Each scenario builds a store with a few snapshot generations in a temporary
+directory, damages it the way a crash, a full disk or bad storage would,
+and then checks that loading recovers every acknowledged ID and that the
+next allocation does not re-issue one:
+
+    truncated_snapshot      current snapshot cut short
+    bit_flip_snapshot       one byte of the current snapshot changed
+    missing_snapshot        current snapshot gone (crash between renames)
+    torn_journal_tail       half-written record at the end of the journal
+    damaged_journal_record  one record in the middle of the journal changed
+    torn_lock_state         garbage in the .lock bookkeeping file
+    disk_full               snapshot write fails part-way with ENOSPC
+    journal_disk_full       journal append fails part-way with ENOSPC
+    crash_during_compaction crash before each file operation of a compaction
+    all_generations_damaged both snapshots damaged: loading must refuse
+    rolled_back_counter     counter behind the issued IDs (restore, hand edit)
+    malformed_batch_rows    non-string, multi-word and "|" fields in one batch
+    stale_bloom_filter      Bloom filter left over from a history of the same size
+    kill_during_allocation  worker processes killed with SIGKILL (POSIX)
+
+Usage:
+    python tools/fault_injection.py [--scenario NAME ...] [--kills 5]
+"""
+import argparse
+import contextlib
+import datetime
+import errno
+import io
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import JournalStore  # noqa: E402
+from CTIDataManager import CTINaming  # noqa: E402
+from StorageBackend import CorruptStateError  # noqa: E402
+
+REPORT_DATE = datetime.date(2025, 3, 1)
+CONFIG = "cti_naming_config.json"
+
+
+class Crash(BaseException):
+    """Stands in for the process dying at an injected point."""
+
+
+def open_namer(threshold=1000):
+    with contextlib.redirect_stdout(io.StringIO()):
+        namer = CTINaming(CONFIG)
+    namer.store.compact_threshold = threshold
+    return namer
+
+
+def allocate(namer, count, tag=""):
+    ids = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(count):
+            ids.append(namer.generate_report_id("Vendor1", "Threat", REPORT_DATE, f"{tag}{i}"))
+    return ids
+
+
+def build(generations=3, per_generation=20, tail=5):
+    """Creates a store with several snapshot generations plus some journal records after the last one."""
+    namer = open_namer()
+    issued = []
+    for g in range(generations):
+        issued += allocate(namer, per_generation, f"g{g}-")
+        namer.store.compact(wait=True)
+    issued += allocate(namer, tail, "tail-")
+    namer.store.close()
+    return issued
+
+
+def verify(issued, expect_missing=0):
+    """Reloads the store and checks that the issued IDs survived and the next one is new."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        namer = CTINaming(CONFIG)
+    history = list(namer.generated_report_ids)
+    missing = [i for i in issued if i not in set(history)]
+    problems = []
+    if len(missing) != expect_missing:
+        problems.append(f"{len(missing)} issued IDs missing after recovery (expected {expect_missing})")
+    if len(set(history)) != len(history):
+        problems.append("duplicate IDs in the recovered history")
+    new_id = allocate(namer, 1, "after-")[0]
+    if new_id is None or new_id in issued:
+        problems.append(f"next allocation re-issued {new_id}")
+    namer.store.close()
+    return problems, output.getvalue()
+
+
+def flip_byte(path, position):
+    with open(path, "r+b") as f:
+        f.seek(position)
+        byte = f.read(1)
+        f.seek(position)
+        f.write(bytes([byte[0] ^ 0x01]))
+
+
+def scenario_truncated_snapshot():
+    issued = build()
+    with open(CONFIG, "r+b") as f:
+        f.truncate(os.path.getsize(CONFIG) // 2)
+    problems, output = verify(issued)
+    if not os.path.exists(CONFIG + ".corrupt"):
+        problems.append("damaged snapshot was not moved aside")
+    return problems
+
+
+def scenario_bit_flip_snapshot():
+    issued = build()
+    with open(CONFIG, "rb") as f:
+        data = f.read()
+    flip_byte(CONFIG, data.index(b"Vendor1|Threat"))  # Same length, still valid JSON: only the checksum sees it
+    problems, output = verify(issued)
+    if "Recovered from" not in output:
+        problems.append("checksum mismatch was not detected")
+    return problems
+
+
+def scenario_missing_snapshot():
+    issued = build()
+    os.remove(CONFIG)
+    return verify(issued)[0]
+
+
+def scenario_torn_journal_tail():
+    issued = build()
+    with open(CONFIG + ".journal", "ab") as f:
+        f.write(b'0badc0de {"seq":9999,"ops":[["append","generated_report_ids",')
+    problems, _ = verify(issued)
+    with open(CONFIG + ".journal", "rb") as f:
+        if not f.read().endswith(b"\n"):
+            problems.append("torn tail was not cut off")
+    return problems
+
+
+def scenario_damaged_journal_record():
+    issued = build(tail=10)
+    path = CONFIG + ".journal"
+    with open(path, "rb") as f:
+        lines = f.readlines()
+    flip_byte(path, sum(len(line) for line in lines[:4]) + len(lines[4]) // 2)
+    problems, output = verify(issued, expect_missing=1)
+    if "damaged record" not in output:
+        problems.append("damaged record was not reported")
+    return problems
+
+
+def scenario_torn_lock_state():
+    issued = build()
+    with open(CONFIG + ".lock", "wb") as f:
+        f.write(b'{"generation": 3, "snaps')
+    return verify(issued)[0]
+
+
+def scenario_disk_full():
+    issued = build()
+    with open(CONFIG, "rb") as f:
+        before = f.read()
+    real_write_snapshot = JournalStore.write_snapshot
+
+    def failing_write_snapshot(f, config, lazy_fields=()):
+        f.write(b"{\n")
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    namer = open_namer()
+    issued += allocate(namer, 5, "full-")
+    JournalStore.write_snapshot = failing_write_snapshot
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            namer.store.compact(wait=True)
+    finally:
+        JournalStore.write_snapshot = real_write_snapshot
+    issued += allocate(namer, 5, "after-full-")
+    namer.store.close()
+    problems, _ = verify(issued)
+    with open(CONFIG, "rb") as f:
+        if f.read() != before:
+            problems.append("the live snapshot was modified by the failed write")
+    if any(name.endswith(".tmp") for name in os.listdir(".")):
+        problems.append("temporary file left behind")
+    return problems
+
+
+def scenario_journal_disk_full():
+    issued = build()
+    namer = open_namer()
+    issued += allocate(namer, 1, "before-full-")
+    key = "Vendor1|Threat|20250301"
+    count_before = namer.report_counts[key]
+    history_before = len(namer.generated_report_ids)
+    size_before = os.path.getsize(CONFIG + ".journal")
+    journal = namer.store._journal
+
+    class FullJournal:
+        def write(self, data):
+            journal.write(data[:len(data) // 2])
+            journal.flush()
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+        def __getattr__(self, name):
+            return getattr(journal, name)
+
+    namer.store._journal = FullJournal()
+    failed = allocate(namer, 1, "full-")[0]
+    problems = []
+    if failed is not None:
+        problems.append(f"allocation on a full disk returned {failed}")
+    if namer.report_counts[key] != count_before or len(namer.generated_report_ids) != history_before:
+        problems.append("the failed allocation changed the in-memory state")
+    if os.path.getsize(CONFIG + ".journal") != size_before:
+        problems.append("the failed record was left in the journal")
+    after = allocate(namer, 5, "after-full-")
+    if after[0] != f"Vendor1-Threat-20250301-{count_before + 1:02d}":
+        problems.append(f"the next allocation returned {after[0]}, not the number after {issued[-1]}")
+    namer.store.close()
+    return problems + verify(issued + after)[0]
+
+
+def scenario_crash_during_compaction():
+    """Crashes before the n-th file operation of a compaction, for every n."""
+    problems = []
+    real = {name: getattr(os, name) for name in ("replace", "remove", "fsync")}
+    previous_hook = threading.excepthook
+    threading.excepthook = lambda args: None if issubclass(args.exc_type, Crash) else previous_hook(args)
+    try:
+        for crash_at in range(1, 30):
+            with tempfile.TemporaryDirectory(prefix="cti_fault_") as workdir:
+                os.chdir(workdir)
+                issued = build()
+                namer = open_namer()
+                issued += allocate(namer, 5, "pre-crash-")
+                calls = 0
+
+                def faulty(name):
+                    def call(*args, **kwargs):
+                        nonlocal calls
+                        calls += 1
+                        if calls == crash_at:
+                            raise Crash(name)
+                        return real[name](*args, **kwargs)
+                    return call
+
+                for name in real:
+                    setattr(os, name, faulty(name))
+                try:
+                    namer.store.compact(wait=True)
+                except Crash:
+                    pass
+                finally:
+                    for name, func in real.items():
+                        setattr(os, name, func)
+                if calls < crash_at:
+                    break  # The compaction finished before reaching this point
+                found, _ = verify(issued)
+                problems += [f"crash before file operation {crash_at}: {problem}" for problem in found]
+    finally:
+        threading.excepthook = previous_hook
+    return problems
+
+
+def scenario_all_generations_damaged():
+    build()
+    for path in (CONFIG, CONFIG + ".prev"):
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) // 2)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            CTINaming(CONFIG)
+    except CorruptStateError:
+        return []
+    return ["loading silently started over instead of refusing"]
+
+
+def scenario_rolled_back_counter():
+    issued = build()
+    namer = open_namer()
+    with namer.store.transaction():
+        namer.store.commit([["put", "report_counts", "Vendor1|Threat|20250301", 3]])
+    namer.store.close()
+    return verify(issued)[0]
+
+
+def scenario_malformed_batch_rows():
+    namer = open_namer()
+    rows = [("Vendor1", "Threat", REPORT_DATE, "ok"), (5, "Threat", REPORT_DATE, "int"),
+            (["x"], "Threat", REPORT_DATE, "list"), ("Vendor 1", "Threat", REPORT_DATE, "space"),
+            ("Vendor1", "Threat|x", REPORT_DATE, "pipe"), ("Vendor1", "Threat", REPORT_DATE, "ok")]
+    with contextlib.redirect_stdout(io.StringIO()):
+        ids = namer.generate_report_ids_batch(rows)
+    namer.store.close()
+    problems = []
+    if ids[1:5] != [None] * 4:
+        problems.append(f"malformed rows were not rejected: {ids[1:5]}")
+    if ids[0] is None or ids[5] is None:
+        problems.append("valid rows of the same batch were rejected")
+        return problems
+    return problems + verify([ids[0], ids[5]])[0]
+
+
+def scenario_stale_bloom_filter():
+    namer = open_namer()
+    with namer.store.transaction():
+        namer.store.commit([["set", "bloom_filter_threshold", 10]])
+    allocate(namer, 50, "a-")
+    namer.store.close()
+    namer = open_namer()
+    namer.report_membership().save()  # Filter over the 50 Vendor1 IDs
+    # Restore a different, longer history (and its counters) from elsewhere
+    restored = [f"Vendor2-Threat-20250301-{number:02d}" for number in range(1, 61)]
+    with namer.store.transaction():
+        namer.store.commit([["set", "generated_report_ids", restored], ["set", "report_counts", {}]])
+    namer.store.close()
+    namer = open_namer()
+    with contextlib.redirect_stdout(io.StringIO()):
+        new_id = namer.generate_report_id("Vendor2", "Threat", REPORT_DATE)
+    namer.store.close()
+    if new_id in restored:
+        return [f"the stale filter let {new_id} be issued again"]
+    return []
+
+
+WORKER = """
+import contextlib, datetime, io, sys
+sys.path.insert(0, {root!r})
+from CTIDataManager import CTINaming
+with contextlib.redirect_stdout(io.StringIO()):
+    namer = CTINaming({config!r})
+namer.store.compact_threshold = 7
+while True:
+    with contextlib.redirect_stdout(io.StringIO()):
+        report_id = namer.generate_report_id("Vendor1", "Threat", datetime.date(2025, 3, 1), "x")
+    sys.stdout.write(report_id + "\\n")
+    sys.stdout.flush()
+"""
+
+
+def scenario_kill_during_allocation(kills=5):
+    if not hasattr(signal, "SIGKILL"):
+        return []
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    acknowledged = []
+    for _ in range(kills):
+        procs = [subprocess.Popen([sys.executable, "-c", WORKER.format(root=root, config=CONFIG)],
+                                  stdout=subprocess.PIPE, text=True) for _ in range(3)]
+        time.sleep(random.uniform(0.3, 0.8))
+        for proc in procs:
+            proc.send_signal(signal.SIGKILL)
+        for proc in procs:
+            acknowledged += proc.stdout.read().split()
+            proc.wait()
+    problems, _ = verify(acknowledged)
+    if len(set(acknowledged)) != len(acknowledged):
+        problems.append("the same ID was acknowledged twice")
+    return problems
+
+
+SCENARIOS = {name[len("scenario_"):]: func for name, func in globals().items() if name.startswith("scenario_")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="Run only these scenarios")
+    parser.add_argument("--kills", type=int, default=5, help="Kill rounds for kill_during_allocation")
+    args = parser.parse_args()
+
+    failed = 0
+    for name in args.scenario or SCENARIOS:
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory(prefix="cti_fault_") as workdir:
+            os.chdir(workdir)
+            start = time.perf_counter()
+            try:
+                if name == "kill_during_allocation":
+                    problems = SCENARIOS[name](args.kills)
+                else:
+                    problems = SCENARIOS[name]()
+            except Exception as e:
+                problems = [f"{type(e).__name__}: {e}"]
+            finally:
+                os.chdir(cwd)
+        elapsed = time.perf_counter() - start
+        print(f"{'FAIL' if problems else 'ok  '} {name} ({elapsed:.2f}s)")
+        for problem in problems:
+            print(f"     {problem}")
+        failed += bool(problems)
+    if failed:
+        print(f"{failed} scenario(s) failed")
+        sys.exit(1)
+    print("All scenarios passed")
+
+
+if __name__ == "__main__":
+    main()
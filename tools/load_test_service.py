@@ -0,0 +1,170 @@
+"""
+Load test for the naming service (NamingService.py).
+
+Starts the service on a free localhost port (or a Unix-domain socket with
+--unix) against fresh configuration files in a temporary directory, then runs
+several client threads that each allocate IDs over a keep-alive connection.
+Reports throughput and latency percentiles, how many journal commits the
+group committer needed, and checks that no ID was handed out twice and that
+the persisted history matches what the clients received.  With --url or
+--socket an already running service is targeted instead (the persisted
+state is not checked then).
+
+Usage:
+    python tools/load_test_service.py [--clients N] [--per-client M] [--unix] [--backend json|sqlite]
+    python tools/load_test_service.py --url 127.0.0.1:8765 | --socket PATH
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import NamingService  # noqa: E402
+from CTIDataManager import CTINaming  # noqa: E402
+from VTName import VTNaming  # noqa: E402
+
+REPORT_DATE = "20250301"
+REQUESTS = [
+    ("/reports", {"source": "Vendor1", "report_type": "Threat", "date": REPORT_DATE, "description": "load test"}),
+    ("/collections", {"source": "TeamX", "date": REPORT_DATE, "description": "load test"}),
+    ("/graphs", {"source": "TeamX", "date": REPORT_DATE}),
+]
+
+
+def client(connect, count, results, errors):
+    """Allocates count IDs of each kind over one connection, recording latencies."""
+    conn = connect()
+    ids, latencies = [], []
+    try:
+        for _ in range(count):
+            for path, body in REQUESTS:
+                start = time.perf_counter()
+                conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                payload = json.loads(response.read())
+                latencies.append(time.perf_counter() - start)
+                if response.status != 200:
+                    errors.append(f"{path}: {response.status} {payload.get('error')}")
+                ids.append(payload.get("id"))
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        errors.append(f"client failed: {e}")
+    finally:
+        conn.close()
+    results.append((ids, latencies))
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--per-client", type=int, default=100)
+    parser.add_argument("--unix", action="store_true", help="Serve on a Unix-domain socket instead of TCP")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--url", help="host:port of a running service to test")
+    parser.add_argument("--socket", help="Unix-domain socket of a running service to test")
+    args = parser.parse_args()
+
+    service = server = workdir = None
+    socket_path = args.socket
+    host, port = "127.0.0.1", 0
+    if args.url:
+        host, _, port = args.url.rpartition(":")
+        port = int(port)
+    elif not socket_path:
+        workdir = tempfile.mkdtemp(prefix="cti_service_")
+        os.chdir(workdir)
+        if args.backend == "sqlite":
+            configs = ("cti_naming.db", "vt_naming.db")
+        else:
+            configs = ("cti_naming_config.json", "vt_naming_config.json")
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            service = NamingService.NamingService(CTINaming(configs[0]), VTNaming(configs[1]))
+        if args.unix:
+            socket_path = os.path.join(workdir, "naming.sock")
+        started = threading.Event()
+
+        def ready(srv):
+            nonlocal server
+            server = srv
+            started.set()
+
+        threading.Thread(target=NamingService.serve, args=(service, host, 0, socket_path),
+                         kwargs={"ready": ready}, daemon=True).start()
+        started.wait()
+        if not socket_path:
+            port = server.server_address[1]
+
+    if socket_path:
+        def connect():
+            return NamingService.UnixHTTPConnection(socket_path)
+    else:
+        def connect():
+            return http.client.HTTPConnection(host, port, timeout=60)
+
+    results, errors = [], []
+    threads = [threading.Thread(target=client, args=(connect, args.per_client, results, errors))
+               for _ in range(args.clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    all_ids = [i for ids, _ in results for i in ids]
+    latencies = sorted(latency for _, lat in results for latency in lat)
+    failures = list(dict.fromkeys(errors))[:10]
+    if None in all_ids:
+        failures.append(f"{all_ids.count(None)} allocations failed")
+    issued = [i for i in all_ids if i is not None]
+    if len(set(issued)) != len(issued):
+        failures.append(f"{len(issued) - len(set(issued))} duplicate IDs issued")
+
+    print(f"{len(all_ids)} allocations from {args.clients} clients in {elapsed:.2f}s "
+          f"({len(all_ids) / elapsed:.0f} allocations/s)")
+    if latencies:
+        print("latency ms: p50 %.2f  p95 %.2f  p99 %.2f  max %.2f" % tuple(
+            1000 * value for value in (percentile(latencies, 0.5), percentile(latencies, 0.95),
+                                       percentile(latencies, 0.99), latencies[-1])))
+
+    if service:
+        server.shutdown()
+        commits = sum(committer.batches for committer in service.committers.values())
+        print(f"{commits} group commits ({len(all_ids) / max(commits, 1):.1f} allocations per commit), "
+              f"state in {workdir}")
+        service.close()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            cti = CTINaming(configs[0])
+            vt = VTNaming(configs[1])
+        expected = args.clients * args.per_client
+        checks = [
+            ("report_counts", cti.report_counts.get(f"Vendor1|Threat|{REPORT_DATE}"), expected),
+            ("generated_report_ids", len(set(cti.generated_report_ids)), expected),
+            ("collection_counts", vt.collection_counts.get(f"TeamX|{REPORT_DATE}"), expected),
+            ("generated_collection_ids", len(set(vt.generated_collection_ids)), expected),
+            ("graph_counts", vt.graph_counts.get(f"TeamX|{REPORT_DATE}"), expected),
+            ("generated_graph_ids", len(set(vt.generated_graph_ids)), expected),
+        ]
+        for name, got, want in checks:
+            if got != want:
+                failures.append(f"{name}: expected {want}, found {got}")
+
+    if failures:
+        for failure in failures:
+            print("FAIL:", failure)
+        sys.exit(1)
+    print("OK: all IDs unique" + (" and persisted state is consistent" if service else ""))
+
+
+if __name__ == "__main__":
+    main()
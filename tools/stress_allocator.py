@@ -0,0 +1,111 @@
+"""
+Multi-process stress test for shared ID allocation.
+
+Starts several worker processes that all allocate report IDs (and VT
+collection/graph IDs) against the same configuration files, then checks that
+no ID was handed out twice and that the stored counters and history agree
+with what the workers received.  A small compaction threshold is used so
+journal rotation is exercised while the workers are running.  With
+--backend sqlite the same check runs against SQLite databases instead.
+
+Usage:
+    python tools/stress_allocator.py [--workers N] [--per-worker M] [--backend json|sqlite]
+"""
+import argparse
+import contextlib
+import datetime
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from CTIDataManager import CTINaming  # noqa: E402
+from VTName import VTNaming  # noqa: E402
+
+REPORT_DATE = datetime.date(2025, 3, 1)
+
+
+def worker(workdir, configs, count, compact_threshold, results):
+    """Allocates count IDs of each kind and sends them back to the parent."""
+    os.chdir(workdir)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        cti = CTINaming(configs[0])
+        vt = VTNaming(configs[1])
+        cti.store.compact_threshold = compact_threshold
+        vt.store.compact_threshold = compact_threshold
+        ids = []
+        for i in range(count):
+            ids.append(cti.generate_report_id("Vendor1", "Threat", REPORT_DATE, f"pid {os.getpid()} #{i}"))
+            ids.append(vt.generate_collection_id("TeamX", REPORT_DATE))
+            ids.append(vt.generate_graph_id("TeamX", REPORT_DATE))
+        cti.store.close()
+        vt.store.close()
+    results.put(ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--per-worker", type=int, default=200)
+    parser.add_argument("--compact-threshold", type=int, default=150)
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    args = parser.parse_args()
+    if args.backend == "sqlite":
+        configs = ("cti_naming.db", "vt_naming.db")
+    else:
+        configs = ("cti_naming_config.json", "vt_naming_config.json")
+
+    workdir = tempfile.mkdtemp(prefix="cti_stress_")
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=worker, args=(workdir, configs, args.per_worker, args.compact_threshold, results))
+        for _ in range(args.workers)
+    ]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    issued = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    all_ids = [i for ids in issued for i in ids]
+    expected = args.workers * args.per_worker
+    failures = []
+    if None in all_ids:
+        failures.append("some allocations failed")
+    if len(set(all_ids)) != len(all_ids):
+        failures.append(f"{len(all_ids) - len(set(all_ids))} duplicate IDs issued")
+
+    os.chdir(workdir)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        cti = CTINaming(configs[0])
+        vt = VTNaming(configs[1])
+    date_str = REPORT_DATE.strftime("%Y%m%d")
+    checks = [
+        ("report_counts", cti.report_counts.get(f"Vendor1|Threat|{date_str}"), expected),
+        ("generated_report_ids", len(set(cti.generated_report_ids)), expected),
+        ("report_descriptions", len(cti.report_descriptions), expected),
+        ("collection_counts", vt.collection_counts.get(f"TeamX|{date_str}"), expected),
+        ("generated_collection_ids", len(set(vt.generated_collection_ids)), expected),
+        ("graph_counts", vt.graph_counts.get(f"TeamX|{date_str}"), expected),
+        ("generated_graph_ids", len(set(vt.generated_graph_ids)), expected),
+    ]
+    for name, got, want in checks:
+        if got != want:
+            failures.append(f"{name}: expected {want}, found {got}")
+
+    print(f"{len(all_ids)} IDs from {args.workers} processes in {elapsed:.2f}s "
+          f"({len(all_ids) / elapsed:.0f} allocations/s), state in {workdir}")
+    if failures:
+        for failure in failures:
+            print("FAIL:", failure)
+        sys.exit(1)
+    print("OK: all IDs unique and persisted state is consistent")
+
+
+if __name__ == "__main__":
+    main()